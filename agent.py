@@ -1,25 +1,345 @@
 # agent.py
 import uuid
 import hashlib
+import queue
 import time
-from typing import Dict, Callable, Optional
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from typing import Dict, Callable, Optional, Iterable, Tuple, List, Union
 from brain import GroqBrain
-from tools import ToolRegistry
-from database import Database
+from tools import ToolRegistry, state_payload, state_key_for, is_image_content
+from database import BatchWriter
+from async_runner import run_sync, submit
+from prompts import usage_log
+from neardup import simhash, confirm_match
+from uploads import SpooledUpload, legacy_hash
+from scheduler import request_priority, API_ERRORS
+from tracing import tracer, start_metrics_server
+from checkpoints import get_checkpointer
+from artifacts import get_artifact_store, action_for
+from config import (
+    AGENT_PACING, FUSED_EXTRACTION, INGEST_CLAIMS_ENABLED, INGEST_CLAIM_STALE_S, INGEST_CLAIM_WAIT_S,
+    INGEST_CLAIM_POLL_S, WORKER_ID, NEAR_DUP_ACTION, LEGACY_HASH_LOOKUP,
+)
+
+# "batch": callbacks run inline, no delays (headless / bulk jobs)
+# "ui":    the loop runs on the shared event loop and streams step events back
+#          to the caller's thread, so a slow renderer never blocks it
+PACING_MODES = ("batch", "ui")
+
+# Set by aingest_many(batch_size=...): save_data queues into it instead of writing
+_batch_writer = contextvars.ContextVar("batch_writer", default=None)
+
+# file_hash -> Future of the run currently processing it (shared by every agent
+# in the process; concurrent Futures so callers on any thread/loop can wait)
+_inflight = {}
+_inflight_lock = threading.Lock()
 
 class AutonomousAgent:
-    def __init__(self):
-        self.brain = GroqBrain()
-        self.tools = ToolRegistry()
-        self.db = Database()
+    def __init__(self, pacing: Optional[str] = None, fused: Optional[bool] = None, client=None, db=None,
+                 claims: Optional[bool] = None):
+        """
+        client (an AsyncGroq or anything with the same chat/audio methods) and db
+        (a Database or stand-in) default to the real ones; benchmark.py injects fakes.
+        claims turns cross-process ingest claims on/off (default INGEST_CLAIMS_ENABLED).
+        """
+        self.brain = GroqBrain(client)
+        self.tools = ToolRegistry(client, db)
+        self.db = self.tools.db
+        # Per-step state snapshots keyed by file_hash (None when CHECKPOINT_STORE=off)
+        self.checkpoints = get_checkpointer(self.db)
+        # Stored transcripts / OCR / PDF text per file_hash (None when ARTIFACTS_ENABLED=false)
+        self.artifacts = get_artifact_store(self.db)
+        self.pacing = pacing or AGENT_PACING
+        self.claims = INGEST_CLAIMS_ENABLED if claims is None else claims
+        # Claim heartbeats of batched saves, kept running until their flush (file_hash -> task)
+        self._keepalives: Dict[str, asyncio.Task] = {}
+        # One-shot classify+extract before the step loop (falls back on invalid output)
+        self.fused = FUSED_EXTRACTION if fused is None else fused
+        if self.pacing not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode '{self.pacing}', expected one of {PACING_MODES}")
+        # Prometheus text endpoint, if METRICS_PORT is set (once per process)
+        start_metrics_server()
 
-    def ingest(self, filename: str, content: str, status_callback: Optional[Callable] = None):
-        file_hash = hashlib.sha256(content.encode()).hexdigest()
-        
+    # --- STARTUP ---
+    def warm_up(self):
+        return run_sync(self.awarm_up())
+
+    async def awarm_up(self):
+        """
+        Pays the first-ingest costs at startup (app.py, worker.py): loads the
+        duplicate and near-duplicate indexes and opens the Groq HTTPS connections.
+        The connection pool is already warm (database.get_engine).
+        """
+        start = time.perf_counter()
+        for index in (self.db.dup_index, self.db.near_index):
+            if index is not None and not index.warmed:
+                await asyncio.to_thread(index.warm, self.db)
+        for client in {id(c): c for c in (self.brain.client, self.tools.client)}.values():
+            models = getattr(client, "models", None)  # stand-ins (benchmark.FakeGroq) have none
+            if models is None: continue
+            try:
+                await models.list()
+            except Exception as e:
+                print(f"⚠️ Groq connection not warmed: {e}")
+        print(f"   [DB] 🔥 Agent warmed up in {time.perf_counter() - start:.2f}s")
+
+    # --- SYNC API (thin wrappers over the async pipeline) ---
+    def ingest(self, filename: str, content: Union[str, SpooledUpload], status_callback: Optional[Callable] = None):
+        if self.pacing == "ui" and status_callback:
+            return self._ingest_streamed(filename, content, status_callback)
+        return run_sync(self.aingest(filename, content, status_callback))
+
+    def ingest_many(self, files: Iterable[Tuple[str, str]], max_concurrency: int = 8,
+                    status_callback: Optional[Callable] = None, batch_size: Optional[int] = None,
+                    use_copy: bool = False, priority: str = "bulk") -> Dict:
+        return run_sync(self.aingest_many(files, max_concurrency, status_callback, batch_size, use_copy, priority))
+
+    def _ingest_streamed(self, filename: str, content: str, status_callback: Callable):
+        """
+        Runs the loop on the shared event loop. Step events are queued by the loop and
+        delivered to status_callback here, on the caller's thread (Streamlit only
+        allows rendering from the script thread).
+        """
+        events = queue.Queue()
+        future = submit(self.aingest(filename, content, events.put))
+        while not future.done() or not events.empty():
+            try:
+                status_callback(events.get(timeout=0.05))
+            except queue.Empty:
+                pass
+        return future.result()
+
+    # --- ASYNC API ---
+    async def aingest_many(self, files: Iterable[Tuple[str, str]], max_concurrency: int = 8,
+                           status_callback: Optional[Callable] = None, batch_size: Optional[int] = None,
+                           use_copy: bool = False, priority: str = "bulk") -> Dict:
+        """
+        Runs many (filename, content) documents through the loop concurrently
+        (content may be a SpooledUpload, see aingest).
+        status_callback, if given, is called as status_callback(filename, msg) on the
+        event loop, so it should be cheap.
+        With batch_size, saves are buffered and written batch_size documents per
+        transaction (multi-row INSERT, or COPY for child tables with use_copy=True).
+        Groq calls are queued at `priority` ("bulk" by default, behind interactive
+        requests; see scheduler.py).
+        Returns an aggregate report with per-document results and throughput numbers.
+        """
+        files = list(files)
+        limit = asyncio.Semaphore(max(1, max_concurrency))
+        writer = BatchWriter(self.db, batch_size, use_copy) if batch_size else None
+        token = _batch_writer.set(writer)
+        priority_token = request_priority.set(priority)
+
+        async def run_one(item):
+            filename, content = item
+            cb = (lambda msg: status_callback(filename, msg)) if status_callback else None
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    res = await self.aingest(filename, content, cb)
+                    status, error = res.get("status", "incomplete"), res.get("error")
+                    if res.get("coalesced"): status = "coalesced"
+                except Exception as e:
+                    res, status, error = None, "failed", str(e)
+                    if cb: cb(f"\n❌ **Failed:** {e}")
+                return {
+                    "filename": filename,
+                    "status": status,
+                    "latency_s": time.perf_counter() - start,
+                    "error": error,
+                    "state": res,
+                }
+
+        start = time.perf_counter()
+        try:
+            results = list(await asyncio.gather(*(run_one(f) for f in files)))
+        finally:
+            _batch_writer.reset(token)
+            request_priority.reset(priority_token)
+
+        queued = [r for r in results if r["status"] == "queued"]
+        try:
+            if writer:
+                with tracer.span("db", "batch_flush"):
+                    await asyncio.to_thread(writer.flush)
+                for r in queued:
+                    outcome = writer.outcomes.get(r["state"]["id"], "failed: not flushed")
+                    if outcome == "duplicate": r["status"] = "skipped"
+                    elif outcome.startswith("failed"): r["status"], r["error"] = "failed", outcome
+                    else: r["status"] = outcome
+                    r["state"]["status"] = r["status"]
+                    if r["status"] != "failed":
+                        await self._adrop_checkpoint(r["state"]["file_hash"])
+        finally:
+            # Even if the flush raised: queued saves held their claims until now
+            for r in queued:
+                await self._arelease_claim(r["state"]["file_hash"])
+
+        report = build_report(results, time.perf_counter() - start)
+        if writer: report["batch_writer"] = dict(writer.stats)
+        return report
+
+    async def aingest(self, filename: str, content: Union[str, SpooledUpload], status_callback: Optional[Callable] = None):
+        """
+        content is the document text, or a SpooledUpload (hashed over its raw bytes
+        while spooling; text is only read once the duplicate checks pass).
+        """
+        if isinstance(content, SpooledUpload):
+            file_hash = content.sha256
+        else:
+            file_hash = hashlib.sha256(content.encode()).hexdigest()
+
+        # Single-flight: a second ingest of the same bytes waits for the first one
+        with _inflight_lock:
+            running = _inflight.get(file_hash)
+            if running is None:
+                leader = _inflight[file_hash] = Future()
+        if running is not None:
+            if status_callback: status_callback(f"⏳ **Already in progress:** `{filename}`, waiting for that run...")
+            result = await asyncio.wrap_future(running)
+            return {**result, "coalesced": True}
+
+        try:
+            result = await self._aingest_leader(filename, content, file_hash, status_callback)
+            leader.set_result(result)
+            return result
+        except BaseException as e:
+            leader.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(file_hash, None)
+
+    async def _aingest_leader(self, filename: str, content, file_hash: str, status_callback):
+        """
+        Runs one document inside a trace: every step below opens a span
+        (tracing.py), and the finished list is returned in the state as `spans`
+        and appended to TRACE_JSONL_PATH.
+        """
+        trace_token = tracer.start_document()
+        result = None
+        try:
+            with tracer.span("document", "ingest", filename=filename) as doc_span:
+                result = await self._aingest_steps(filename, content, file_hash, status_callback)
+                doc_span["doc_type"] = result.get('type')
+            return result
+        finally:
+            status = "failed" if result is None else result.get('status', "incomplete")
+            spans = tracer.finish_document(trace_token, status)
+            if result is not None and 'history' in result: result['spans'] = spans
+            if tracer.jsonl_path:
+                await asyncio.to_thread(tracer.export_jsonl, spans, doc_id=(result or {}).get('id'),
+                                        filename=filename, file_hash=file_hash, status=status)
+
+    async def _aingest_steps(self, filename: str, content, file_hash: str, status_callback):
         # Check Duplicate
-        if self.db.check_duplicate(file_hash):
+        with tracer.span("db", "check_duplicate"):
+            duplicate = await asyncio.to_thread(self.db.check_duplicate, file_hash)
+        if not duplicate and LEGACY_HASH_LOOKUP and isinstance(content, SpooledUpload):
+            # Saved before uploads were spooled: keyed by the PDF text / tagged base64 hash
+            with tracer.span("db", "check_legacy_duplicate"):
+                for legacy in await asyncio.to_thread(content.legacy_hashes):
+                    duplicate = await asyncio.to_thread(self.db.check_duplicate, legacy)
+                    if duplicate: break
+        if duplicate:
             if status_callback: status_callback(f"🛑 **Duplicate:** `{filename}` already processed.")
             return {"status": "skipped", "reason": "duplicate"}
+
+        # Cross-process single-flight: claim the hash in Postgres (before any
+        # transcription/LLM work, so two workers never pay for the same file)
+        if self.claims:
+            with tracer.span("db", "claim_ingest"):
+                claimed = await self._await_claim(file_hash)
+        if self.claims and not claimed:
+            if status_callback: status_callback(f"🛑 **Duplicate:** `{filename}` was processed by another worker.")
+            return {"status": "skipped", "reason": "processed_elsewhere"}
+
+        result = None
+        usage_token = usage_log.start_document()
+        # Keeps claimed_at fresh while we work, so only a dead worker's claim goes stale
+        keepalive = asyncio.create_task(self._aclaim_heartbeat(file_hash)) if self.claims else None
+        try:
+            result = await self._aprocess(filename, content, file_hash, status_callback)
+            return result
+        finally:
+            usage = usage_log.finish_document(usage_token, (result or {}).get('type'))
+            if result is not None and 'history' in result: result['usage'] = usage
+            # Batched saves keep the claim (and its heartbeat) until their flush lands (see aingest_many)
+            if keepalive and (result or {}).get("status") == "queued":
+                self._keepalives[file_hash] = keepalive
+            elif self.claims:
+                if keepalive: keepalive.cancel()
+                with tracer.span("db", "release_ingest"):
+                    await asyncio.to_thread(self.db.release_ingest, file_hash, WORKER_ID)
+
+    async def _aprocess(self, filename: str, content, file_hash: str, status_callback) -> Dict:
+        # A previous run got this far (crash, failed save): carry on from its last step
+        state = await self._aresume(content, file_hash)
+        if state is not None:
+            if status_callback: status_callback(f"♻️ **Resuming** `{filename}` after step {len(state['history'])}...")
+            return await self._arun_loop(state, status_callback)
+
+        upload, audio_summary, artifact, stored = None, None, None, None
+        # Artifact kind that holds state['content']: checkpoints then store the kind, not the text
+        content_ref = None
+        is_audio = isinstance(content, SpooledUpload) and content.kind == "audio"
+        if is_audio:
+            stored = await self._aload_artifact(file_hash, "transcript")
+        if stored is not None:
+            # Transcribed before (deleted and re-uploaded): the loop summarizes the stored transcript
+            content, content_ref = stored, "transcript"
+        elif is_audio:
+            # Summaries of finished segments start while the rest is still transcribing
+            if status_callback: status_callback(f"🎧 **Transcribing** `{filename}`...")
+
+            async def keep_transcript(transcript: str):
+                # Whisper is the expensive part: store it before awaiting the summaries,
+                # so a failed summary call doesn't cost a second transcription
+                nonlocal content_ref
+                text = f"[METADATA: AUDIO_NOTE]\n{transcript}"
+                checkpoint = {
+                    "id": str(uuid.uuid4()), "filename": filename, "content": text, "file_hash": file_hash,
+                    "simhash": await asyncio.to_thread(simhash, text), "type": "AUDIO_NOTE", "history": [],
+                }
+                if await self._asave_artifact(file_hash, "transcript", text):
+                    content_ref = checkpoint['content_artifact'] = "transcript"
+                await self._acheckpoint(checkpoint)
+
+            with tracer.span("tool", "transcribe_and_summarize"):
+                transcript, audio_summary = await self.tools.atranscribe_and_summarize(content, keep_transcript)
+            content = f"[METADATA: AUDIO_NOTE]\n{transcript}"
+            # Recordings saved before uploads were spooled are keyed by this content's hash
+            if LEGACY_HASH_LOOKUP and await asyncio.to_thread(self.db.check_duplicate, legacy_hash(content)):
+                await self._adrop_checkpoint(file_hash)
+                if status_callback: status_callback(f"🛑 **Duplicate:** `{filename}` already processed.")
+                return {"status": "skipped", "reason": "duplicate"}
+        elif isinstance(content, SpooledUpload):
+            with tracer.span("tool", "read_upload", upload_kind=content.kind, bytes=content.size):
+                upload, content = content, await asyncio.to_thread(content.prompt_text)
+            artifact = {"pdf": "pdf_text", "text": "text"}.get(upload.kind)
+        elif not is_image_content(content):
+            artifact = "text"
+
+        # Near duplicate (re-export, rescan, one word changed)
+        with tracer.span("tool", "simhash"):
+            fingerprint = await asyncio.to_thread(simhash, content)
+        with tracer.span("db", "find_near_duplicate"):
+            near = await asyncio.to_thread(self.db.find_near_duplicate, fingerprint)
+        prior = None
+        if near:
+            # A close fingerprint alone isn't enough: the match's parties/dates/amounts must be in this text
+            with tracer.span("tool", "confirm_near_duplicate") as span:
+                prior = await self.tools.areuse_extraction(near[0], content)
+                span["confirmed"] = prior is not None and await asyncio.to_thread(confirm_match, *prior, content)
+            if not span["confirmed"]:
+                print(f"   [DB] 🧬 {filename} is {near[1]} bits from {near[0]} but its key fields differ; processing it")
+                near, prior = None, None
+        if near and NEAR_DUP_ACTION == "skip":
+            if status_callback: status_callback(f"🛑 **Near duplicate:** `{filename}` matches document `{near[0]}` ({near[1]} bits apart).")
+            return {"status": "skipped", "reason": "near_duplicate", "near_duplicate_of": near[0], "distance": near[1]}
         
         if status_callback: status_callback(f"🚀 **New File.** Processing `{filename}`...")
         
@@ -28,103 +348,315 @@ class AutonomousAgent:
             "filename": filename,
             "content": content,
             "file_hash": file_hash,
+            "simhash": fingerprint,
             "history": []
         }
-        
-        return self._run_loop(state, status_callback)
+        # Images stay in the spool until the vision call needs them
+        if upload is not None and upload.kind == "image": state['upload'] = upload
+        if is_audio: state['type'] = "AUDIO_NOTE"
+        if audio_summary is not None: state['audio_summary'] = audio_summary
+
+        if near and NEAR_DUP_ACTION == "reuse":
+            self._reuse_step(state, near, prior, status_callback)
+
+        if artifact and await self._asave_artifact(file_hash, artifact, content): content_ref = artifact
+        if content_ref: state['content_artifact'] = content_ref
+        # The transcript / extracted text survives a crash from here on
+        await self._acheckpoint(state)
+        return await self._arun_loop(state, status_callback)
+
+    async def aextract(self, doc_type: str, content: str) -> Dict:
+        """Runs only doc_type's extractor over content (no classification, no save); used by artifacts.backfill."""
+        action = action_for(doc_type)
+        if action is None: raise ValueError(f"No extractor for document type '{doc_type}'")
+        state = {"type": doc_type, "content": content}
+        with tracer.span("tool", action):
+            await self._aexecute(action, state)
+        return state_payload(state)
+
+    async def _aload_artifact(self, file_hash: str, kind: str) -> Optional[str]:
+        if self.artifacts is None: return None
+        try:
+            with tracer.span("db", "load_artifact", artifact=kind):
+                return await asyncio.to_thread(self.artifacts.get, file_hash, kind)
+        except Exception as e:
+            print(f"⚠️ Artifact {kind} for {file_hash[:12]} not loaded: {e}")
+            return None
+
+    async def _asave_artifact(self, file_hash: str, kind: str, text: str) -> bool:
+        """
+        Stores the extractors' input; like checkpoints, a failed write doesn't fail
+        the document. Returns whether it was stored.
+        """
+        if self.artifacts is None or not text: return False
+        try:
+            with tracer.span("db", "save_artifact", artifact=kind) as span:
+                span["bytes"] = await asyncio.to_thread(self.artifacts.put, file_hash, kind, text)
+            return True
+        except Exception as e:
+            print(f"⚠️ Artifact {kind} for {file_hash[:12]} not saved: {e}")
+            return False
+
+    async def _aresume(self, content, file_hash: str) -> Optional[Dict]:
+        if self.checkpoints is None: return None
+        try:
+            with tracer.span("db", "load_checkpoint"):
+                state = await asyncio.to_thread(self.checkpoints.load, file_hash)
+        except Exception as e:
+            print(f"⚠️ Checkpoint for {file_hash[:12]} not loaded: {e}")
+            return None
+        if state is None: return None
+        if 'content' not in state:
+            # Checkpointed by reference: the text is the stored artifact
+            state['content'] = await self._aload_artifact(file_hash, state['content_artifact'])
+            if state['content'] is None: return None
+        if state.pop('_upload', False):
+            # The image hadn't been read yet: use this run's copy of it
+            if not isinstance(content, SpooledUpload): return None
+            state['upload'] = content
+        print(f"   [CKPT] ♻️ Resuming {file_hash[:12]} after {len(state['history'])} step(s)")
+        return state
+
+    async def _acheckpoint(self, state: Dict):
+        """Snapshots the state; a failed write only costs the resume, not the document."""
+        if self.checkpoints is None: return
+        try:
+            with tracer.span("db", "checkpoint", step=len(state['history'])) as span:
+                span["bytes"] = await asyncio.to_thread(self.checkpoints.save, state)
+        except Exception as e:
+            print(f"⚠️ Checkpoint for {state['file_hash'][:12]} not saved: {e}")
+
+    async def _adrop_checkpoint(self, file_hash: str):
+        if self.checkpoints is None: return
+        try:
+            with tracer.span("db", "delete_checkpoint"):
+                await asyncio.to_thread(self.checkpoints.delete, file_hash)
+        except Exception as e:
+            print(f"⚠️ Checkpoint for {file_hash[:12]} not deleted: {e}")
+
+    async def _await_claim(self, file_hash: str) -> bool:
+        """
+        Returns True once this worker owns the claim, False if another worker
+        finished the file meanwhile. Stale claims (crashed workers) are taken over.
+        """
+        deadline = time.monotonic() + INGEST_CLAIM_WAIT_S
+        while True:
+            if await asyncio.to_thread(self.db.claim_ingest, file_hash, WORKER_ID, INGEST_CLAIM_STALE_S):
+                return True
+            await asyncio.sleep(INGEST_CLAIM_POLL_S)
+            if await asyncio.to_thread(self.db.check_duplicate, file_hash):
+                return False
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"File {file_hash[:12]} is still claimed by another worker")
+
+    async def _arelease_claim(self, file_hash: str):
+        """Stops a batched save's claim heartbeat and releases its claim."""
+        keepalive = self._keepalives.pop(file_hash, None)
+        if keepalive: keepalive.cancel()
+        if not self.claims: return
+        try:
+            with tracer.span("db", "release_ingest"):
+                await asyncio.to_thread(self.db.release_ingest, file_hash, WORKER_ID)
+        except Exception as e:
+            print(f"⚠️ Claim on {file_hash[:12]} not released (taken over once stale): {e}")
 
-    def _run_loop(self, state: Dict, callback):
+    async def _aclaim_heartbeat(self, file_hash: str):
+        """Re-claims file_hash (refreshing claimed_at) every third of INGEST_CLAIM_STALE_S."""
+        while True:
+            await asyncio.sleep(max(1.0, INGEST_CLAIM_STALE_S / 3))
+            try:
+                await asyncio.to_thread(self.db.claim_ingest, file_hash, WORKER_ID, INGEST_CLAIM_STALE_S)
+            except Exception as e:
+                print(f"⚠️ Claim heartbeat failed: {e}")
+
+    async def _arun_loop(self, state: Dict, callback):
         steps = 0
         max_steps = 8
+
+        # Images go to OCR first; analyze_image runs the fused step on the extracted text
+        if self.fused and 'type' not in state and not is_image_content(state['content']):
+            await self._afused_step(state, callback)
+            await self._acheckpoint(state)
         
         while steps < max_steps:
             steps += 1
             
             # 1. Brain Decides
-            decision = self.brain.decide(state, [])
-            action = decision.get('action')
-            reasoning = decision.get('reasoning')
+            with tracer.span("brain", "decide", step=steps) as span:
+                decision = await self.brain.adecide(state, [])
+                action = decision.get('action')
+                reasoning = decision.get('reasoning')
+                decided_by = decision.get('decided_by', 'llm')
+                span.update(action=action, decided_by=decided_by)
             
             step_msg = f"""
 ---
 ### 🧠 Step {steps}
-**Thinking:** {reasoning}
+**Thinking ({decided_by}):** {reasoning}
 
 **⚡ Action:** `{action}`
             """
             if callback: callback(step_msg)
-            time.sleep(2.0)
 
             if action == "STOP": 
                 break
 
             # 2. Execute Action
-            res = self._execute(action, state)
+            with tracer.span("tool", str(action), step=steps):
+                res = await self._aexecute(action, state)
             
             # 3. Update History
-            state['history'].append({"action": action})
+            state['history'].append({"action": action, "decided_by": decided_by})
             
             # Special UI updates
             if action == "classify_document":
                 state['type'] = res
                 if callback: callback(f"\n📂 **Classified as:** `{res}`")
-                time.sleep(1.0)
             
             # Show image extraction result
             if action == "analyze_image":
                 if callback: callback(f"\n👁️ **Vision:** Extracted text from image.")
 
+            if action != "save_data":
+                await self._acheckpoint(state)
+
             # Hard Stop logic for Save
             if action == "save_data":
                 if "Error" in str(res) or "Failed" in str(res):
+                     state['status'], state['error'] = "failed", str(res)
                      if callback: callback(f"\n❌ **Save Failed:** {res}")
+                elif str(res).startswith("Skipped"):
+                     state['status'] = "skipped"
+                     if callback: callback(f"\n🛑 **{res}**")
+                elif str(res).startswith("Queued"):
+                     state['status'] = "queued"
+                     if callback: callback(f"\n📥 **{res}**")
                 else:
+                     state['status'] = "saved"
                      if callback: callback(f"\n✅ **Data Saved Successfully.**")
+                # A failed save resumes from the last checkpoint; batched saves drop theirs after the flush
+                if state['status'] in ("saved", "skipped"):
+                    await self._adrop_checkpoint(state['file_hash'])
                 break 
             
         return state
 
-    def _execute(self, action, state):
+    def _reuse_step(self, state: Dict, near, prior, callback) -> bool:
+        """Copies the near-duplicate's (confirmed) extraction into the state; the planner then goes straight to save_data."""
+        state['history'].append({"action": "reuse_extraction", "decided_by": "near_dup", "valid": prior is not None})
+        if prior is None: return False
+
+        doc_type, data = prior
+        state['type'] = doc_type
+        state[state_key_for(doc_type)] = data
+        state['near_duplicate_of'] = near[0]
+        if callback: callback(f"\n♻️ **Near duplicate of** `{near[0]}` ({near[1]} bits apart), reusing its extraction.")
+        return True
+
+    async def _afused_step(self, state: Dict, callback) -> bool:
+        """Classify + extract in one call. On success the planner goes straight to save_data."""
+        with tracer.span("tool", "classify_and_extract") as span:
+            fused = await self.tools.aclassify_and_extract(state['content'])
+            span["valid"] = fused is not None
+        state['history'].append({"action": "classify_and_extract", "decided_by": "fused", "valid": fused is not None})
+        if fused is None:
+            if callback: callback("\n↩️ **Fused extraction invalid,** continuing step by step.")
+            return False
+
+        doc_type, data = fused
+        state['type'] = doc_type
+        state[state_key_for(doc_type)] = data
+        if callback: callback(f"\n⚡ **Classified & extracted in one call:** `{doc_type}`")
+        return True
+
+    async def _aexecute(self, action, state):
         t = self.tools
         
         # --- NEW: IMAGE EXECUTION (UPDATED) ---
         if action == "analyze_image":
             try:
-                # 1. Extract Base64 from tags
-                raw = state['content']
-                start = "[METADATA: IMAGE_Base64_START]"
-                end = "[METADATA: IMAGE_Base64_END]"
-                b64_str = raw.split(start)[1].split(end)[0]
-                
-                # 2. Run Vision Tool (Extract Text)
-                extracted_text = t.analyze_image(b64_str)
+                # 0. This image was read before (stored OCR text): no vision call
+                extracted_text = await self._aload_artifact(state['file_hash'], "ocr")
+                stored = extracted_text is not None
+                if extracted_text is None:
+                    # 1. Bytes from the spooled upload, or base64 from the inline tags
+                    if state.get('upload') is not None:
+                        image = await asyncio.to_thread(state['upload'].read_bytes)
+                    else:
+                        raw = state['content']
+                        start = "[METADATA: IMAGE_Base64_START]"
+                        end = "[METADATA: IMAGE_Base64_END]"
+                        image = raw.partition(start)[2].partition(end)[0]
+
+                    # 2. Run Vision Tool (preprocess, then extract text)
+                    extracted_text = await t.aanalyze_image(image)
+                    del image
+                    if not extracted_text.startswith("Vision Error"):
+                        stored = await self._asave_artifact(state['file_hash'], "ocr", extracted_text)
                 
-                # 3. Update State Content
+                # 3. Update State Content (the image itself is no longer needed)
                 state['content'] = extracted_text
+                state.pop('upload', None)
+                if stored: state['content_artifact'] = "ocr"
                 
                 # --- THE FIX: IMMEDIATE RE-CLASSIFICATION ---
                 # Don't ask the Brain to classify again (it might refuse).
                 # We force the classification tool right now.
-                new_type = t.classify_document(extracted_text)
+                if self.fused and await self._afused_step(state, None):
+                    new_type = state['type']
+                else:
+                    new_type = await t.aclassify_document(extracted_text)
                 state['type'] = new_type
                 # --------------------------------------------
                 
                 return f"👁️ Image Text Extracted & Re-classified as {new_type}"
                 
+            except API_ERRORS: raise
             except Exception as e: return f"Image Error: {e}"
         # ----------------------------
-        elif action == "classify_document": return t.classify_document(state['content'])
-        elif action == "extract_invoice": state['extracted_data'] = t.extract_invoice(state['content'])
-        elif action == "score_resume": state['score'] = t.score_resume(state['content'])
+        elif action == "classify_document": return await t.aclassify_document(state['content'])
+        elif action == "extract_invoice": state['extracted_data'] = await t.aextract_invoice(state['content'])
+        elif action == "score_resume": state['score'] = await t.ascore_resume(state['content'])
         elif action == "summarize_audio_note":
-            state['audio_summary'] = t.summarize_audio_note(state['content'])
+            state['audio_summary'] = await t.asummarize_audio_note(state['content'])
             return "Audio Summarized"
         elif action == "extract_legal_doc":
-            state['legal_data'] = t.extract_legal_doc(state['content'])
+            state['legal_data'] = await t.aextract_legal_doc(state['content'])
             return "Legal Data Extracted"
         elif action == "summarize_research_paper": 
-            state['research_summary'] = t.summarize_research_paper(state['content'])
+            state['research_summary'] = await t.asummarize_research_paper(state['content'])
             return "Summarized"
-        elif action == "summarize_unknown": state['summary_data'] = t.summarize_unknown(state['content'])
-        elif action == "save_data": return t.save_data(state['id'], state)
-        return "Done"
\ No newline at end of file
+        elif action == "summarize_unknown": state['summary_data'] = await t.asummarize_unknown(state['content'])
+        elif action == "save_data":
+            writer = _batch_writer.get()
+            if writer is None:
+                with tracer.span("db", "save_document"):
+                    return await t.asave_data(state['id'], state)
+            with tracer.span("db", "batch_enqueue"):
+                await asyncio.to_thread(
+                    writer.add, state['id'], state['filename'], state.get('type'), state['file_hash'], state_payload(state),
+                    state.get('simhash')
+                )
+            return "Queued for batch save"
+        return "Done"
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+def build_report(results: List[Dict], elapsed_s: float) -> Dict:
+    latencies = [r["latency_s"] for r in results]
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {
+        "results": results,
+        "total": len(results),
+        "counts": counts,
+        "elapsed_s": elapsed_s,
+        "docs_per_sec": len(results) / elapsed_s if elapsed_s > 0 else 0.0,
+        "p50_latency_s": _percentile(latencies, 50),
+        "p95_latency_s": _percentile(latencies, 95),
+    }
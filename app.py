@@ -1,11 +1,8 @@
 import streamlit as st
 import pandas as pd
-import base64
-from sqlalchemy import create_engine
-from pypdf import PdfReader
-from config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
+from uploads import SpooledUpload
 from agent import AutonomousAgent
-from tools import ToolRegistry # Needed for transcription
+from database import get_engine
 
 # 1. Page Config & Layout
 st.set_page_config(layout="wide", page_title="Groq AI Agent")
@@ -21,9 +18,19 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# 2. Database Connection
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
+# 2. Database Connection (process-wide pool, shared with the agent)
+engine = get_engine()
+
+# One agent (and its ToolRegistry) per server process instead of per rerun
+@st.cache_resource
+def get_agent():
+    agent = AutonomousAgent(pacing="ui")
+    # Indexes and the Groq connection are ready before the first upload
+    agent.warm_up()
+    return agent
+
+def get_tools():
+    return get_agent().tools
 
 def get_data(table):
     try:
@@ -32,10 +39,10 @@ def get_data(table):
         return pd.DataFrame()
 
 def read_file(file):
-    if file.name.endswith(".pdf"):
-        reader = PdfReader(file)
-        return "\n".join([p.extract_text() for p in reader.pages if p.extract_text()])
-    return file.read().decode("utf-8")
+    # Spooled and hashed in chunks; the agent reads text (page-bounded for PDFs)
+    # only if the file isn't a duplicate
+    file.seek(0)
+    return SpooledUpload.from_file(file, file.name, file.type)
 
 # --- UI LAYOUT ---
 st.title("⚡ Groq Autonomous Agent")
@@ -67,22 +74,10 @@ with col1:
                 if uploaded_file.type in ["image/png", "image/jpeg", "image/jpg"]:
                     # Display the image
                     st.image(uploaded_file, caption="Uploaded Image", use_column_width=True)
-                    
-                    # Convert to base64 for the API
-                    image_bytes = uploaded_file.getvalue()
-                    base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                    
-                    # We tag it so the Brain knows it's an image
-                    content = f"[METADATA: IMAGE_Base64_START]{base64_image}[METADATA: IMAGE_Base64_END]"
-                    start_process = True
-
-                # 3. Handle PDFs/Text (Existing Logic)
-                elif uploaded_file.name.endswith(".pdf"):
-                    content = read_file(uploaded_file)
-                    start_process = True
-                else:
-                    content = uploaded_file.read().decode("utf-8")
-                    start_process = True
+
+                # 3. Images, PDFs and text all go to the agent as a spooled upload
+                content = read_file(uploaded_file)
+                start_process = True
 
     # --- OPTION B: VOICE INPUT ---
     elif input_method == "🎙️ Voice Note":
@@ -97,26 +92,16 @@ with col1:
             st.audio(final_audio)
             
             if st.button("Transcribe & Process", type="primary"):
-                with st.spinner("🎧 Transcribing via Groq Whisper..."):
-                    try:
-                        tools = ToolRegistry()
-                        if not hasattr(final_audio, 'name'):
-                            final_audio.name = "recording.wav"
-                            
-                        transcription_text = tools.transcribe_audio(final_audio)
-                        
-                        st.success("Transcription Complete!")
-                        st.text_area("📝 Transcript:", transcription_text, height=150)
-                        
-                        # Metadata Injection
-                        content = f"[METADATA: AUDIO_NOTE]\n{transcription_text}"
-                        
-                        timestamp = str(int(pd.Timestamp.now().timestamp()))
-                        file_name = f"voice_note_{timestamp}.txt"
-                        start_process = True
-                        
-                    except Exception as e:
-                        st.error(f"Transcription Failed: {e}")
+                # The agent transcribes (split and parallel for long recordings) and
+                # summarizes segments as they come back
+                final_audio.seek(0)
+                content = SpooledUpload.from_file(
+                    final_audio, getattr(final_audio, "name", None) or "recording.wav",
+                    getattr(final_audio, "type", None) or "audio/wav"
+                )
+                timestamp = str(int(pd.Timestamp.now().timestamp()))
+                file_name = f"voice_note_{timestamp}.txt"
+                start_process = True
 
     # ==========================================
     # AGENT EXECUTION LOOP
@@ -125,12 +110,19 @@ with col1:
     log_container = st.container(height=400, border=True)
 
     if start_process and content:
-        agent = AutonomousAgent()
+        agent = get_agent()
         
         def update_log(msg):
             log_container.markdown(msg)
 
-        final_state = agent.ingest(file_name, content, update_log)
+        try:
+            final_state = agent.ingest(file_name, content, update_log)
+        except Exception as e:
+            st.error(f"Processing Failed: {e}")
+            st.stop()
+
+        if final_state.get("audio_summary"):
+            st.text_area("📝 Transcript:", final_state["audio_summary"].get("transcript", ""), height=150)
 
         # --- FINAL SUMMARY ---
         if final_state.get("status") != "skipped":
@@ -209,8 +201,7 @@ with col2:
         # Logic to handle Voice vs Text
         if query_voice:
             # We need to transcribe it first
-            from tools import ToolRegistry
-            t = ToolRegistry() # Temporary instance
+            t = get_tools()
             with st.spinner("🎧 Transcribing..."):
                 final_query = t.transcribe_audio(query_voice)
                 st.write(f"**🗣️ You said:** *{final_query}*")
@@ -220,8 +211,7 @@ with col2:
         # 2. Execution Button
         if final_query:
             if st.button("🚀 Run Analysis", type="primary"):
-                from tools import ToolRegistry
-                t = ToolRegistry()
+                t = get_tools()
                 
                 with st.spinner("🧠 Thinking & Querying Database..."):
                     result = t.query_database(final_query)
@@ -0,0 +1,144 @@
+# artifacts.py
+"""
+Stored extractor inputs, and re-extraction when the prompts change.
+
+    python artifacts.py backfill --concurrency 16 --types INVOICE,LEGAL_DOC
+    python artifacts.py backfill --dry-run
+
+The expensive text behind each document (Whisper transcript, vision OCR, PDF
+text, or the plain text) is kept zlib-compressed in the `artifacts` table,
+keyed by file_hash and stamped with the PROMPT_VERSION its extraction used.
+A re-upload of the same bytes reuses a stored transcript/OCR text instead of
+calling Whisper or the vision model again. After bumping PROMPT_VERSION,
+`backfill` re-runs only the per-type extractor over the stored text of every
+document saved under another version and replaces its child row.
+"""
+import argparse
+import asyncio
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional
+from async_runner import run_sync
+from brain import DOC_TYPE_ACTIONS
+from scheduler import request_priority
+from database import table_ready
+from config import ARTIFACTS_ENABLED, PROMPT_VERSION, BACKFILL_CONCURRENCY
+
+ARTIFACT_KINDS = ("transcript", "ocr", "pdf_text", "text")
+
+def pack(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+def unpack(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+class ArtifactStore:
+    """Compressed extractor inputs in the artifacts table of `db` (a Database)."""
+    def __init__(self, db, version: str = PROMPT_VERSION):
+        self.db = db
+        self.version = version
+        self._lock = threading.Lock()
+        self.counters = {"writes": 0, "chars": 0, "bytes": 0, "hits": 0, "misses": 0}
+
+    def put(self, file_hash: str, kind: str, text: str) -> int:
+        if kind not in ARTIFACT_KINDS: raise ValueError(f"Unknown artifact kind '{kind}'")
+        blob = pack(text)
+        self.db.save_artifact(file_hash, kind, blob, len(text))
+        with self._lock:
+            self.counters["writes"] += 1
+            self.counters["chars"] += len(text)
+            self.counters["bytes"] += len(blob)
+        return len(blob)
+
+    def get(self, file_hash: str, kind: str) -> Optional[str]:
+        blob = self.db.load_artifact(file_hash, kind)
+        with self._lock: self.counters["hits" if blob is not None else "misses"] += 1
+        return unpack(blob) if blob is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        c["compression_ratio"] = c["chars"] / c["bytes"] if c["bytes"] else 0.0
+        return c
+
+def get_artifact_store(db) -> Optional[ArtifactStore]:
+    """An ArtifactStore over db, or None when ARTIFACTS_ENABLED=false (or the table is missing)."""
+    return ArtifactStore(db) if ARTIFACTS_ENABLED and table_ready(db, "artifacts", "ARTIFACTS_ENABLED") else None
+
+# --- BACKFILL ---
+def action_for(doc_type: str) -> Optional[str]:
+    """The downstream extractor action for a saved doc_type (same matching as child_table_for)."""
+    for marker, (action, _) in DOC_TYPE_ACTIONS.items():
+        if marker.split("_")[0] in (doc_type or ""): return action
+    return None
+
+async def abackfill(agent=None, concurrency: int = BACKFILL_CONCURRENCY, doc_types: Optional[Iterable[str]] = None,
+                    limit: Optional[int] = None, dry_run: bool = False) -> Dict:
+    """
+    Re-extracts every saved document whose artifact is stamped with another
+    PROMPT_VERSION, `concurrency` at a time, at bulk priority. Classification,
+    OCR and transcription are not repeated. Returns counts and per-document errors.
+    """
+    from agent import AutonomousAgent  # agent imports this module
+    agent = agent or AutonomousAgent(pacing="batch")
+    store = agent.artifacts or ArtifactStore(agent.db)
+    stale = await asyncio.to_thread(agent.db.stale_artifacts, store.version, list(doc_types or []), limit)
+    print(f"   [ARTIFACT] 🔁 {len(stale)} document(s) extracted under another prompt version than {store.version}")
+    report = {"stale": len(stale), "counts": {}, "errors": [], "elapsed_s": 0.0}
+    if dry_run or not stale: return report
+
+    limit_sem = asyncio.Semaphore(max(1, concurrency))
+    counts = report["counts"]
+
+    async def run_one(doc_id, doc_type, file_hash, kind):
+        async with limit_sem:
+            try:
+                action = action_for(doc_type)
+                text = await asyncio.to_thread(store.get, file_hash, kind)
+                if action is None or text is None:
+                    status = "unsupported" if action is None else "missing"
+                else:
+                    data = await agent.aextract(doc_type, text)
+                    replaced = await asyncio.to_thread(
+                        agent.db.replace_extraction, doc_id, doc_type, data, file_hash, kind, store.version
+                    )
+                    status = "updated" if replaced else "unsupported"
+            except Exception as e:
+                status = "failed"
+                report["errors"].append({"doc_id": doc_id, "error": f"{type(e).__name__}: {e}"})
+            counts[status] = counts.get(status, 0) + 1
+            print(f"   [ARTIFACT] {doc_id} ({doc_type}, {kind}): {status}")
+
+    start = time.perf_counter()
+    token = request_priority.set("bulk")
+    try:
+        await asyncio.gather(*(run_one(*row) for row in stale))
+    finally:
+        request_priority.reset(token)
+    report["elapsed_s"] = time.perf_counter() - start
+    return report
+
+def backfill(*args, **kwargs) -> Dict:
+    return run_sync(abackfill(*args, **kwargs))
+
+# --- CLI ---
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Artifact store maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("backfill", help=f"re-extract documents saved before PROMPT_VERSION={PROMPT_VERSION}")
+    p.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="documents re-extracted at once")
+    p.add_argument("--types", help="comma-separated doc types (default: all)")
+    p.add_argument("--limit", type=int, help="at most this many documents")
+    p.add_argument("--dry-run", action="store_true", help="only count stale documents")
+    args = parser.parse_args(argv)
+
+    doc_types = [t.strip() for t in args.types.split(",") if t.strip()] if args.types else None
+    report = backfill(concurrency=args.concurrency, doc_types=doc_types, limit=args.limit, dry_run=args.dry_run)
+    print(f"\n✅ Backfill: {report['stale']} stale, {report['counts']} in {report['elapsed_s']:.1f}s")
+    for err in report["errors"][:20]:
+        print(f"   ❌ {err['doc_id']}: {err['error']}")
+    return report
+
+if __name__ == "__main__":
+    main()
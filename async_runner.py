@@ -0,0 +1,31 @@
+# async_runner.py
+import asyncio
+import threading
+from concurrent.futures import Future
+
+# One process-wide event loop on a daemon thread. The async pipeline (Groq calls,
+# agent loop) lives on it; the sync API submits coroutines here and blocks.
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="agent-event-loop", daemon=True)
+            _thread.start()
+    return _loop
+
+def submit(coro) -> Future:
+    """Schedules a coroutine on the shared loop and returns a concurrent Future."""
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("Blocking call made from the shared event loop; await the async variant instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+def run_sync(coro):
+    """Runs a coroutine on the shared loop and waits for its result."""
+    return submit(coro).result()
@@ -0,0 +1,111 @@
+# audio.py
+import io
+import re
+import shutil
+import subprocess
+import wave
+from typing import List, Optional, Tuple
+import numpy as np
+from config import AUDIO_SEGMENT_S, AUDIO_OVERLAP_S, AUDIO_SILENCE_SEARCH_S
+
+SAMPLE_RATE = 16000  # what Whisper resamples to anyway; mono s16
+_FRAME = SAMPLE_RATE // 50  # 20 ms
+
+def decode_pcm(data: bytes) -> Optional[np.ndarray]:
+    """
+    Decodes audio to 16 kHz mono int16. WAV is read with the standard library;
+    other formats need ffmpeg on PATH. Returns None if the audio can't be decoded
+    here (the caller then sends the file whole, as before).
+    """
+    if data[:4] == b"RIFF":
+        try:
+            return _decode_wav(data)
+        except (wave.Error, EOFError, ValueError):
+            pass
+    if shutil.which("ffmpeg") is None: return None
+    proc = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        input=data, capture_output=True
+    )
+    if proc.returncode != 0: return None
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+def split_on_silence(pcm: np.ndarray, segment_s: float = AUDIO_SEGMENT_S, overlap_s: float = AUDIO_OVERLAP_S,
+                     search_s: float = AUDIO_SILENCE_SEARCH_S) -> List[Tuple[int, int]]:
+    """
+    Sample ranges of roughly segment_s each. Every cut is moved to the quietest
+    300 ms within search_s of the target, so it rarely lands mid-word, and each
+    segment is padded by overlap_s on both sides (the stitcher drops the repeats).
+    """
+    n = len(pcm)
+    if n <= segment_s * SAMPLE_RATE * 1.5: return [(0, n)]
+
+    # Frame energy, smoothed over 300 ms
+    frames = n // _FRAME
+    energy = np.sqrt((pcm[:frames * _FRAME].astype(np.float32).reshape(frames, _FRAME) ** 2).mean(axis=1))
+    window = 15
+    smooth = np.convolve(energy, np.ones(window) / window, mode="same")
+
+    cuts, target = [0], segment_s * SAMPLE_RATE
+    while target < n - segment_s * SAMPLE_RATE * 0.5:
+        lo = max(cuts[-1] // _FRAME + 1, int((target - search_s * SAMPLE_RATE) // _FRAME))
+        hi = min(frames, int((target + search_s * SAMPLE_RATE) // _FRAME))
+        if hi > lo:
+            # Of the quietest frames in the window, the one closest to the target
+            quiet = smooth[lo:hi]
+            candidates = np.flatnonzero(quiet <= quiet.min() + 0.05 * (quiet.max() - quiet.min()))
+            cut = (lo + int(candidates[np.argmin(np.abs(lo + candidates - target / _FRAME))])) * _FRAME
+        else:
+            cut = int(target)
+        cuts.append(cut)
+        target = cut + segment_s * SAMPLE_RATE
+    cuts.append(n)
+
+    pad = int(overlap_s * SAMPLE_RATE)
+    return [(max(0, a - pad), min(n, b + pad)) for a, b in zip(cuts, cuts[1:])]
+
+def to_wav(pcm: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+def stitch(texts: List[str], max_overlap_words: int = 40) -> str:
+    """
+    Joins segment transcripts in order. Audio overlap means the end of one
+    transcript repeats at the start of the next: the longest run of words
+    (compared case- and punctuation-insensitively) shared by the previous tail
+    and the next head is kept once.
+    """
+    out: List[str] = []
+    for text in texts:
+        words = (text or "").split()
+        if not out:
+            out.extend(words)
+            continue
+        prev = [_norm(w) for w in out[-max_overlap_words:]]
+        head = [_norm(w) for w in words[:max_overlap_words]]
+        k = next((k for k in range(min(len(prev), len(head)), 1, -1) if prev[-k:] == head[:k]), 0)
+        out.extend(words[k:])
+    return " ".join(out)
+
+# --- HELPERS ---
+def _norm(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+def _decode_wav(data: bytes) -> np.ndarray:
+    with wave.open(io.BytesIO(data), "rb") as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width != 2: raise ValueError(f"unsupported sample width {width}")
+    pcm = np.frombuffer(raw, dtype=np.int16)
+    if channels > 1:
+        pcm = pcm[:len(pcm) // channels * channels].reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        # Linear resampling is plenty for speech
+        positions = np.arange(0, len(pcm), rate / SAMPLE_RATE)
+        pcm = np.interp(positions, np.arange(len(pcm)), pcm)
+    return np.asarray(pcm, dtype=np.int16)
@@ -0,0 +1,375 @@
+# benchmark.py
+"""
+Offline throughput benchmark for the ingestion pipeline.
+
+    python benchmark.py --docs 200 --concurrency 1,8,32 --latency-ms 400 --error-rate 0.02
+
+Runs AutonomousAgent.ingest_many over a synthetic corpus (invoices, resumes,
+legal docs, images, audio notes) against FakeGroq, an in-process stand-in
+with configurable latency and error rates. The database is MemoryDatabase,
+or the real Postgres with --db postgres. Each concurrency level reports
+docs/sec, document p50/p95, per-step latency (from the trace spans) and peak RSS.
+Nothing is sent to Groq.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from groq import InternalServerError, RateLimitError
+from prompts import count_tokens
+from uploads import SpooledUpload
+from audio import SAMPLE_RATE, to_wav
+from database import child_table_for
+
+# --- FAKE GROQ ---
+class FakeGroq:
+    """
+    Stands in for AsyncGroq (chat.completions.create, audio.transcriptions.create).
+    Each call sleeps a log-normal latency around latency_ms, fails with a 429 or
+    503 at error_rate, and answers with a synthetic reply shaped like the real one
+    for the prompt it recognizes. With `recorded` (an LLMCache, e.g. the
+    production .llm_cache.sqlite3), prompts seen before replay their real completion.
+    """
+    def __init__(self, latency_ms: float = 300, jitter: float = 0.3, error_rate: float = 0.0,
+                 recorded=None, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.recorded = recorded
+        self._rng = random.Random(seed)
+        # Reply contents get their own stream, so the latency draws don't shift them
+        self._replies = random.Random(seed)
+        self.counters = {"calls": 0, "errors": 0, "replayed": 0}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+
+    async def _chat(self, messages, model, temperature=0, **kwargs):
+        await self._latency()
+        content = None
+        if self.recorded is not None:
+            content = self.recorded.get(self.recorded.make_key(model, temperature, messages))
+            if content is not None: self.counters["replayed"] += 1
+        if content is None: content = _synthetic_reply(messages, self._replies)
+        prompt = " ".join(m["content"] if isinstance(m["content"], str) else "" for m in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=count_tokens(prompt), completion_tokens=count_tokens(content)),
+        )
+
+    async def _transcribe(self, file, model, response_format="text", **kwargs):
+        await self._latency()
+        name, data = file
+        seconds = max(1, len(data) // (SAMPLE_RATE * 2))
+        return f"Quick voice note about the {self._replies.choice(['budget', 'launch', 'hiring', 'roadmap'])} review. " * seconds
+
+    async def _latency(self):
+        self.counters["calls"] += 1
+        # Every draw happens before the sleep, so concurrent calls can't interleave
+        # their draws and the seed alone decides which calls fail
+        delay = self.latency_ms / 1000 * self._rng.lognormvariate(0, self.jitter)
+        failed = self._rng.random() < self.error_rate
+        status = self._rng.choice([429, 503])
+        await asyncio.sleep(delay)
+        if failed:
+            self.counters["errors"] += 1
+            response = httpx.Response(status, request=httpx.Request("POST", "https://api.groq.invalid"))
+            cls = RateLimitError if status == 429 else InternalServerError
+            raise cls(f"fake {status}", response=response, body=None)
+
+def _synthetic_reply(messages, rng: random.Random) -> str:
+    last = messages[-1]["content"]
+    if not isinstance(last, str):
+        # Vision: the "photo" is always a receipt
+        return f"RECEIPT\nVendor: Corner Cafe\nDate: 2024-05-0{rng.randint(1, 9)}\nCoffee 4.50\nBagel 3.25\nTax 0.62\nTotal amount due: 8.37"
+    text = last.split("Text:", 1)[-1]
+    kind = _kind_of(text)
+    if "decide the next action" in last:
+        return json.dumps({"reasoning": "benchmark", "action": "STOP"})
+    if "Classify into EXACTLY one category" in last:
+        return kind
+    if "in the same step" in last:
+        return json.dumps({"type": kind, "data": _payload(kind, rng)})
+    if "Extract invoice data" in last: return json.dumps(_payload("INVOICE", rng))
+    if "Analyze this legal document" in last: return json.dumps(_payload("LEGAL_DOC", rng))
+    if "Score resume" in last: return json.dumps(_payload("RESUME", rng))
+    if "Analyze this paper" in last: return json.dumps(_payload("RESEARCH_PAPER", rng))
+    if "Analyze this audio transcript" in last: return json.dumps(_payload("AUDIO_NOTE", rng))
+    if "summaries of consecutive parts" in last: return json.dumps({"summary": "Combined summary of all parts."})
+    if "Generate a PostgreSQL query" in last: return "SELECT filename, doc_type FROM processed_docs LIMIT 10"
+    if "Answer the user's question" in last: return "There are a few matching documents."
+    return json.dumps(_payload("OTHER", rng))
+
+def _kind_of(text: str) -> str:
+    upper = text.upper()
+    if "[METADATA: AUDIO_NOTE]" in upper: return "AUDIO_NOTE"
+    if "INVOICE" in upper or "TOTAL AMOUNT DUE" in upper: return "INVOICE"
+    if "RESUME" in upper or "EXPERIENCE" in upper: return "RESUME"
+    if "AGREEMENT" in upper: return "LEGAL_DOC"
+    return "OTHER"
+
+def _payload(kind: str, rng: random.Random) -> Dict:
+    if kind == "INVOICE":
+        items = [{"description": f"Item {i}", "total": rng.randint(5, 500)} for i in range(rng.randint(1, 5))]
+        return {"vendor": "Acme Supplies", "date": "2024-03-01", "line_items": items, "subtotal": None,
+                "tax": 12.5, "total_amount": sum(i["total"] for i in items) + 12.5}
+    if kind == "RESUME":
+        return {"score": rng.randint(40, 95), "skills": ["python", "sql", "docker"], "name": "Jordan Doe"}
+    if kind == "LEGAL_DOC":
+        return {"document_type": "Mutual NDA", "parties": ["Acme Corp", "Globex LLC"], "effective_date": "2024-01-01",
+                "expiration_date": "2026-01-01", "key_clauses": ["Confidentiality for 5 years", "Governed by Delaware law"],
+                "summary": "A mutual NDA between Acme and Globex. It lasts two years."}
+    if kind == "RESEARCH_PAPER":
+        return {"title": "A Study", "summary": "Findings of the study."}
+    if kind == "AUDIO_NOTE":
+        return {"summary": "A short voice note.", "sentiment": "Neutral"}
+    return {"summary": "A miscellaneous document.", "keywords": ["misc"]}
+
+# --- IN-PROCESS DATABASE ---
+class MemoryDatabase:
+    """
+    The parts of database.Database the agent uses, kept in dicts. Rows still go
+    through the child-table builders (ChildTable.build), so that CPU cost is
+    measured. latency_ms simulates a round-trip per call. No BatchWriter support
+    (it needs a cursor): use --db postgres with --batch-size.
+    """
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_s = latency_ms / 1000
+        self.dup_index = None
+        self.near_index = None
+        self._lock = threading.Lock()
+        self.docs: Dict[str, Tuple] = {}    # file_hash -> (doc_id, filename, doc_type)
+        self.children: Dict[str, Tuple] = {}  # doc_id -> (doc_type, row)
+        self.claims: Dict[str, str] = {}
+
+    def check_duplicate(self, file_hash: str) -> bool:
+        self._roundtrip()
+        with self._lock: return file_hash in self.docs
+
+    def save_document(self, doc_id, filename, doc_type, file_hash, data, simhash=None) -> bool:
+        self._roundtrip()
+        spec = child_table_for(doc_type)
+        row = spec.build(doc_id, data or {}) if spec else None
+        with self._lock:
+            if file_hash in self.docs: return False
+            self.docs[file_hash] = (doc_id, filename, doc_type)
+            if row is not None: self.children[doc_id] = (doc_type, row)
+        return True
+
+    def find_near_duplicate(self, simhash):
+        return None
+
+    def load_extraction(self, doc_id):
+        return None
+
+    def claim_ingest(self, file_hash, owner, stale_after_s) -> bool:
+        self._roundtrip()
+        with self._lock:
+            if self.claims.get(file_hash, owner) != owner: return False
+            self.claims[file_hash] = owner
+            return True
+
+    def release_ingest(self, file_hash, owner):
+        self._roundtrip()
+        with self._lock:
+            if self.claims.get(file_hash) == owner: del self.claims[file_hash]
+
+    def _roundtrip(self):
+        if self.latency_s: time.sleep(self.latency_s)
+
+# --- SYNTHETIC CORPUS ---
+KINDS = ("invoice", "resume", "legal", "image", "audio")
+
+def synthetic_corpus(n: int, kinds=KINDS, seed: int = 0) -> List[Tuple[str, object]]:
+    """n unique (filename, content) pairs cycling through kinds. Images and audio are SpooledUploads."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        kind = kinds[i % len(kinds)]
+        tag = uuid.UUID(int=rng.getrandbits(128)).hex[:12]
+        if kind == "invoice":
+            lines = "\n".join(f"{rng.randint(1, 9)} x Widget {j} @ {rng.randint(5, 90)}.00" for j in range(rng.randint(3, 30)))
+            content = f"INVOICE #{tag}\nAcme Supplies\nDate: 2024-03-0{rng.randint(1, 9)}\n{lines}\nTax: 12.50\nTotal amount due: {rng.randint(100, 9000)}.50"
+        elif kind == "resume":
+            content = f"RESUME {tag}\nJordan Doe\nExperience: {rng.randint(1, 15)} years building data pipelines.\nSkills: Python, SQL, Docker\n" + "Led projects. " * rng.randint(5, 60)
+        elif kind == "legal":
+            content = f"MUTUAL NON-DISCLOSURE AGREEMENT {tag}\nThis Agreement is made between Acme Corp and Globex LLC.\n" + "The parties agree to keep information confidential. " * rng.randint(10, 120)
+        elif kind == "image":
+            content = SpooledUpload.from_file(io.BytesIO(_synthetic_scan(rng)), f"scan_{tag}.png", "image/png")
+        else:
+            content = SpooledUpload.from_file(io.BytesIO(_synthetic_speech(rng)), f"note_{tag}.wav", "audio/wav")
+        docs.append((f"{kind}_{i}_{tag}" + (".txt" if isinstance(content, str) else ""), content))
+    return docs
+
+def _synthetic_scan(rng: random.Random) -> bytes:
+    # A page-sized grey image with "text lines" (random per doc so every hash differs)
+    height, width = 1600, 1200
+    page = np.full((height, width), 245, dtype=np.uint8)
+    for top in range(100, height - 100, 40):
+        page[top:top + 12, 100:rng.randint(300, width - 100)] = 40
+    page[0, :64] = np.frombuffer(rng.randbytes(64), dtype=np.uint8)
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\x89PNG\r\n\x1a\n" + page.tobytes()  # undecodable: sent as is
+    buf = io.BytesIO()
+    Image.fromarray(page, mode="L").save(buf, format="PNG")
+    return buf.getvalue()
+
+def _synthetic_speech(rng: random.Random, seconds: float = 8.0) -> bytes:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    bursts = (np.sin(2 * np.pi * 1.5 * t) > 0).astype(np.float32)  # talk / pause
+    pcm = (6000 * np.sin(2 * np.pi * rng.uniform(150, 300) * t) * bursts).astype(np.int16)
+    return to_wav(pcm)
+
+# --- MEMORY SAMPLING ---
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource  # peak since start, not current: coarser but portable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class PeakRSS:
+    """Samples RSS on a thread while the with-block runs; .peak is the highest seen."""
+    def __init__(self, interval_s: float = 0.05):
+        self.interval_s = interval_s
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, _rss_bytes())
+
+# --- RUNNER ---
+def step_latencies(results: List[Dict]) -> Dict[str, Dict]:
+    """count / mean / p95 seconds per 'kind:name' over the spans of every result."""
+    from agent import _percentile
+    durations: Dict[str, List[float]] = {}
+    for r in results:
+        for span in ((r.get("state") or {}).get("spans") or []):
+            durations.setdefault(f"{span['kind']}:{span['name']}", []).append(span["duration_s"])
+    return {
+        step: {"count": len(d), "mean_s": sum(d) / len(d), "p95_s": _percentile(d, 95)}
+        for step, d in sorted(durations.items())
+    }
+
+def run_level(concurrency: int, args, recorded=None) -> Dict:
+    from agent import AutonomousAgent
+    from scheduler import RequestScheduler
+
+    client = FakeGroq(args.latency_ms, args.jitter, args.error_rate, recorded, seed=args.seed * 1000 + concurrency)
+    db = MemoryDatabase(args.db_latency_ms) if args.db == "memory" else None
+    agent = AutonomousAgent(pacing="batch", fused=args.fused, client=client, db=db)
+    if args.db == "postgres": agent.db.near_index = None  # synthetic docs are near duplicates by design
+    else: agent.checkpoints = agent.artifacts = None  # MemoryDatabase has no checkpoint/artifact tables
+    agent.tools.cache = None  # every level pays for its calls
+    if args.no_classifier: agent.tools.classifier = None
+    agent.brain.scheduler = agent.tools.scheduler = RequestScheduler(
+        enabled=args.rate_limits, backoff_base_s=args.backoff_s, backoff_max_s=max(args.backoff_s, 1.0)
+    )
+
+    files = synthetic_corpus(args.docs, args.kinds, seed=args.seed * 1000 + concurrency)
+    # The pipeline's per-call prints would otherwise dominate at high concurrency
+    with open(os.devnull, "w") as devnull, PeakRSS() as rss, \
+            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+        report = agent.ingest_many(files, max_concurrency=concurrency,
+                                   batch_size=args.batch_size if args.db == "postgres" else None)
+    return {
+        "concurrency": concurrency,
+        "docs": report["total"],
+        "counts": report["counts"],
+        "elapsed_s": report["elapsed_s"],
+        "docs_per_sec": report["docs_per_sec"],
+        "p50_latency_s": report["p50_latency_s"],
+        "p95_latency_s": report["p95_latency_s"],
+        "peak_rss_mb": rss.peak / 2 ** 20,
+        "llm": dict(client.counters),
+        "retries": agent.tools.scheduler.stats()["retries"],
+        "steps": step_latencies(report["results"]),
+    }
+
+def print_report(levels: List[Dict], top_steps: int = 8):
+    print(f"\n{'conc':>5} {'docs':>5} {'docs/s':>8} {'p50 s':>7} {'p95 s':>7} {'peak MB':>8} {'calls':>6} {'errors':>6} {'retries':>7}  status")
+    for lv in levels:
+        print(f"{lv['concurrency']:>5} {lv['docs']:>5} {lv['docs_per_sec']:>8.2f} {lv['p50_latency_s']:>7.2f} "
+              f"{lv['p95_latency_s']:>7.2f} {lv['peak_rss_mb']:>8.0f} {lv['llm']['calls']:>6} {lv['llm']['errors']:>6} "
+              f"{lv['retries']:>7}  {lv['counts']}")
+    for lv in levels:
+        steps = sorted(lv["steps"].items(), key=lambda kv: -kv[1]["mean_s"] * kv[1]["count"])[:top_steps]
+        print(f"\nconcurrency {lv['concurrency']} — slowest steps (total time):")
+        for name, s in steps:
+            print(f"   {name:<34} n={s['count']:<5} mean {s['mean_s'] * 1000:8.1f} ms   p95 {s['p95_s'] * 1000:8.1f} ms")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline ingestion benchmark (no Groq calls).")
+    parser.add_argument("--docs", type=int, default=100, help="documents per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated max_concurrency levels")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"corpus mix, from {','.join(KINDS)}")
+    parser.add_argument("--latency-ms", type=float, default=300, help="median fake Groq latency")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal sigma of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with 429/503")
+    parser.add_argument("--backoff-s", type=float, default=0.05, help="retry backoff base (scaled down from production)")
+    parser.add_argument("--rate-limits", action="store_true", help="enforce RATE_LIMITS (off: measure the pipeline, not the quota)")
+    parser.add_argument("--recorded", help="LLM cache SQLite file to replay real completions from")
+    parser.add_argument("--db", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--db-name", help="scratch database for --db postgres (not DB_NAME; create it with "
+                                          "DB_NAME=<name> python database_setup.py)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round-trip for --db memory")
+    parser.add_argument("--batch-size", type=int, help="BatchWriter batch size (--db postgres only)")
+    parser.add_argument("--fused", action="store_true", help="classify+extract in one call")
+    parser.add_argument("--no-classifier", action="store_true", help="always classify with the LLM")
+    parser.add_argument("--seed", type=int, default=0, help="seeds the corpus and FakeGroq's latencies, errors and replies")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own logging")
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args(argv)
+    args.kinds = tuple(k.strip() for k in args.kinds.split(",") if k.strip())
+    unknown = set(args.kinds) - set(KINDS)
+    if unknown: parser.error(f"unknown kinds {sorted(unknown)}")
+    if args.db == "postgres":
+        # The benchmark saves thousands of synthetic documents: never into the application's database
+        from config import DB_NAME
+        from database import use_database
+        if not args.db_name: parser.error("--db postgres needs --db-name, a scratch database")
+        if args.db_name == DB_NAME: parser.error(f"--db-name {args.db_name} is the application database (DB_NAME)")
+        use_database(args.db_name)
+
+    recorded = None
+    if args.recorded:
+        from cache import LLMCache
+        recorded = LLMCache(args.recorded)
+
+    levels = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        print(f"\n=== concurrency {concurrency}: {args.docs} docs ===")
+        levels.append(run_level(concurrency, args, recorded))
+    print_report(levels)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "levels": levels}, f, indent=2, default=str)
+        print(f"\n📄 Report written to {args.json}")
+    return levels
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,97 @@
 # brain.py
 import json
-from groq import Groq
-from config import GROQ_API_KEY, MODEL_NAME
+import time
+from groq import AsyncGroq
+from async_runner import run_sync
+from prompts import afit_to_budget, usage_log, usage_of, count_tokens
+from scheduler import get_scheduler
+from routing import router
+from config import GROQ_API_KEY, FAST_PATH_PLANNER, LLM_COMPLETION_TOKENS_ESTIMATE
+
+# doc type -> (extraction tool, success flag it sets)
+DOC_TYPE_ACTIONS = {
+    "INVOICE": ("extract_invoice", "has_invoice_data"),
+    "RESUME": ("score_resume", "has_resume_score"),
+    "RESEARCH_PAPER": ("summarize_research_paper", "has_research_summary"),
+    "LEGAL_DOC": ("extract_legal_doc", "has_legal_data"),
+    "AUDIO_NOTE": ("summarize_audio_note", "has_audio_summary"),
+    "OTHER": ("summarize_unknown", "has_unknown_summary"),
+}
+
+# Every action the agent loop can execute
+ACTIONS = {"analyze_image", "classify_document", "save_data", "STOP"} | {a for a, _ in DOC_TYPE_ACTIONS.values()}
+
+def plan_next_action(mini_state):
+    """
+    Evaluates the workflow table from the LLM prompt locally.
+    Returns (action, reasoning), or None if the state isn't covered by a rule.
+    """
+    history = [h.get("action") for h in mini_state.get("history", [])]
+    doc_type = mini_state.get("type", "MISSING")
+
+    # Rule 9 wins over everything: never loop past a save
+    if "save_data" in history:
+        return "STOP", "Data already saved."
+
+    if doc_type == "IMAGE_NEEDS_OCR":
+        # Already tried OCR and it didn't re-classify -> let the LLM sort it out
+        if "analyze_image" in history: return None
+        return "analyze_image", "Image needs OCR before classification."
+
+    if doc_type == "MISSING":
+        if "classify_document" in history: return None
+        return "classify_document", "Document type is unknown."
+
+    # Rule 8: any data flag set -> save
+    if any(mini_state.get(flag) for _, flag in DOC_TYPE_ACTIONS.values()):
+        return "save_data", "Extraction finished, saving."
+
+    if doc_type in DOC_TYPE_ACTIONS:
+        action, _ = DOC_TYPE_ACTIONS[doc_type]
+        # Tool already ran but produced nothing -> not a case the table covers
+        if action in history: return None
+        return action, f"Type is {doc_type} and no data extracted yet."
+
+    return None
 
 class GroqBrain:
-    def __init__(self):
-        self.client = Groq(api_key=GROQ_API_KEY)
+    def __init__(self, client=None):
+        self.client = client or AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)
+        self.scheduler = get_scheduler()
+        self.fast_path = FAST_PATH_PLANNER
+        # How many decisions each path made ("rules" vs "llm")
+        self.stats = {"rules": 0, "llm": 0}
+
+    def llm_fallback_rate(self) -> float:
+        total = self.stats["rules"] + self.stats["llm"]
+        return self.stats["llm"] / total if total else 0.0
 
     def decide(self, state, tools):
+        return run_sync(self.adecide(state, tools))
+
+    async def adecide(self, state, tools):
+        mini_state = self._mini_state(state)
+
+        # --- FAST PATH: obvious next step, no LLM round-trip ---
+        if self.fast_path:
+            planned = plan_next_action(mini_state)
+            if planned:
+                action, reasoning = planned
+                self.stats["rules"] += 1
+                return {"action": action, "reasoning": reasoning, "decided_by": "rules"}
+
+        self.stats["llm"] += 1
+        decision = await self._allm_decide(mini_state, state.get("content", ""))
+        decision["decided_by"] = "llm"
+        return decision
+
+    def _mini_state(self, state):
+        # The content preview is only for the LLM prompt: _allm_decide adds it
         # --- THE FIX: ADD SUCCESS FLAGS ---
-        mini_state = {
+        return {
             "filename": state.get("filename"),
             "type": state.get("type", "MISSING"),
             "history": state.get("history", []),
-            "content_preview": state.get("content", "")[:500],
             
             # Boolean Flags
             "has_invoice_data": state.get("extracted_data") is not None,
@@ -23,7 +101,9 @@ class GroqBrain:
             "has_audio_summary": state.get("audio_summary") is not None,
             "has_unknown_summary": state.get("summary_data") is not None
         }
-        
+
+    async def _allm_decide(self, mini_state, content: str):
+        mini_state = {**mini_state, "content_preview": await afit_to_budget(content, "brain")}
         system_prompt = """
         You are an autonomous agent. Output ONLY valid JSON.
         """
@@ -57,22 +137,41 @@ class GroqBrain:
         }}
         """
 
-        try:
-            completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                model=MODEL_NAME,
-                temperature=0
+        # Routed model first (small by default); a reply that isn't JSON naming a known
+        # action is asked again of the large model. API errors (after the scheduler's
+        # retries) propagate: the document fails instead of stopping half-processed.
+        model = router.model_for("brain")
+        while True:
+            start = time.perf_counter()
+            completion = await self.scheduler.run(
+                model,
+                lambda: self.client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    model=model,
+                    temperature=0
+                ),
+                tokens=count_tokens(system_prompt) + count_tokens(user_prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
             )
-            
-            content = completion.choices[0].message.content
-            # Nuclear JSON Fix
-            content = content.replace("```json", "").replace("```", "").strip()
-            
-            return json.loads(content)
-            
-        except Exception as e:
-            print(f"Brain Error: {e}")
-            return {"action": "STOP", "reasoning": f"Error: {e}"}
\ No newline at end of file
+            usage_log.record("brain", *usage_of(completion), time.perf_counter() - start, model=model)
+
+            try:
+                content = completion.choices[0].message.content
+                # Nuclear JSON Fix
+                content = content.replace("```json", "").replace("```", "").strip()
+                
+                decision = json.loads(content)
+                error = "reply is not a JSON object"
+            except (AttributeError, ValueError) as e:
+                decision, error = None, e
+
+            if isinstance(decision, dict) and decision.get("action") in ACTIONS: return decision
+            larger = router.escalation_for("brain", model)
+            if larger is None: break
+            model = larger
+
+        if isinstance(decision, dict): return decision
+        print(f"Brain Error: {error}")
+        return {"action": "STOP", "reasoning": f"Error: {error}"}
\ No newline at end of file
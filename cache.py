@@ -0,0 +1,168 @@
+# cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MEMORY_ITEMS,
+    LLM_CACHE_TTL_S, LLM_CACHE_MAX_BYTES, LLM_CACHE_SWEEP_EVERY,
+)
+
+class LLMCache:
+    """
+    Content-addressed cache for chat completions.
+    Tier 1: bounded in-memory LRU. Tier 2: SQLite file with TTL and size-based eviction
+    (least recently used rows go first).
+    get/put block on SQLite; ToolRegistry calls them through asyncio.to_thread.
+    Disk hits only note their access time; it is written, and expired rows are
+    swept, once every sweep_every puts (one transaction, not one per call).
+    """
+    def __init__(self, path: str = LLM_CACHE_PATH, memory_items: int = LLM_CACHE_MEMORY_ITEMS,
+                 ttl_s: float = LLM_CACHE_TTL_S, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 sweep_every: int = LLM_CACHE_SWEEP_EVERY):
+        self.memory_items = memory_items
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.sweep_every = max(1, sweep_every)
+        self._puts = 0
+        self._touched = {}  # key -> accessed_at not yet written
+        self._mem = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bytes_saved": 0, "evictions": 0}
+
+        self._disk = sqlite3.connect(path, check_same_thread=False)
+        self._disk.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL
+            )
+        """)
+        self._disk.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._disk.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at)")
+        self._disk.commit()
+        self._disk_bytes = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages) -> str:
+        payload = json.dumps({"model": model, "temperature": temperature, "messages": messages},
+                             sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str, request_bytes: int = 0) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and now - hit[1] < self.ttl_s:
+                self._mem.move_to_end(key)
+                self._record_hit("memory_hits", hit[0], request_bytes)
+                return hit[0]
+            if hit: del self._mem[key]
+
+            row = self._disk.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl_s:
+                self._touched[key] = now
+                self._remember(key, row[0], row[1])
+                self._record_hit("disk_hits", row[0], request_bytes)
+                return row[0]
+            if row: self._delete_disk(key)
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode())
+        with self._lock:
+            self._remember(key, value, now)
+            old = self._disk.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._disk.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._puts += 1
+            if self._puts % self.sweep_every == 0:
+                self._flush_touched()
+                self._sweep_expired(now)
+            if self._disk_bytes > self.max_bytes:
+                self._flush_touched()
+                self._evict_lru()
+            self._disk.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._mem),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # --- HELPERS (caller holds the lock) ---
+    def _record_hit(self, tier: str, value: str, request_bytes: int):
+        self.counters[tier] += 1
+        # Request we didn't send + response we didn't download
+        self.counters["bytes_saved"] += request_bytes + len(value.encode())
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._mem[key] = (value, created_at)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_items:
+            self._mem.popitem(last=False)
+
+    def _delete_disk(self, key: str):
+        row = self._disk.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._disk.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._disk.commit()
+            self._disk_bytes -= row[0]
+
+    def _flush_touched(self):
+        if not self._touched: return
+        self._disk.executemany("UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                               [(t, k) for k, t in self._touched.items()])
+        self._touched.clear()
+
+    def _sweep_expired(self, now: float):
+        # Range scans on the created_at index
+        expired = self._disk.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM llm_cache WHERE created_at < ?", (now - self.ttl_s,)
+        ).fetchone()
+        if expired[1]:
+            self._disk.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_s,))
+            self._disk_bytes -= expired[0]
+            self.counters["evictions"] += expired[1]
+
+    def _evict_lru(self):
+        while self._disk_bytes > self.max_bytes:
+            victims = self._disk.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not victims: break
+            for key, size in victims:
+                self._disk.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._mem.pop(key, None)
+                self._disk_bytes -= size
+                self.counters["evictions"] += 1
+                if self._disk_bytes <= self.max_bytes: break
+
+# --- PROCESS-WIDE INSTANCE ---
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> Optional[LLMCache]:
+    """Shared cache for every ToolRegistry in the process, or None when disabled."""
+    global _cache
+    if not LLM_CACHE_ENABLED: return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+    return _cache
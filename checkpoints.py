@@ -0,0 +1,143 @@
+# checkpoints.py
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+from database import table_ready
+from config import CHECKPOINT_STORE, CHECKPOINT_PATH, CHECKPOINT_TTL_S, CHECKPOINT_SWEEP_EVERY
+
+# Keys rebuilt on every run rather than stored
+_TRANSIENT = ("upload", "spans", "usage")
+
+def dumps(state: Dict) -> bytes:
+    """Compact checkpoint: minified JSON, zlib-compressed."""
+    return zlib.compress(_encode(state), 6)
+
+def loads(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob))
+
+class LocalCheckpointStore:
+    """SQLite stand-in for the agent_checkpoints table, for a single machine without Postgres writes."""
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self._lock = threading.Lock()
+        self._disk = sqlite3.connect(path, check_same_thread=False)
+        self._disk.execute("""
+            CREATE TABLE IF NOT EXISTS agent_checkpoints (
+                file_hash TEXT PRIMARY KEY,
+                step INTEGER,
+                state BLOB,
+                updated_at REAL
+            )
+        """)
+        self._disk.execute("CREATE INDEX IF NOT EXISTS agent_checkpoints_updated ON agent_checkpoints (updated_at)")
+        self._disk.commit()
+
+    def save_checkpoint(self, file_hash: str, step: int, blob: bytes):
+        with self._lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO agent_checkpoints (file_hash, step, state, updated_at) VALUES (?, ?, ?, ?)",
+                (file_hash, step, blob, time.time())
+            )
+            self._disk.commit()
+
+    def load_checkpoint(self, file_hash: str, max_age_s: float) -> Optional[Tuple[bytes, int]]:
+        with self._lock:
+            row = self._disk.execute(
+                "SELECT state, step FROM agent_checkpoints WHERE file_hash = ? AND updated_at >= ?",
+                (file_hash, time.time() - max_age_s)
+            ).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def delete_checkpoint(self, file_hash: str):
+        with self._lock:
+            self._disk.execute("DELETE FROM agent_checkpoints WHERE file_hash = ?", (file_hash,))
+            self._disk.commit()
+
+    def sweep_checkpoints(self, max_age_s: float) -> int:
+        with self._lock:
+            n = self._disk.execute("DELETE FROM agent_checkpoints WHERE updated_at < ?", (time.time() - max_age_s,)).rowcount
+            self._disk.commit()
+        return n
+
+class Checkpointer:
+    """
+    Saves a document's state (type, extracted payloads, history) after each
+    completed step, keyed by file_hash, so a re-run after a crash or failed save
+    resumes where the last one stopped instead of paying for the vision/LLM
+    calls again. The document text itself is only stored when
+    it isn't in the artifacts table: state['content_artifact'] names the artifact
+    kind instead, and the agent loads it on resume. `store` is a Database
+    (agent_checkpoints table, shared by every worker) or a LocalCheckpointStore.
+    A checkpoint is deleted once its document is saved or skipped. Checkpoints
+    older than ttl_s are ignored, and swept on the first save and every
+    sweep_every saves after that (documents that failed for good, or were abandoned).
+    """
+    def __init__(self, store, ttl_s: float = CHECKPOINT_TTL_S, sweep_every: int = CHECKPOINT_SWEEP_EVERY):
+        self.store = store
+        self.ttl_s = ttl_s
+        self.sweep_every = max(1, sweep_every)
+        self._lock = threading.Lock()
+        self.counters = {"writes": 0, "bytes": 0, "raw_bytes": 0, "resumes": 0, "deletes": 0, "swept": 0}
+
+    def save(self, state: Dict) -> int:
+        raw = _encode(state)
+        blob = zlib.compress(raw, 6)
+        self.store.save_checkpoint(state["file_hash"], len(state.get("history", [])), blob)
+        with self._lock:
+            self.counters["writes"] += 1
+            self.counters["bytes"] += len(blob)
+            self.counters["raw_bytes"] += len(raw)
+            sweep = self.counters["writes"] % self.sweep_every == 1 or self.sweep_every == 1
+        if sweep:
+            try: self.sweep()
+            except Exception as e: print(f"⚠️ Checkpoint sweep failed: {e}")  # the save itself landed
+        return len(blob)
+
+    def sweep(self) -> int:
+        """Deletes checkpoints older than ttl_s; returns how many."""
+        n = self.store.sweep_checkpoints(self.ttl_s)
+        with self._lock: self.counters["swept"] += n
+        if n: print(f"   [CKPT] 🧹 Swept {n} expired checkpoint(s)")
+        return n
+
+    def load(self, file_hash: str) -> Optional[Dict]:
+        row = self.store.load_checkpoint(file_hash, self.ttl_s)
+        if row is None: return None
+        with self._lock: self.counters["resumes"] += 1
+        return loads(row[0])
+
+    def delete(self, file_hash: str):
+        self.store.delete_checkpoint(file_hash)
+        with self._lock: self.counters["deletes"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        c["avg_bytes"] = c["bytes"] / c["writes"] if c["writes"] else 0.0
+        c["compression_ratio"] = c["raw_bytes"] / c["bytes"] if c["bytes"] else 0.0
+        return c
+
+def _encode(state: Dict) -> bytes:
+    data = {k: v for k, v in state.items() if k not in _TRANSIENT}
+    # The transcript / OCR / document text is already in the artifacts table
+    if state.get("content_artifact"): data.pop("content", None)
+    # A spooled image is only flagged: the re-run passes the same upload again
+    if state.get("upload") is not None: data["_upload"] = True
+    return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+# --- PROCESS-WIDE INSTANCE ---
+_local = None
+_local_lock = threading.Lock()
+
+def get_checkpointer(db) -> Optional[Checkpointer]:
+    """A Checkpointer over db (CHECKPOINT_STORE=postgres) or the local SQLite file; None when off."""
+    global _local
+    if CHECKPOINT_STORE == "postgres":
+        return Checkpointer(db) if table_ready(db, "agent_checkpoints", "CHECKPOINT_STORE=postgres") else None
+    if CHECKPOINT_STORE != "local": return None
+    with _local_lock:
+        if _local is None:
+            _local = LocalCheckpointStore()
+    return Checkpointer(_local)
@@ -0,0 +1,115 @@
+# chunking.py
+import json
+import re
+from collections import Counter
+from typing import Dict, List
+from config import CHUNK_CHARS, CHUNK_OVERLAP, CHUNK_MAX
+
+def split_text(content: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP,
+               max_chunks: int = CHUNK_MAX) -> List[str]:
+    """
+    Splits content into chunks of at most chunk_chars, preferring paragraph, then
+    line, then sentence boundaries, with `overlap` characters repeated between
+    neighbours. Past max_chunks, the head chunks and the final chunk are kept
+    (totals, signatures and termination clauses live at the end).
+    """
+    if len(content) <= chunk_chars: return [content]
+
+    chunks, start = [], 0
+    while start < len(content):
+        end = min(len(content), start + chunk_chars)
+        if end < len(content):
+            window = content[start:end]
+            # Don't cut mid-paragraph/line/sentence if a boundary sits in the back half
+            for sep in ("\n\n", "\n", ". "):
+                cut = window.rfind(sep)
+                if cut > chunk_chars // 2:
+                    end = start + cut + len(sep)
+                    break
+        chunks.append(content[start:end])
+        if end >= len(content): break
+        start = max(end - overlap, start + 1)
+
+    if len(chunks) > max_chunks:
+        chunks = chunks[:max_chunks - 1] + chunks[-1:]
+    return chunks
+
+# --- MERGE HELPERS ---
+def _first(parts: List[Dict], field: str):
+    for p in parts:
+        if p.get(field) not in (None, "", []): return p[field]
+    return None
+
+def _last(parts: List[Dict], field: str):
+    return _first(list(reversed(parts)), field)
+
+def _key(v) -> str:
+    return json.dumps(v, sort_keys=True).lower() if not isinstance(v, str) else re.sub(r"\s+", " ", v).strip().lower()
+
+def _values(p: Dict, field: str) -> List:
+    values = p.get(field) or []
+    if isinstance(values, str): values = [v.strip() for v in values.split(",")]
+    return [v for v in values if _key(v)]
+
+def _union(parts: List[Dict], field: str) -> List:
+    """Set-like fields (parties, keywords): every distinct value once, in order of appearance."""
+    seen, out = set(), []
+    for p in parts:
+        for v in _values(p, field):
+            key = _key(v)
+            if key not in seen:
+                seen.add(key)
+                out.append(v)
+    return out
+
+def _concat(parts: List[Dict], field: str) -> List:
+    """
+    Positional fields (line items): chunks are concatenated, dropping only the
+    leading items of a chunk that repeat the trailing items of the one before
+    (the text overlap between neighbours). Identical items elsewhere are kept.
+    """
+    out, prev = [], []
+    for p in parts:
+        values = _values(p, field)
+        keys, prev_keys = [_key(v) for v in values], [_key(v) for v in prev]
+        n = min(len(keys), len(prev_keys))
+        while n and keys[:n] != prev_keys[-n:]: n -= 1
+        out.extend(values[n:])
+        prev = values
+    return out
+
+def summaries(parts: List[Dict], field: str = "summary") -> List[str]:
+    return [p[field] for p in parts if isinstance(p.get(field), str) and p[field].strip()]
+
+# --- PER-TYPE MERGES ---
+def merge_invoice(parts: List[Dict]) -> Dict:
+    # Header fields come from the top, totals from the bottom; line items are
+    # concatenated (the overlap between chunks can repeat an item, _concat drops it)
+    return {
+        "vendor": _first(parts, "vendor"),
+        "date": _first(parts, "date"),
+        "line_items": _concat(parts, "line_items"),
+        "subtotal": _last(parts, "subtotal"),
+        "tax": _last(parts, "tax"),
+        "total_amount": _last(parts, "total_amount"),
+    }
+
+def merge_legal_doc(parts: List[Dict], summary: str) -> Dict:
+    return {
+        "document_type": _first(parts, "document_type"),
+        "parties": _union(parts, "parties"),
+        "effective_date": _first(parts, "effective_date"),
+        "expiration_date": _last(parts, "expiration_date"),
+        "key_clauses": _union(parts, "key_clauses"),
+        "summary": summary,
+    }
+
+def merge_research_paper(parts: List[Dict], summary: str) -> Dict:
+    return {"title": _first(parts, "title"), "summary": summary}
+
+def merge_audio_note(parts: List[Dict], summary: str) -> Dict:
+    votes = Counter(str(p["sentiment"]).strip().capitalize() for p in parts if p.get("sentiment"))
+    return {"summary": summary, "sentiment": votes.most_common(1)[0][0] if votes else "Neutral"}
+
+def merge_unknown(parts: List[Dict], summary: str) -> Dict:
+    return {"summary": summary, "keywords": _union(parts, "keywords")}
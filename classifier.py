@@ -0,0 +1,237 @@
+# classifier.py
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import (
+    CLASSIFIER_ENABLED, CLASSIFIER_PATH, CLASSIFIER_THRESHOLD,
+    CLASSIFIER_FEATURES, CLASSIFIER_RELOAD_S,
+)
+
+LABELS = ["INVOICE", "RESUME", "RESEARCH_PAPER", "AUDIO_NOTE", "LEGAL_DOC", "OTHER"]
+MAX_CHARS = 20000  # the head of a document is plenty to classify it
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9]+|\$|%|@")
+
+# --- FEATURES ---
+def featurize(text: str, n_features: int = CLASSIFIER_FEATURES) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed bag of words + bigrams as a sparse row: (column indices, sublinear tf).
+    crc32 keeps hashing stable across processes (Python's hash() is salted).
+    """
+    words = _WORD_RE.findall((text or "")[:MAX_CHARS].lower())
+    grams = words + [a + " " + b for a, b in zip(words, words[1:])]
+    counts: Dict[int, int] = {}
+    for g in grams:
+        h = zlib.crc32(g.encode()) % n_features
+        counts[h] = counts.get(h, 0) + 1
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return idx, tf
+
+def _weigh(idx: np.ndarray, tf: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    vals = tf * idf[idx]
+    norm = np.linalg.norm(vals)
+    return vals / norm if norm else vals
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+# --- TRAINING ---
+def train(texts: List[str], labels: List[str], n_features: int = CLASSIFIER_FEATURES,
+          epochs: int = 30, lr: float = 1.0, l2: float = 1e-5, holdout: float = 0.2, seed: int = 0) -> Dict:
+    """
+    Fits a softmax regression on hashed TF-IDF features with full-batch AdaGrad
+    over a CSR-style sparse matrix. Returns the model arrays plus the
+    accuracy on a held-out split (the final model is refit on everything).
+    """
+    classes = [l for l in LABELS if l in set(labels)]
+    y = np.array([classes.index(l) for l in labels])
+    rows = [featurize(t, n_features) for t in texts]
+
+    order = np.random.default_rng(seed).permutation(len(rows))
+    n_test = int(len(rows) * holdout) if len(rows) >= 20 else 0
+    test, fit = order[:n_test], order[n_test:]
+
+    accuracy = None
+    if n_test:
+        model = _fit([rows[i] for i in fit], y[fit], len(classes), n_features, epochs, lr, l2)
+        hits = sum(int(np.argmax(_scores(model, *rows[i])) == y[i]) for i in test)
+        accuracy = hits / n_test
+
+    model = _fit(rows, y, len(classes), n_features, epochs, lr, l2)
+    model.update({
+        "labels": np.array(classes),
+        "accuracy": np.float64(accuracy if accuracy is not None else np.nan),
+        "n_train": np.int64(len(rows)),
+        "trained_at": np.float64(time.time()),
+    })
+    return model
+
+def _fit(rows, y, n_classes, n_features, epochs, lr, l2) -> Dict:
+    n = len(rows)
+    # Smoothed idf from document frequencies. Features never seen in training get
+    # weight 0, so unfamiliar words don't dilute the normalized vector at inference.
+    df = np.zeros(n_features, dtype=np.float32)
+    for idx, _ in rows: df[idx] += 1
+    idf = np.where(df > 0, np.log((1 + n) / (1 + df)) + 1, 0).astype(np.float32)
+
+    indptr = np.cumsum([0] + [len(idx) for idx, _ in rows])
+    indices = np.concatenate([idx for idx, _ in rows]) if n else np.zeros(0, dtype=np.int64)
+    data = np.concatenate([_weigh(idx, tf, idf) for idx, tf in rows]) if n else np.zeros(0, dtype=np.float32)
+    row_of = np.repeat(np.arange(n), np.diff(indptr))
+
+    W = np.zeros((n_features, n_classes), dtype=np.float32)
+    b = np.zeros(n_classes, dtype=np.float32)
+    Y = np.eye(n_classes, dtype=np.float32)[y]
+    # AdaGrad accumulators: rare features still get meaningful steps
+    acc_W, acc_b = np.zeros_like(W), np.zeros_like(b)
+    for _ in range(epochs):
+        logits = np.zeros((n, n_classes), dtype=np.float32)
+        np.add.at(logits, row_of, data[:, None] * W[indices])
+        err = (_softmax(logits + b) - Y) / n
+        grad = np.zeros_like(W)
+        np.add.at(grad, indices, data[:, None] * err[row_of])
+        grad += l2 * W
+        grad_b = err.sum(axis=0)
+        acc_W += grad ** 2
+        acc_b += grad_b ** 2
+        W -= lr * grad / (np.sqrt(acc_W) + 1e-8)
+        b -= lr * grad_b / (np.sqrt(acc_b) + 1e-8)
+    return {"W": W, "b": b, "idf": idf}
+
+def _scores(model: Dict, idx: np.ndarray, tf: np.ndarray) -> np.ndarray:
+    vals = _weigh(idx, tf, model["idf"])
+    return vals @ model["W"][idx] + model["b"]
+
+# --- SERVING ---
+class LocalClassifier:
+    """
+    Loads the model saved by `python classifier.py train` and reloads it when the
+    file changes (checked at most every CLASSIFIER_RELOAD_S). Predictions below
+    `threshold` are left to the LLM; stats() reports the fallback rate, the
+    held-out accuracy from training and agreement with the LLM on fallbacks.
+    """
+    def __init__(self, path: str = CLASSIFIER_PATH, threshold: float = CLASSIFIER_THRESHOLD,
+                 reload_s: float = CLASSIFIER_RELOAD_S):
+        self.path = path
+        self.threshold = threshold
+        self.reload_s = reload_s
+        self.model = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"local": 0, "fallback": 0, "no_model": 0, "fallback_agreed": 0}
+        self._maybe_reload(force=True)
+
+    def predict(self, text: str) -> Optional[Tuple[str, float]]:
+        """Returns (label, confidence), or None if no model is loaded."""
+        self._maybe_reload()
+        model = self.model
+        if model is None: return None
+        probs = _softmax(_scores(model, *featurize(text, model["W"].shape[0])))
+        best = int(np.argmax(probs))
+        return str(model["labels"][best]), float(probs[best])
+
+    def classify(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns (label, None) when confident, else (None, best_guess) so the caller
+        can ask the LLM and report the outcome with record_fallback().
+        """
+        prediction = self.predict(text)
+        with self._lock:
+            if prediction is None:
+                self.counters["no_model"] += 1
+                return None, None
+            label, confidence = prediction
+            if confidence >= self.threshold:
+                self.counters["local"] += 1
+                return label, None
+            self.counters["fallback"] += 1
+            return None, label
+
+    def record_fallback(self, guess: Optional[str], llm_label: str):
+        if guess == llm_label:
+            with self._lock: self.counters["fallback_agreed"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            answered = self.counters["local"] + self.counters["fallback"]
+            model = self.model
+            return {
+                **self.counters,
+                "fallback_rate": self.counters["fallback"] / answered if answered else 0.0,
+                "fallback_agreement": self.counters["fallback_agreed"] / self.counters["fallback"] if self.counters["fallback"] else None,
+                "holdout_accuracy": None if model is None or np.isnan(model["accuracy"]) else float(model["accuracy"]),
+                "n_train": None if model is None else int(model["n_train"]),
+                "threshold": self.threshold,
+            }
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_s: return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime: return
+        try:
+            with np.load(self.path) as f:
+                self.model = {k: f[k] for k in f.files}
+            self._mtime = mtime
+            print(f"   [CLF] 🧮 Loaded classifier ({int(self.model['n_train'])} docs) from {self.path}")
+        except Exception as e:
+            print(f"⚠️ Could not load classifier {self.path}: {e}")
+
+def save_model(model: Dict, path: str = CLASSIFIER_PATH):
+    # Write then rename, so a serving process never reads a half-written file
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **model)
+    os.replace(tmp, path)
+
+# --- PROCESS-WIDE INSTANCE ---
+_classifier = None
+_classifier_lock = threading.Lock()
+
+def get_classifier() -> Optional[LocalClassifier]:
+    global _classifier
+    if not CLASSIFIER_ENABLED: return None
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = LocalClassifier()
+    return _classifier
+
+def train_from_database(path: str = CLASSIFIER_PATH) -> Dict:
+    """Trains on the raw text stored in the artifacts table (ARTIFACTS_ENABLED) and saves the model."""
+    from artifacts import unpack
+    from database import Database
+    texts, labels = [], []
+    for doc_type, blob in Database().classifier_examples():
+        if doc_type not in LABELS: continue
+        text = unpack(blob)
+        if text.strip():
+            texts.append(text)
+            labels.append(doc_type)
+    if len(set(labels)) < 2:
+        raise ValueError(f"Need at least two document types with stored text to train, found {sorted(set(labels))} "
+                         f"(documents saved with ARTIFACTS_ENABLED=false have none)")
+    start = time.perf_counter()
+    model = train(texts, labels)
+    save_model(model, path)
+    accuracy = float(model["accuracy"])
+    print(f"✅ Trained on {len(texts)} docs in {time.perf_counter() - start:.1f}s "
+          f"(holdout accuracy {'n/a' if np.isnan(accuracy) else f'{accuracy:.1%}'}) -> {path}")
+    return model
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["train"]:
+        print("Usage: python classifier.py train")
+        sys.exit(1)
+    train_from_database()
@@ -1,5 +1,7 @@
 # config.py
+import json
 import os
+import socket
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,6 +11,195 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
 
+# Model Routing (routing.py): the model each tool calls. Values are "small", "large"
+# or a model id; override one with MODEL_ROUTE_<TOOL>, e.g. MODEL_ROUTE_SCORE_RESUME=small
+SMALL_MODEL = os.getenv("SMALL_MODEL", "llama-3.1-8b-instant")
+LARGE_MODEL = os.getenv("LARGE_MODEL", MODEL_NAME)
+MODEL_ROUTES = {
+    "default": "large",
+    "brain": "small",
+    "classify_document": "small",
+    "classify_and_extract": "large",
+    "extract_invoice": "large",
+    "extract_legal_doc": "large",
+    "score_resume": "large",
+    "summarize_research_paper": "large",
+    "summarize_audio_note": "large",
+    "summarize_unknown": "large",
+    "reduce_summaries": "large",
+    "generate_sql": "large",
+    "answer_query": "small",
+}
+for _tool in MODEL_ROUTES:
+    MODEL_ROUTES[_tool] = os.getenv(f"MODEL_ROUTE_{_tool.upper()}", MODEL_ROUTES[_tool])
+# A reply from a smaller model that fails validation is retried once on LARGE_MODEL
+MODEL_ESCALATION = os.getenv("MODEL_ESCALATION", "true").lower() == "true"
+
+# Groq Rate Limits (scheduler.py): per-model (requests/min, tokens/min) budgets,
+# enforced client-side with token buckets. 0 = unlimited (Whisper has no token limit).
+# Defaults follow Groq's free tier; override with RATE_LIMITS='{"model": [rpm, tpm]}'
+RATE_LIMITS = {
+    "default": (30, 6000),
+    "llama-3.3-70b-versatile": (30, 12000),
+    "llama-3.1-8b-instant": (30, 6000),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (30, 30000),
+    "whisper-large-v3": (20, 0),
+}
+RATE_LIMITS.update({m: tuple(v) for m, v in json.loads(os.getenv("RATE_LIMITS", "{}")).items()})
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# 429s, 5xx and connection errors are retried with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1.0"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "30"))
+# Completion tokens reserved per call until the real usage comes back
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "300"))
+
+# Agent Settings
+# Rule-based planner answers obvious steps locally; the LLM only sees the rest
+FAST_PATH_PLANNER = os.getenv("FAST_PATH_PLANNER", "true").lower() == "true"
+# One completion that classifies and extracts; step-by-step loop only if it fails validation
+FUSED_EXTRACTION = os.getenv("FUSED_EXTRACTION", "false").lower() == "true"
+# "batch" (headless, zero delay) or "ui" (stream step events without blocking the worker)
+AGENT_PACING = os.getenv("AGENT_PACING", "batch")
+
+# Single-flight claims: one worker process per file_hash at a time. Off by default
+# (one process needs no table round-trips); worker.py always turns them on
+INGEST_CLAIMS_ENABLED = os.getenv("INGEST_CLAIMS_ENABLED", "false").lower() == "true"
+INGEST_CLAIM_STALE_S = float(os.getenv("INGEST_CLAIM_STALE_S", "600"))
+INGEST_CLAIM_WAIT_S = float(os.getenv("INGEST_CLAIM_WAIT_S", "900"))
+INGEST_CLAIM_POLL_S = float(os.getenv("INGEST_CLAIM_POLL_S", "1.0"))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+# Long Documents: split into chunks, extract each concurrently, merge per type
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "3000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNK_MAX = int(os.getenv("CHUNK_MAX", "8"))
+
+# Prompt token budgets per tool (estimated tokens of document text sent).
+# Override one with TOKEN_BUDGET_<TOOL>, e.g. TOKEN_BUDGET_CLASSIFY_DOCUMENT=400
+# Tools that get a whole chunk must fit CHUNK_CHARS: numbers and punctuation
+# estimate at ~2 chars per token, so they get at least CHUNK_CHARS / 2.
+CHUNK_TOKEN_BUDGET = max(1000, CHUNK_CHARS // 2)
+TOOL_TOKEN_BUDGETS = {
+    "default": 1000,
+    "brain": 150,
+    "classify_document": 300,
+    "classify_and_extract": CHUNK_TOKEN_BUDGET,
+    "extract_invoice": CHUNK_TOKEN_BUDGET,
+    "extract_legal_doc": CHUNK_TOKEN_BUDGET,
+    "score_resume": 1000,
+    "summarize_research_paper": CHUNK_TOKEN_BUDGET,
+    "summarize_audio_note": CHUNK_TOKEN_BUDGET,
+    "summarize_unknown": CHUNK_TOKEN_BUDGET,
+}
+for _tool in TOOL_TOKEN_BUDGETS:
+    TOOL_TOKEN_BUDGETS[_tool] = int(os.getenv(f"TOKEN_BUDGET_{_tool.upper()}", TOOL_TOKEN_BUDGETS[_tool]))
+
+# PDF Text Extraction
+# Stop extracting pages once this many characters are collected (0 = whole document).
+# Defaults to what the chunked extractors can use.
+PDF_CHAR_BUDGET = int(os.getenv("PDF_CHAR_BUDGET", str(CHUNK_CHARS * CHUNK_MAX)))
+# When stopping early, still read the last pages (totals, signatures, termination)
+PDF_TAIL_PAGES = int(os.getenv("PDF_TAIL_PAGES", "2"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(8, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+PDF_PAGE_CACHE_ITEMS = int(os.getenv("PDF_PAGE_CACHE_ITEMS", "2000"))
+
+# Uploads (uploads.SpooledUpload): kept in memory up to UPLOAD_SPOOL_MAX_BYTES, then
+# spooled to a temp file; copied and hashed UPLOAD_CHUNK_BYTES at a time.
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(256 * 1024)))
+# Text uploads are decoded only up to this many characters (plus the final chunk)
+UPLOAD_TEXT_CHAR_BUDGET = int(os.getenv("UPLOAD_TEXT_CHAR_BUDGET", str(CHUNK_CHARS * CHUNK_MAX)))
+# Documents saved before uploads were spooled are keyed by the hash of their old
+# content string (PDF text, tagged base64 image, tagged transcript). Also check
+# that hash on a miss; turn off once those rows no longer matter. PDFs are checked
+# against their full text (as first stored) and their page-bounded text (stored
+# while extraction was bounded): with it off, old long PDFs are treated as new.
+LEGACY_HASH_LOOKUP = os.getenv("LEGACY_HASH_LOOKUP", "true").lower() == "true"
+
+# Image Preprocessing (imaging.py, before the vision call)
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))       # longest side sent, px
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_TILE_ASPECT = float(os.getenv("IMAGE_TILE_ASPECT", "2.5"))  # height/width above which scans are tiled
+IMAGE_TILE_OVERLAP = int(os.getenv("IMAGE_TILE_OVERLAP", "96"))   # px shared by neighbouring tiles
+IMAGE_MAX_TILES = int(os.getenv("IMAGE_MAX_TILES", "6"))
+
+# Audio Transcription (audio.py): recordings above AUDIO_SPLIT_MIN_BYTES are split
+# on silence into ~AUDIO_SEGMENT_S segments and transcribed concurrently
+AUDIO_SPLIT_MIN_BYTES = int(os.getenv("AUDIO_SPLIT_MIN_BYTES", str(4 * 1024 * 1024)))
+AUDIO_SEGMENT_S = float(os.getenv("AUDIO_SEGMENT_S", "240"))
+AUDIO_OVERLAP_S = float(os.getenv("AUDIO_OVERLAP_S", "1.5"))        # audio repeated on each side of a cut
+AUDIO_SILENCE_SEARCH_S = float(os.getenv("AUDIO_SILENCE_SEARCH_S", "20"))  # how far a cut may move to find silence
+AUDIO_CONCURRENCY = int(os.getenv("AUDIO_CONCURRENCY", "4"))
+
+# LLM Response Cache (temperature-0 completions only)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Expired rows are swept (and disk hits' access times written) once every this many puts
+LLM_CACHE_SWEEP_EVERY = int(os.getenv("LLM_CACHE_SWEEP_EVERY", "100"))
+
+# Near-Duplicate Detection (SimHash over word shingles, see neardup.py)
+# NEAR_DUP_ACTION: "off" (default), "skip" (don't process) or "reuse" (save the matched
+# doc's extraction without LLM calls). A match only counts once the matched doc's key
+# fields (parties, dates, amounts) are found in the new text. Fingerprints are stored either way.
+NEAR_DUP_ACTION = os.getenv("NEAR_DUP_ACTION", "off").lower()
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))  # differing bits out of 64
+NEAR_DUP_SHINGLE_WORDS = int(os.getenv("NEAR_DUP_SHINGLE_WORDS", "3"))
+NEAR_DUP_MIN_SHINGLES = int(os.getenv("NEAR_DUP_MIN_SHINGLES", "20"))
+
+# Local Document Classifier (classifier.py; train with `python classifier.py train`)
+# Confident local predictions skip the classify_document LLM call
+CLASSIFIER_ENABLED = os.getenv("CLASSIFIER_ENABLED", "true").lower() == "true"
+CLASSIFIER_PATH = os.getenv("CLASSIFIER_PATH", "classifier_model.npz")
+CLASSIFIER_THRESHOLD = float(os.getenv("CLASSIFIER_THRESHOLD", "0.85"))
+CLASSIFIER_FEATURES = int(os.getenv("CLASSIFIER_FEATURES", str(2 ** 18)))
+CLASSIFIER_RELOAD_S = float(os.getenv("CLASSIFIER_RELOAD_S", "30"))
+
+# Tracing (tracing.py): per-step spans returned in each state's `spans`
+# Append every span as one JSON line to this file ("" = off)
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "")
+# Prometheus text endpoint at http://METRICS_HOST:METRICS_PORT/metrics (0 = off)
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Job Queue (worker.py): `python worker.py submit <dir|glob>`, `python worker.py run`
+# Documents processed concurrently per worker process (run more processes/machines to scale out)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+# Threads for blocking work (DB round-trips, PDF parsing, reading files); 0 = asyncio's default
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))
+# Seconds an idle worker waits before polling the jobs table again
+WORKER_POLL_S = float(os.getenv("WORKER_POLL_S", "2.0"))
+# A running job whose worker went silent this long is handed to another worker
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "1800"))
+# Attempts per job before it is marked failed (API outages, crashed workers)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A failed attempt is retried after JOB_BACKOFF_S, doubling per attempt up to JOB_BACKOFF_MAX_S
+JOB_BACKOFF_S = float(os.getenv("JOB_BACKOFF_S", "30"))
+JOB_BACKOFF_MAX_S = float(os.getenv("JOB_BACKOFF_MAX_S", "1800"))
+
+# Checkpoints (checkpoints.py): each document's state is saved after every step,
+# keyed by file_hash, so a re-run resumes instead of repeating paid calls.
+# "postgres" (agent_checkpoints table, shared by all workers), "local" (SQLite file) or "off"
+CHECKPOINT_STORE = os.getenv("CHECKPOINT_STORE", "postgres").lower()
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", ".checkpoints.sqlite3")
+# Older checkpoints are ignored (the document is processed from scratch) and swept
+CHECKPOINT_TTL_S = float(os.getenv("CHECKPOINT_TTL_S", str(7 * 24 * 3600)))
+# Expired checkpoints (failed or abandoned documents) are deleted once every this many saves
+CHECKPOINT_SWEEP_EVERY = int(os.getenv("CHECKPOINT_SWEEP_EVERY", "100"))
+
+# Artifacts (artifacts.py): the text each document's extractors read (transcript,
+# OCR text, PDF text, plain text), stored compressed per file_hash
+ARTIFACTS_ENABLED = os.getenv("ARTIFACTS_ENABLED", "true").lower() == "true"
+# Bump when an extraction prompt or schema changes; `python artifacts.py backfill`
+# re-extracts every document saved under another version from its stored artifact
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")
+# Documents re-extracted concurrently by the backfill
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "8"))
+
 # Database Settings
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_NAME = os.getenv("DB_NAME", "agent_db_v2")
@@ -16,6 +207,17 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASS = os.getenv("DB_PASS", "password")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# Connection Pool (shared by Database, query_database and the dashboard)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+# Documents per flush for BatchWriter (bulk ingestion)
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "200"))
+# In-memory file_hash index in front of check_duplicate (key = hash prefix bytes)
+DUP_INDEX_ENABLED = os.getenv("DUP_INDEX_ENABLED", "true").lower() == "true"
+DUP_INDEX_KEY_BYTES = int(os.getenv("DUP_INDEX_KEY_BYTES", "8"))
+
 # Validation (Optional but recommended)
 if not GROQ_API_KEY:
     raise ValueError("❌ GROQ_API_KEY is missing from .env file")
\ No newline at end of file
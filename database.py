@@ -1,147 +1,781 @@
 # database.py
-import psycopg2
+import io
 import re  # <--- NEW IMPORT
-from psycopg2.extras import Json
+import json
+import sys
+from decimal import Decimal
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.extras import Json, execute_values
 from dateutil import parser
-from config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
+from sqlalchemy import create_engine
+from neardup import get_near_dup_index, to_db
+from config import (
+    DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT_S, DB_POOL_RECYCLE_S, DB_BATCH_SIZE,
+    DUP_INDEX_ENABLED, DUP_INDEX_KEY_BYTES, ARTIFACTS_ENABLED, PROMPT_VERSION,
+)
+
+# --- PROCESS-WIDE CONNECTION POOL ---
+# One SQLAlchemy QueuePool for the whole process. Database borrows raw psycopg2
+# connections from it, query_database and the dashboard use the engine directly.
+_engine = None
+_engine_lock = threading.Lock()
+_db_name = DB_NAME
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(
+                f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{_db_name}",
+                pool_size=DB_POOL_MIN,
+                max_overflow=max(0, DB_POOL_MAX - DB_POOL_MIN),
+                pool_timeout=DB_POOL_TIMEOUT_S,
+                pool_recycle=DB_POOL_RECYCLE_S,  # reconnect before the server drops idle conns
+                pool_pre_ping=True,              # health check on checkout, reconnects dead conns
+            )
+            _warm_pool(_engine)
+    return _engine
+
+def _warm_pool(engine):
+    # Open the minimum number of connections up front, off the per-document path
+    conns = []
+    try:
+        for _ in range(DB_POOL_MIN):
+            conns.append(engine.raw_connection())
+    except Exception as e:
+        print(f"❌ DB Connection Error: {e}")
+    finally:
+        for c in conns: c.close()
+
+def pool_status() -> str:
+    return get_engine().pool.status()
+
+def use_database(name: str):
+    """Points the pool at another database on the same server (benchmark.py's scratch database)."""
+    global _db_name
+    dispose_pool()
+    with _engine_lock:
+        _db_name = name
+
+def dispose_pool():
+    """Closes every pooled connection (e.g. after a fork or on shutdown)."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+# --- OPTIONAL TABLES ---
+# table -> exists, checked once per process
+_tables_ready = {}
+_tables_lock = threading.Lock()
+
+def table_ready(db, table: str, feature: str) -> bool:
+    """
+    Whether db has `table`. Features backed by a table that database_setup.py
+    hasn't created yet (an existing database that wasn't re-initialized) are
+    turned off with one warning, instead of failing and warning on every step.
+    Stand-ins without has_table() are trusted; if the check itself fails the
+    feature stays on and the next agent checks again.
+    """
+    has_table = getattr(db, "has_table", None)
+    if has_table is None: return True
+    with _tables_lock:
+        if table not in _tables_ready:
+            try:
+                _tables_ready[table] = has_table(table)
+            except Exception as e:
+                print(f"⚠️ Could not check for table {table}: {e}")
+                return True
+            if not _tables_ready[table]:
+                print(f"⚠️ Table {table} is missing (run database_setup.py): {feature} is off")
+        return _tables_ready[table]
+
+# --- DUPLICATE INDEX ---
+class DuplicateIndex:
+    """
+    Process-local set of known file hashes, warmed from processed_docs and updated
+    on every write. A miss still asks Postgres, since another process may have
+    written the hash since we warmed. A hit is trusted without a DB call only while
+    the index hears about deletes (LISTEN on the processed_docs_deleted trigger
+    from database_setup.py): deleted rows are evicted before each lookup, so a
+    deleted document can be ingested again. Without the trigger, or once the
+    listening connection drops, hits are confirmed in Postgres.
+    Keys are the first key_bytes bytes of the SHA-256 as an int (8 bytes by default)
+    to keep memory low; two hashes sharing that prefix is the only false-positive source.
+    """
+    def __init__(self, key_bytes: int = DUP_INDEX_KEY_BYTES):
+        self.key_bytes = max(1, min(32, key_bytes))
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.warmed = False
+        self.counters = {"hits": 0, "misses": 0, "db_hits": 0, "evicted": 0, "confirmed": 0}
+
+    def _key(self, file_hash: str) -> int:
+        return int(file_hash[:self.key_bytes * 2], 16)
+
+    def warm(self, db: "Database"):
+        with self._lock:
+            if self.warmed: return
+            # Listen first: a delete that lands while warming is still heard
+            try:
+                self._listener = db.listen_for_deletes()
+            except Exception as e:
+                print(f"⚠️ Duplicate index can't listen for deletes: {e}")
+            if self._listener is None:
+                print("⚠️ processed_docs_deleted trigger missing (run database_setup.py): duplicate hits are confirmed in Postgres")
+            # Server-side cursor: stream the column instead of loading it in one go
+            with db._cursor(name="dup_index_warm") as cur:
+                cur.itersize = 50000
+                cur.execute("SELECT file_hash FROM processed_docs WHERE file_hash IS NOT NULL")
+                for (file_hash,) in cur:
+                    self._keys.add(self._key(file_hash))
+            self.warmed = True
+            print(f"   [DB] 🗂️  Duplicate index warmed with {len(self._keys)} hashes")
+
+    def __contains__(self, file_hash: str) -> bool:
+        return self._key(file_hash) in self._keys
+
+    def add(self, file_hash: str):
+        if file_hash: self._keys.add(self._key(file_hash))
+
+    def discard(self, file_hash: str):
+        if file_hash: self._keys.discard(self._key(file_hash))
+
+    @property
+    def listening(self) -> bool:
+        """Whether hits can be trusted (deletes are being heard)."""
+        return self._listener is not None
+
+    def evict_deleted(self):
+        """Drops the hashes of rows deleted since the last call. Non-blocking: poll() only reads what already arrived."""
+        listener = self._listener
+        if listener is None: return
+        try:
+            listener.poll()
+        except Exception as e:
+            print(f"⚠️ Duplicate index stopped hearing deletes ({e}): hits are confirmed in Postgres from now on")
+            self._listener = None
+            return
+        while listener.notifies:
+            self.discard(listener.notifies.pop(0).payload)
+            self.counters["evicted"] += 1
+
+    def memory_bytes(self) -> int:
+        sample = sys.getsizeof(1 << (self.key_bytes * 8 - 1))
+        return sys.getsizeof(self._keys) + len(self._keys) * sample
+
+    def false_positive_rate(self) -> float:
+        # Chance a new hash collides with one of n stored key prefixes
+        return len(self._keys) / float(2 ** (self.key_bytes * 8))
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "size": len(self._keys),
+            "memory_bytes": self.memory_bytes(),
+            "false_positive_rate": self.false_positive_rate(),
+        }
+
+_dup_index = None
+_dup_index_lock = threading.Lock()
+
+def get_duplicate_index():
+    global _dup_index
+    if not DUP_INDEX_ENABLED: return None
+    with _dup_index_lock:
+        if _dup_index is None:
+            _dup_index = DuplicateIndex()
+    return _dup_index
 
 class Database:
     def __init__(self):
+        self.engine = get_engine()
+        self.dup_index = get_duplicate_index()
+        self.near_index = get_near_dup_index()
+
+    @contextmanager
+    def _cursor(self, name=None):
+        """Borrows a pooled connection; commits on success, rolls back on error."""
+        conn = self.engine.raw_connection()
         try:
-            self.conn = psycopg2.connect(
-                host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS, port=DB_PORT
-            )
-            self.conn.autocommit = True
-        except Exception as e:
-            print(f"❌ DB Connection Error: {e}")
+            with (conn.cursor(name) if name else conn.cursor()) as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()  # returns it to the pool
 
-    def save_audio_note(self, doc_id, data):
-        with self.conn.cursor() as cur:
+    # --- SINGLE-DOCUMENT WRITES ---
+    def save_document(self, doc_id, filename, doc_type, file_hash, data, simhash=None) -> bool:
+        """
+        Writes the processed_docs row and its child row in one transaction (one
+        round-trip each, one commit). Returns False if the file_hash already existed,
+        in which case nothing is written.
+        """
+        spec = child_table_for(doc_type)
+        with self._cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO audio_notes (doc_id, transcript, summary, sentiment)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (
-                    doc_id, 
-                    data.get('transcript', ''), 
-                    data.get('summary', ''), 
-                    data.get('sentiment', 'Neutral')
-                )
+                """INSERT INTO processed_docs (id, filename, doc_type, file_hash, simhash)
+                   VALUES (%s, %s, %s, %s, %s) ON CONFLICT (file_hash) DO NOTHING RETURNING id""",
+                (doc_id, filename, doc_type, file_hash, to_db(simhash))
             )
+            inserted = cur.fetchone() is not None
+            if inserted and spec:
+                cur.execute(_insert_sql(spec), _adapt(spec, spec.build(doc_id, data or {})))
+            if inserted: self._stamp_artifacts(cur, [file_hash])
+        # Either way the hash is now in processed_docs
+        if self.dup_index is not None: self.dup_index.add(file_hash)
+        if inserted and self.near_index is not None: self.near_index.add(simhash, doc_id)
+        return inserted
+
+    def save_audio_note(self, doc_id, data): self._save_child(AUDIO_NOTES, doc_id, data)
+    def save_research_paper(self, doc_id, data): self._save_child(RESEARCH_PAPERS, doc_id, data)
+    def save_legal_doc(self, doc_id, data): self._save_child(LEGAL_DOCS, doc_id, data)
+    def save_unknown(self, doc_id, data): self._save_child(UNKNOWN_DOCS, doc_id, data)
+    def save_invoice(self, doc_id, data): self._save_child(INVOICES, doc_id, data)
 
     def save_resume(self, doc_id, data):
         print(f"\n🔍 [DEBUG] Raw Resume Data from AI: {data}")
-
-        # 1. Aggressive Score Cleaning (Regex)
-        raw_score = str(data.get('score', 0))
         try:
-            # Find the first sequence of digits in the string
-            match = re.search(r'\d+', raw_score)
-            if match:
-                clean_score = int(match.group())
-            else:
-                clean_score = 0
-        except:
-            print(f"⚠️ Could not parse score: {raw_score}")
-            clean_score = 0
-
-        # 2. Skills Cleaning
-        skills = data.get('skills', [])
-        if isinstance(skills, str):
-            # If AI gave "Python, Java", split it into a list
-            if "," in skills:
-                skills = [s.strip() for s in skills.split(",")]
-            else:
-                skills = [skills]
-        
-        # 3. Name Cleaning
-        name = data.get('name') or data.get('candidate_name') or "Unknown Candidate"
-
-        print(f"💾 [DEBUG] Saving -> Name: {name}, Score: {clean_score}, Skills: {len(skills)} count")
-
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO resumes (doc_id, candidate_name, score, skills)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (doc_id, name, clean_score, Json(skills))
-                )
+            self._save_child(RESUMES, doc_id, data)
             print("✅ Resume saved successfully.")
         except Exception as e:
             print(f"❌ FATAL DB ERROR in save_resume: {e}")
             raise e  # Force the error to show in Streamlit
 
-   
-
     def check_duplicate(self, file_hash: str) -> bool:
-        with self.conn.cursor() as cur:
+        index = self.dup_index
+        known = False
+        if index is not None:
+            if not index.warmed: index.warm(self)
+            index.evict_deleted()
+            known = file_hash in index
+            if known and index.listening:
+                index.counters["hits"] += 1
+                return True
+            index.counters["confirmed" if known else "misses"] += 1
+
+        with self._cursor() as cur:
             cur.execute("SELECT 1 FROM processed_docs WHERE file_hash = %s", (file_hash,))
+            found = cur.fetchone() is not None
+        if index is not None:
+            if found and not known:
+                # Written by another process after we warmed
+                index.counters["db_hits"] += 1
+                index.add(file_hash)
+            elif known and not found:
+                index.discard(file_hash)  # deleted while we weren't listening
+        return found
+
+    def listen_for_deletes(self):
+        """
+        A dedicated autocommit connection LISTENing on processed_docs_deleted, or
+        None if the trigger isn't installed. Kept out of the pool: it lives as long
+        as the duplicate index.
+        """
+        with self._cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'processed_docs_deleted' "
+                        "AND tgrelid = to_regclass('processed_docs')")
+            if cur.fetchone() is None: return None
+        conn = psycopg2.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASS, dbname=_db_name)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("LISTEN processed_docs_deleted")
+        return conn
+
+    def log_process(self, doc_id, filename, doc_type, file_hash, simhash=None):
+        with self._cursor() as cur:
+            cur.execute(
+                """INSERT INTO processed_docs (id, filename, doc_type, file_hash, simhash) 
+                   VALUES (%s, %s, %s, %s, %s) ON CONFLICT (file_hash) DO NOTHING RETURNING id""",
+                (doc_id, filename, doc_type, file_hash, to_db(simhash))
+            )
+            inserted = cur.fetchone() is not None
+        if self.dup_index is not None: self.dup_index.add(file_hash)
+        if inserted and self.near_index is not None: self.near_index.add(simhash, doc_id)
+
+    # --- NEAR DUPLICATES ---
+    def find_near_duplicate(self, simhash):
+        """(doc_id, distance) of a stored document within NEAR_DUP_MAX_DISTANCE bits, or None."""
+        index = self.near_index
+        if index is None or simhash is None: return None
+        if not index.warmed: index.warm(self)
+        return index.nearest(simhash)
+
+    def fingerprints(self):
+        with self._cursor(name="near_dup_warm") as cur:
+            cur.itersize = 50000
+            cur.execute("SELECT id, simhash FROM processed_docs WHERE simhash IS NOT NULL")
+            for row in cur:
+                yield row
+
+    def load_extraction(self, doc_id):
+        """Returns (doc_type, payload) for a saved document, rebuilt from its child row, or None."""
+        with self._cursor() as cur:
+            cur.execute("SELECT doc_type FROM processed_docs WHERE id = %s", (doc_id,))
+            row = cur.fetchone()
+            spec = child_table_for(row[0]) if row else None
+            if spec is None: return None
+            cur.execute(f"SELECT {', '.join(spec.columns[1:])} FROM {spec.name} WHERE doc_id = %s", (doc_id,))
+            child = cur.fetchone()
+        if child is None: return None
+        values = dict(zip(spec.columns[1:], (_plain(v) for v in child)))
+        return row[0], spec.payload(values)
+
+    # --- INGEST CLAIMS (cross-process single-flight) ---
+    def claim_ingest(self, file_hash, owner, stale_after_s) -> bool:
+        """Claims file_hash for owner. An existing claim older than stale_after_s is taken over."""
+        with self._cursor() as cur:
+            cur.execute(
+                """INSERT INTO ingest_claims (file_hash, owner) VALUES (%s, %s)
+                   ON CONFLICT (file_hash) DO UPDATE
+                       SET owner = EXCLUDED.owner, claimed_at = CURRENT_TIMESTAMP
+                       WHERE ingest_claims.owner = EXCLUDED.owner
+                          OR ingest_claims.claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                   RETURNING owner""",
+                (file_hash, owner, stale_after_s)
+            )
             return cur.fetchone() is not None
 
-    def log_process(self, doc_id, filename, doc_type, file_hash):
-        with self.conn.cursor() as cur:
+    def release_ingest(self, file_hash, owner):
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM ingest_claims WHERE file_hash = %s AND owner = %s", (file_hash, owner))
+
+    def has_table(self, table) -> bool:
+        with self._cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            return cur.fetchone()[0]
+
+    # --- CHECKPOINTS (checkpoints.py) ---
+    def save_checkpoint(self, file_hash, step, blob):
+        with self._cursor() as cur:
             cur.execute(
-                """INSERT INTO processed_docs (id, filename, doc_type, file_hash) 
-                   VALUES (%s, %s, %s, %s) ON CONFLICT (file_hash) DO NOTHING""",
-                (doc_id, filename, doc_type, file_hash)
+                """INSERT INTO agent_checkpoints (file_hash, step, state) VALUES (%s, %s, %s)
+                   ON CONFLICT (file_hash) DO UPDATE
+                       SET step = EXCLUDED.step, state = EXCLUDED.state, updated_at = CURRENT_TIMESTAMP""",
+                (file_hash, step, blob)
             )
 
-    def save_invoice(self, doc_id, data):
-        total = data.get('total_amount')
-        try: total = float(str(total).replace(',', '').replace('$','')) 
-        except: total = 0.0
-        date = data.get('date')
-        try: date = parser.parse(str(date), dayfirst=True).strftime('%Y-%m-%d')
-        except: date = None
-        with self.conn.cursor() as cur:
+    def load_checkpoint(self, file_hash, max_age_s):
+        """(state blob, step) for file_hash, or None if there is none newer than max_age_s."""
+        with self._cursor() as cur:
             cur.execute(
-                "INSERT INTO invoices (doc_id, vendor, inv_date, total_amount, raw_data) VALUES (%s, %s, %s, %s, %s)",
-                (doc_id, data.get('vendor'), date, total, Json(data))
+                """SELECT state, step FROM agent_checkpoints
+                   WHERE file_hash = %s AND updated_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)""",
+                (file_hash, max_age_s)
             )
+            row = cur.fetchone()
+        return (bytes(row[0]), row[1]) if row else None
 
-    def save_research_paper(self, doc_id, data):
-        with self.conn.cursor() as cur:
+    def delete_checkpoint(self, file_hash):
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM agent_checkpoints WHERE file_hash = %s", (file_hash,))
+
+    def sweep_checkpoints(self, max_age_s) -> int:
+        """Deletes checkpoints older than max_age_s; returns how many."""
+        with self._cursor() as cur:
+            cur.execute(
+                "DELETE FROM agent_checkpoints WHERE updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+                (max_age_s,)
+            )
+            return cur.rowcount
+
+    # --- ARTIFACTS (artifacts.py) ---
+    def save_artifact(self, file_hash, kind, blob, chars):
+        """
+        Stores the text unstamped (or keeps the existing stamp): prompt_version is
+        set once an extraction made from it is saved (save_document, BatchWriter,
+        replace_extraction), so a reused transcript/OCR text gets the version of
+        the extraction that used it, not the one it was first stored under.
+        """
+        with self._cursor() as cur:
             cur.execute(
-                "INSERT INTO research_papers (doc_id, title, summary) VALUES (%s, %s, %s)",
-                (doc_id, data.get('title', 'Unknown Title'), data.get('summary', 'No summary available.'))
+                """INSERT INTO artifacts (file_hash, kind, data, chars) VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (file_hash, kind) DO UPDATE
+                       SET data = EXCLUDED.data, chars = EXCLUDED.chars, updated_at = CURRENT_TIMESTAMP""",
+                (file_hash, kind, blob, chars)
             )
 
-    def save_legal_doc(self, doc_id, data):
-        # Handle dates safely
-        def parse_date(d):
-            try: return parser.parse(str(d)).strftime('%Y-%m-%d')
-            except: return None
+    def _stamp_artifacts(self, cur, file_hashes) -> bool:
+        """Stamps the artifacts of just-saved documents with the PROMPT_VERSION their extraction used."""
+        if not ARTIFACTS_ENABLED or not file_hashes or not table_ready(self, "artifacts", "ARTIFACTS_ENABLED"): return False
+        cur.execute(
+            "UPDATE artifacts SET prompt_version = %s, updated_at = CURRENT_TIMESTAMP WHERE file_hash = ANY(%s)",
+            (PROMPT_VERSION, list(file_hashes))
+        )
+        return True
 
-        eff_date = parse_date(data.get('effective_date'))
-        exp_date = parse_date(data.get('expiration_date'))
-        
-        with self.conn.cursor() as cur:
+    def load_artifact(self, file_hash, kind):
+        with self._cursor() as cur:
+            cur.execute("SELECT data FROM artifacts WHERE file_hash = %s AND kind = %s", (file_hash, kind))
+            row = cur.fetchone()
+        return bytes(row[0]) if row else None
+
+    def stale_artifacts(self, prompt_version, doc_types=None, limit=None):
+        """(doc_id, doc_type, file_hash, kind) of saved documents whose extraction predates prompt_version."""
+        sql = """SELECT p.id, p.doc_type, a.file_hash, a.kind
+                   FROM artifacts a JOIN processed_docs p ON p.file_hash = a.file_hash
+                   WHERE a.prompt_version IS DISTINCT FROM %s"""
+        params = [prompt_version]
+        if doc_types:
+            sql += " AND p.doc_type = ANY(%s)"
+            params.append(list(doc_types))
+        sql += " ORDER BY p.processed_at"
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with self._cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def replace_extraction(self, doc_id, doc_type, data, file_hash, kind, prompt_version) -> bool:
+        """
+        Swaps a saved document's child row for a new extraction and stamps its
+        artifact with prompt_version, in one transaction. False if the type has no child table.
+        """
+        spec = child_table_for(doc_type)
+        if spec is None: return False
+        with self._cursor() as cur:
+            cur.execute(f"DELETE FROM {spec.name} WHERE doc_id = %s", (doc_id,))
+            cur.execute(_insert_sql(spec), _adapt(spec, spec.build(doc_id, data or {})))
             cur.execute(
-                """
-                INSERT INTO legal_docs 
-                (doc_id, document_type, parties, effective_date, expiration_date, key_clauses, summary)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    doc_id,
-                    data.get('document_type', 'Unknown'),
-                    data.get('parties', []),
-                    eff_date,
-                    exp_date,
-                    Json(data.get('key_clauses', [])),
-                    data.get('summary', '')
-                )
+                "UPDATE artifacts SET prompt_version = %s, updated_at = CURRENT_TIMESTAMP WHERE file_hash = %s AND kind = %s",
+                (prompt_version, file_hash, kind)
+            )
+        return True
+
+    # --- JOB QUEUE (worker.py) ---
+    def submit_jobs(self, paths, priority=0) -> int:
+        """Queues one job per path; paths already pending or running are skipped. Returns the number queued."""
+        if not paths: return 0
+        with self._cursor() as cur:
+            rows = execute_values(
+                cur,
+                """INSERT INTO jobs (path, priority) VALUES %s
+                   ON CONFLICT (path) WHERE status IN ('pending', 'running') DO NOTHING RETURNING id""",
+                [(p, priority) for p in paths], fetch=True
+            )
+            return len(rows)
+
+    def claim_jobs(self, worker, limit, stale_after_s, max_attempts):
+        """
+        Marks up to limit jobs running for worker and returns (id, path, attempts).
+        SKIP LOCKED lets any number of workers claim concurrently without blocking
+        on, or double-claiming, each other's rows. Pending jobs backing off
+        (not_before in the future) are left alone. Running jobs older than
+        stale_after_s without a heartbeat (their worker died) are claimed again
+        until max_attempts; the ones out of attempts are failed, skipping rows
+        another worker has locked as well.
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                """UPDATE jobs SET status = 'failed', finished_at = CURRENT_TIMESTAMP,
+                          error = COALESCE(error, 'worker lost') || ' (attempts exhausted)'
+                   WHERE id IN (
+                       SELECT id FROM jobs
+                       WHERE status = 'running' AND attempts >= %s
+                         AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                       FOR UPDATE SKIP LOCKED
+                   )""",
+                (max_attempts, stale_after_s)
+            )
+            cur.execute(
+                """UPDATE jobs SET status = 'running', worker = %s, attempts = attempts + 1,
+                          started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP, finished_at = NULL
+                   WHERE id IN (
+                       SELECT id FROM jobs
+                       WHERE (status = 'pending' AND (not_before IS NULL OR not_before <= CURRENT_TIMESTAMP))
+                          OR (status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                       ORDER BY priority DESC, id
+                       LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING id, path, attempts""",
+                (worker, stale_after_s, limit)
             )
-            
-    def save_unknown(self, doc_id, data):
-        with self.conn.cursor() as cur:
+            return sorted(cur.fetchall(), key=lambda r: r[0])
+
+    def heartbeat_jobs(self, worker, job_ids):
+        """Keeps worker's running jobs from being reclaimed as stale."""
+        if not job_ids: return
+        with self._cursor() as cur:
             cur.execute(
-                "INSERT INTO unknown_docs (doc_id, summary, extracted_keywords) VALUES (%s, %s, %s)",
-                (doc_id, data.get('summary', ''), Json(data.get('keywords', [])))
+                "UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ANY(%s) AND worker = %s AND status = 'running'",
+                (list(job_ids), worker)
             )
 
+    def finish_job(self, job_id, worker, status, result_status=None, doc_id=None, doc_type=None, error=None,
+                   retry_after_s=0):
+        """
+        Records a job's outcome; status 'pending' puts it back in the queue for
+        another attempt, claimable again after retry_after_s. Ignored if the job
+        was reclaimed from worker meanwhile.
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                """UPDATE jobs SET status = %s, result_status = %s, doc_id = %s, doc_type = %s, error = %s,
+                          finished_at = CASE WHEN %s = 'pending' THEN NULL ELSE CURRENT_TIMESTAMP END,
+                          not_before = CASE WHEN %s = 'pending'
+                                            THEN CURRENT_TIMESTAMP + make_interval(secs => %s) END
+                   WHERE id = %s AND worker = %s AND status = 'running'""",
+                (status, result_status, doc_id, doc_type, error, status, status, retry_after_s, job_id, worker)
+            )
+
+    def job_counts(self):
+        """{status: count} over the jobs table."""
+        with self._cursor() as cur:
+            cur.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            return dict(cur.fetchall())
+
+    # --- CLASSIFIER TRAINING DATA ---
+    def classifier_examples(self):
+        """
+        Yields (doc_type, compressed text) for every saved document with a stored
+        artifact: the same raw text classify_document saw (OCR text for images).
+        Decode with artifacts.unpack. Audio is never classified, so transcripts are left out.
+        """
+        with self._cursor(name="classifier_examples") as cur:
+            cur.itersize = 1000
+            cur.execute("""
+                SELECT DISTINCT ON (p.id) p.doc_type, a.data
+                  FROM processed_docs p JOIN artifacts a ON a.file_hash = p.file_hash
+                 WHERE a.kind IN ('text', 'pdf_text', 'ocr')
+                 ORDER BY p.id, a.kind = 'ocr'
+            """)
+            for doc_type, data in cur:
+                yield doc_type, bytes(data)
+
+    def _save_child(self, spec, doc_id, data):
+        with self._cursor() as cur:
+            cur.execute(_insert_sql(spec), _adapt(spec, spec.build(doc_id, data)))
+
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        # Connections belong to the shared pool; use dispose_pool() to close them
+        pass
+
+# --- CHILD TABLE ROW BUILDERS ---
+# Each returns plain Python values in column order; JSON columns are wrapped
+# at insert time (or serialized for COPY).
+
+def _parse_date(d, dayfirst=False):
+    try: return parser.parse(str(d), dayfirst=dayfirst).strftime('%Y-%m-%d')
+    except: return None
+
+def _invoice_row(doc_id, data):
+    total = data.get('total_amount')
+    try: total = float(str(total).replace(',', '').replace('$','')) 
+    except: total = 0.0
+    return (doc_id, data.get('vendor'), _parse_date(data.get('date'), dayfirst=True), total, data)
+
+def _resume_row(doc_id, data):
+    # 1. Aggressive Score Cleaning (Regex)
+    raw_score = str(data.get('score', 0))
+    try:
+        # Find the first sequence of digits in the string
+        match = re.search(r'\d+', raw_score)
+        clean_score = int(match.group()) if match else 0
+    except:
+        print(f"⚠️ Could not parse score: {raw_score}")
+        clean_score = 0
+
+    # 2. Skills Cleaning
+    skills = data.get('skills', [])
+    if isinstance(skills, str):
+        # If AI gave "Python, Java", split it into a list
+        if "," in skills:
+            skills = [s.strip() for s in skills.split(",")]
+        else:
+            skills = [skills]
+
+    # 3. Name Cleaning
+    name = data.get('name') or data.get('candidate_name') or "Unknown Candidate"
+    return (doc_id, name, clean_score, skills)
+
+def _research_row(doc_id, data):
+    return (doc_id, data.get('title', 'Unknown Title'), data.get('summary', 'No summary available.'))
+
+def _audio_row(doc_id, data):
+    return (doc_id, data.get('transcript', ''), data.get('summary', ''), data.get('sentiment', 'Neutral'))
+
+def _legal_row(doc_id, data):
+    return (
+        doc_id,
+        data.get('document_type', 'Unknown'),
+        data.get('parties', []),
+        _parse_date(data.get('effective_date')),
+        _parse_date(data.get('expiration_date')),
+        data.get('key_clauses', []),
+        data.get('summary', '')
+    )
+
+def _unknown_row(doc_id, data):
+    return (doc_id, data.get('summary', ''), data.get('keywords', []))
+
+def _plain(value):
+    # DB values back to what the extractors produce (dates as strings, numbers as float)
+    if hasattr(value, "isoformat"): return value.isoformat()
+    if isinstance(value, Decimal): return float(value)
+    return value
+
+class ChildTable:
+    def __init__(self, name, columns, json_columns, build, payload):
+        self.name = name
+        self.columns = columns
+        self.json_idx = {columns.index(c) for c in json_columns}
+        self.build = build
+        self.payload = payload  # child row (column -> value) back to the extractor's dict
+
+INVOICES = ChildTable(
+    "invoices", ("doc_id", "vendor", "inv_date", "total_amount", "raw_data"), ("raw_data",), _invoice_row,
+    lambda r: r["raw_data"] or {"vendor": r["vendor"], "date": r["inv_date"], "total_amount": r["total_amount"]},
+)
+RESUMES = ChildTable(
+    "resumes", ("doc_id", "candidate_name", "score", "skills"), ("skills",), _resume_row,
+    lambda r: {"name": r["candidate_name"], "score": r["score"], "skills": r["skills"] or []},
+)
+RESEARCH_PAPERS = ChildTable("research_papers", ("doc_id", "title", "summary"), (), _research_row, dict)
+AUDIO_NOTES = ChildTable("audio_notes", ("doc_id", "transcript", "summary", "sentiment"), (), _audio_row, dict)
+LEGAL_DOCS = ChildTable(
+    "legal_docs",
+    ("doc_id", "document_type", "parties", "effective_date", "expiration_date", "key_clauses", "summary"),
+    ("key_clauses",), _legal_row,
+    lambda r: {**r, "parties": r["parties"] or [], "key_clauses": r["key_clauses"] or []},
+)
+UNKNOWN_DOCS = ChildTable(
+    "unknown_docs", ("doc_id", "summary", "extracted_keywords"), ("extracted_keywords",), _unknown_row,
+    lambda r: {"summary": r["summary"], "keywords": r["extracted_keywords"] or []},
+)
+
+def child_table_for(doc_type):
+    """Same substring matching ToolRegistry.save_data has always used."""
+    doc_type = doc_type or ""
+    if "INVOICE" in doc_type: return INVOICES
+    if "RESUME" in doc_type: return RESUMES
+    if "RESEARCH" in doc_type: return RESEARCH_PAPERS
+    if "AUDIO" in doc_type: return AUDIO_NOTES
+    if "LEGAL" in doc_type: return LEGAL_DOCS
+    if "OTHER" in doc_type: return UNKNOWN_DOCS
+    return None
+
+def _insert_sql(spec, values_placeholder=None):
+    cols = ", ".join(spec.columns)
+    values = values_placeholder or "(" + ", ".join(["%s"] * len(spec.columns)) + ")"
+    return f"INSERT INTO {spec.name} ({cols}) VALUES {values}"
+
+def _adapt(spec, row):
+    return tuple(Json(v) if i in spec.json_idx else v for i, v in enumerate(row))
+
+def _copy_field(value, is_json):
+    # CSV field for COPY: \N is NULL, everything else quoted
+    if value is None: return r"\N"
+    if is_json:
+        value = json.dumps(value)
+    elif isinstance(value, (list, tuple)):
+        # TEXT[] literal: {"a","b"}
+        value = "{" + ",".join('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in value) + "}"
+    return '"' + str(value).replace('"', '""') + '"'
+
+# --- BATCHED WRITES ---
+class BatchWriter:
+    """
+    Buffers documents and writes them in one transaction per flush: a multi-row
+    INSERT into processed_docs, then one multi-row INSERT (or COPY) per child table.
+    Rows whose file_hash already exists are dropped together with their child row.
+    If the batch transaction fails (one oversized title, one overflowing amount),
+    each document is retried on its own with save_document, so only the bad ones fail.
+    Thread-safe; add() flushes automatically once batch_size documents are buffered.
+    """
+    def __init__(self, db: "Database" = None, batch_size: int = DB_BATCH_SIZE, use_copy: bool = False):
+        self.db = db or Database()
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self._buffer = []
+        self._lock = threading.Lock()
+        self.outcomes = {}  # doc_id -> "saved" | "duplicate" | "failed: <error>"
+        self.stats = {"flushes": 0, "docs_written": 0, "duplicates": 0, "failed": 0, "statements": 0}
+
+    def add(self, doc_id, filename, doc_type, file_hash, data, simhash=None):
+        with self._lock:
+            self._buffer.append((doc_id, filename, doc_type, file_hash, data or {}, simhash))
+            full = len(self._buffer) >= self.batch_size
+        if full: self.flush()
+
+    def flush(self) -> dict:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch: return self.stats
+
+        try:
+            with self.db._cursor() as cur:
+                written = self._write(cur, batch)
+            for doc in batch:
+                self.outcomes[doc[0]] = "saved" if doc[0] in written else "duplicate"
+                if self.db.dup_index is not None: self.db.dup_index.add(doc[3])
+                if self.db.near_index is not None and doc[0] in written: self.db.near_index.add(doc[5], doc[0])
+            self.stats["docs_written"] += len(written)
+            self.stats["duplicates"] += len(batch) - len(written)
+        except Exception as e:
+            print(f"⚠️ Batch flush failed ({len(batch)} docs): {str(e).strip()}. Retrying one document at a time...")
+            self._write_each(batch)
+        self.stats["flushes"] += 1
+        return self.stats
+
+    def _write_each(self, batch):
+        for doc_id, filename, doc_type, file_hash, data, simhash in batch:
+            try:
+                saved = self.db.save_document(doc_id, filename, doc_type, file_hash, data, simhash)
+            except Exception as e:
+                print(f"❌ Save failed for {doc_id}: {str(e).strip()}")
+                self.outcomes[doc_id] = f"failed: {str(e).strip()}"
+                self.stats["failed"] += 1
+                continue
+            self.outcomes[doc_id] = "saved" if saved else "duplicate"
+            self.stats["docs_written" if saved else "duplicates"] += 1
+            self.stats["statements"] += 2 if saved else 1
+
+    def _write(self, cur, batch):
+        # Same file_hash twice in one batch would conflict inside the statement
+        seen, parents = set(), []
+        for doc_id, filename, doc_type, file_hash, _, simhash in batch:
+            if file_hash in seen: continue
+            seen.add(file_hash)
+            parents.append((doc_id, filename, doc_type, file_hash, to_db(simhash)))
+
+        inserted = execute_values(
+            cur,
+            """INSERT INTO processed_docs (id, filename, doc_type, file_hash, simhash) VALUES %s
+               ON CONFLICT (file_hash) DO NOTHING RETURNING id""",
+            parents, fetch=True, page_size=max(len(parents), 1)
+        )
+        self.stats["statements"] += 1
+        written = {r[0] for r in inserted}
+
+        by_table = {}
+        for doc_id, _, doc_type, _, data, _ in batch:
+            spec = child_table_for(doc_type)
+            if spec and doc_id in written:
+                by_table.setdefault(spec, []).append(spec.build(doc_id, data))
+
+        for spec, rows in by_table.items():
+            if self.use_copy:
+                buf = io.StringIO()
+                for row in rows:
+                    buf.write(",".join(_copy_field(v, i in spec.json_idx) for i, v in enumerate(row)) + "\n")
+                buf.seek(0)
+                cur.copy_expert(
+                    f"COPY {spec.name} ({', '.join(spec.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf
+                )
+            else:
+                execute_values(cur, _insert_sql(spec, "%s"), [_adapt(spec, r) for r in rows], page_size=len(rows))
+            self.stats["statements"] += 1
+
+        stamped = [file_hash for doc_id, _, _, file_hash, _, _ in batch if doc_id in written]
+        if self.db._stamp_artifacts(cur, stamped): self.stats["statements"] += 1
+        return written
@@ -67,9 +67,27 @@ def create_tables():
                 filename VARCHAR(255),
                 doc_type VARCHAR(50),
                 file_hash VARCHAR(64) UNIQUE,
+                simhash BIGINT,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
+        # Databases created before near-duplicate detection
+        cur.execute("ALTER TABLE processed_docs ADD COLUMN IF NOT EXISTS simhash BIGINT;")
+        # Deleted rows are announced, so each process's duplicate index (database.DuplicateIndex)
+        # forgets them and the file can be ingested again
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION notify_processed_docs_deleted() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('processed_docs_deleted', COALESCE(OLD.file_hash, ''));
+                RETURN OLD;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS processed_docs_deleted ON processed_docs;")
+        cur.execute("""
+            CREATE TRIGGER processed_docs_deleted AFTER DELETE ON processed_docs
+            FOR EACH ROW EXECUTE FUNCTION notify_processed_docs_deleted();
+        """)
 
         # --- 3. CHILD TABLES ---
 
@@ -147,6 +165,71 @@ def create_tables():
             );
         """)
 
+        # Ingest Claims (one worker per file_hash at a time)
+        print("   -> Checking 'ingest_claims' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_claims (
+                file_hash VARCHAR(64) PRIMARY KEY,
+                owner VARCHAR(128),
+                claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+
+        # Job Queue (worker.py): files waiting for / being processed by headless workers
+        print("   -> Checking 'jobs' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                path TEXT NOT NULL,                              -- readable by every worker
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',   -- pending | running | done | failed
+                priority INTEGER NOT NULL DEFAULT 0,             -- higher first
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker VARCHAR(128),
+                result_status VARCHAR(32),                       -- saved | skipped | incomplete | ...
+                doc_id VARCHAR(36),
+                doc_type VARCHAR(50),
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,                          -- refreshed while a worker holds it
+                finished_at TIMESTAMP,
+                not_before TIMESTAMP                             -- retry backoff: not claimed before this
+            );
+        """)
+        # Job tables created before retry backoff
+        cur.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS not_before TIMESTAMP;")
+        cur.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (priority DESC, id) WHERE status = 'pending';")
+        # A path can be queued again once its previous job has finished
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_path ON jobs (path) WHERE status IN ('pending', 'running');")
+
+        # Checkpoints (checkpoints.py): zlib-compressed JSON state per file_hash
+        print("   -> Checking 'agent_checkpoints' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS agent_checkpoints (
+                file_hash VARCHAR(64) PRIMARY KEY,
+                step INTEGER NOT NULL,
+                state BYTEA NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # Age-based sweep of expired checkpoints
+        cur.execute("CREATE INDEX IF NOT EXISTS agent_checkpoints_updated ON agent_checkpoints (updated_at);")
+
+        # Artifacts (artifacts.py): zlib-compressed text the extractors read, per file_hash
+        print("   -> Checking 'artifacts' table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                file_hash VARCHAR(64) NOT NULL,
+                kind VARCHAR(16) NOT NULL,          -- transcript | ocr | pdf_text | text
+                data BYTEA NOT NULL,
+                chars INTEGER,
+                prompt_version VARCHAR(32),         -- PROMPT_VERSION of the saved extraction
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_hash, kind)
+            );
+        """)
+
         print("✅ All tables created successfully!")
         cur.close()
 
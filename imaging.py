@@ -0,0 +1,149 @@
+# imaging.py
+import base64
+import io
+import threading
+import time
+from typing import Dict, List, Tuple
+from config import IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY, IMAGE_TILE_ASPECT, IMAGE_TILE_OVERLAP, IMAGE_MAX_TILES
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow missing: images are sent as uploaded
+    Image = None
+
+_MIME_BY_FORMAT = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+def prepare_image(data: bytes) -> Tuple[List[Tuple[str, str]], Dict]:
+    """
+    Turns an uploaded image into what the vision model needs: upright (EXIF
+    orientation applied), no larger than IMAGE_MAX_SIDE, recompressed as JPEG.
+    Tall scans (height/width > IMAGE_TILE_ASPECT) are cut top to bottom into
+    overlapping tiles. Returns ([(base64, mime), ...], stats).
+    """
+    start = time.perf_counter()
+    original = len(data)
+    tiles = _tiles(data) if Image is not None else None
+    if tiles is None:
+        tiles = [(base64.b64encode(data).decode("ascii"), _sniff_mime(data))]
+    sent = sum(len(b64) * 3 // 4 for b64, _ in tiles)
+    stats = {
+        "original_bytes": original,
+        "sent_bytes": sent,
+        "bytes_saved": original - sent,
+        "tiles": len(tiles),
+        "preprocess_s": time.perf_counter() - start,
+    }
+    image_stats.record(stats)
+    print(f"   [IMG] 🖼️  {original / 1024:.0f} KB -> {sent / 1024:.0f} KB in {len(tiles)} tile(s), "
+          f"{stats['preprocess_s']:.2f}s")
+    return tiles, stats
+
+# A tile overlap (IMAGE_TILE_OVERLAP px) holds a few lines of text at most
+_OVERLAP_LINES = 5
+
+def join_tile_texts(texts: List[str]) -> str:
+    """
+    Concatenates per-tile text. Only the overlap is de-duplicated: the longest
+    run of lines (up to _OVERLAP_LINES) that ends one tile and starts the next
+    is kept once, so lines that really repeat (two identical items, a header
+    on every section) survive.
+    """
+    out: List[str] = []
+    for text in texts:
+        lines = (text or "").splitlines()
+        head = [i for i, l in enumerate(lines) if l.strip()][:_OVERLAP_LINES]
+        tail = []
+        for l in reversed(out):
+            if len(tail) == len(head): break
+            if l.strip(): tail.insert(0, l.strip())
+        for k in range(min(len(head), len(tail)), 0, -1):
+            if tail[-k:] == [lines[i].strip() for i in head[:k]]:
+                lines = lines[head[k - 1] + 1:]
+                break
+        out.extend(lines)
+    return "\n".join(out)
+
+# --- HELPERS ---
+def _tiles(data: bytes):
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        # Rotate before anything looks at the size: tiling and the as-is shortcut need the upright image
+        rotated = img.getexif().get(0x0112, 1) not in (None, 1)
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        print(f"⚠️ Image preprocessing skipped: {e}")
+        return None
+
+    w, h = img.size
+    if h / max(1, w) > IMAGE_TILE_ASPECT:
+        # Tall scan: full width (capped), strips of at most IMAGE_MAX_SIDE tall
+        scale = min(1.0, IMAGE_MAX_SIDE / w)
+        img = _resize(img, scale)
+        w, h = img.size
+        step = max(1, IMAGE_MAX_SIDE - IMAGE_TILE_OVERLAP)
+        tops = list(range(0, max(1, h - IMAGE_TILE_OVERLAP), step))
+        if len(tops) > IMAGE_MAX_TILES:
+            # Too many strips: shrink the whole scan so it fits in IMAGE_MAX_TILES
+            img = _resize(img, IMAGE_MAX_TILES * step / h)
+            w, h = img.size
+            tops = list(range(0, max(1, h - IMAGE_TILE_OVERLAP), step))[:IMAGE_MAX_TILES]
+        parts = [img.crop((0, top, w, min(h, top + IMAGE_MAX_SIDE))) for top in tops]
+        return [(_encode(p), "image/jpeg") for p in parts]
+
+    scale = min(1.0, IMAGE_MAX_SIDE / max(w, h))
+    encoded = _encode(_resize(img, scale))
+    if scale == 1.0 and not rotated and fmt in _MIME_BY_FORMAT and len(encoded) * 3 // 4 >= len(data):
+        # Already small, upright, and re-encoding didn't help: send it as is, labelled correctly
+        return [(base64.b64encode(data).decode("ascii"), _MIME_BY_FORMAT[fmt])]
+    return [(encoded, "image/jpeg")]
+
+def _resize(img, scale: float):
+    if scale >= 1.0: return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS)
+
+def _encode(img) -> str:
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # JPEG has no alpha: flatten onto white so transparent text stays readable
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img.convert("RGBA"), mask=img.convert("RGBA").split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+def _sniff_mime(data: bytes) -> str:
+    if data[:8] == b"\x89PNG\r\n\x1a\n": return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP": return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"): return "image/gif"
+    return "image/jpeg"
+
+class ImageStats:
+    """Totals across every prepared image, plus vision-call latency (recorded by tools.py)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {"images": 0, "tiles": 0, "original_bytes": 0, "sent_bytes": 0,
+                       "bytes_saved": 0, "preprocess_s": 0.0, "vision_s": 0.0}
+
+    def record(self, stats: Dict):
+        with self._lock:
+            self.totals["images"] += 1
+            for k in ("tiles", "original_bytes", "sent_bytes", "bytes_saved", "preprocess_s"):
+                self.totals[k] += stats[k]
+
+    def record_vision(self, seconds: float):
+        with self._lock: self.totals["vision_s"] += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            n = self.totals["images"]
+            return {
+                **self.totals,
+                "avg_preprocess_s": self.totals["preprocess_s"] / n if n else 0.0,
+                "avg_vision_s": self.totals["vision_s"] / n if n else 0.0,
+            }
+
+image_stats = ImageStats()
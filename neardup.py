@@ -0,0 +1,193 @@
+# neardup.py
+import hashlib
+import re
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from dateutil import parser as date_parser
+from config import NEAR_DUP_ACTION, NEAR_DUP_MAX_DISTANCE, NEAR_DUP_MIN_SHINGLES, NEAR_DUP_SHINGLE_WORDS
+
+BITS = 64
+_WORD_RE = re.compile(r"\w+")
+_BIT_SHIFTS = np.arange(BITS, dtype=np.uint64)
+
+def simhash(content: str, shingle_words: int = NEAR_DUP_SHINGLE_WORDS,
+            min_shingles: int = NEAR_DUP_MIN_SHINGLES) -> Optional[int]:
+    """
+    64-bit SimHash over word shingles (unsigned int). Documents that differ in a
+    few words land a few bits apart. Returns None for images (base64, not text)
+    and for texts too short for the fingerprint to mean anything.
+    """
+    if not content or "[METADATA: IMAGE_Base64_START]" in content: return None
+    words = _WORD_RE.findall(content.lower())
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(len(words) - shingle_words + 1)}
+    if len(shingles) < min_shingles: return None
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    # Per bit: +1 for every shingle hash with the bit set, -1 otherwise
+    ones = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).sum(axis=0, dtype=np.int64)
+    bits = (2 * ones > len(shingles)).astype(np.uint64)
+    return int((bits << _BIT_SHIFTS).sum(dtype=np.uint64))
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+# Postgres BIGINT is signed
+def to_db(fp: Optional[int]) -> Optional[int]:
+    if fp is None: return None
+    return fp - (1 << BITS) if fp >= (1 << (BITS - 1)) else fp
+
+def from_db(value: int) -> int:
+    return value + (1 << BITS) if value < 0 else value
+
+class SimHashIndex:
+    """
+    In-memory Hamming-distance index over stored fingerprints, warmed from
+    processed_docs.simhash and updated on every write.
+    The 64 bits are cut into max_distance + 1 blocks: two fingerprints within
+    max_distance bits must agree exactly on at least one block (pigeonhole), so a
+    lookup only compares against the docs sharing a block value. With 16-bit
+    blocks that is ~15 candidates per block at a million docs.
+    """
+    def __init__(self, max_distance: int = NEAR_DUP_MAX_DISTANCE):
+        self.max_distance = max(0, min(BITS - 1, max_distance))
+        n_blocks = self.max_distance + 1
+        edges = [round(i * BITS / n_blocks) for i in range(n_blocks + 1)]
+        self._blocks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables: List[Dict[int, array]] = [{} for _ in self._blocks]
+        self._fps = array("Q")
+        self._doc_ids: List[str] = []
+        self._lock = threading.Lock()
+        self.warmed = False
+        self.counters = {"lookups": 0, "matches": 0, "candidates": 0, "lookup_s": 0.0}
+
+    def warm(self, db):
+        with self._lock:
+            if self.warmed: return
+            n = 0
+            for doc_id, value in db.fingerprints():
+                self._add(from_db(value), doc_id)
+                n += 1
+            self.warmed = True
+            print(f"   [DB] 🧬 Near-duplicate index warmed with {n} fingerprints")
+
+    def add(self, fp: Optional[int], doc_id: str):
+        if fp is None: return
+        with self._lock: self._add(fp, doc_id)
+
+    def nearest(self, fp: int) -> Optional[Tuple[str, int]]:
+        """Returns (doc_id, distance) of the closest stored doc within max_distance, or None."""
+        start = time.perf_counter()
+        best, seen = None, set()
+        with self._lock:
+            for table, (shift, mask) in zip(self._tables, self._blocks):
+                for pos in table.get((fp >> shift) & mask, ()):
+                    if pos in seen: continue
+                    seen.add(pos)
+                    d = hamming(fp, self._fps[pos])
+                    if d <= self.max_distance and (best is None or d < best[1]):
+                        best = (self._doc_ids[pos], d)
+            self.counters["lookups"] += 1
+            self.counters["candidates"] += len(seen)
+            self.counters["matches"] += int(best is not None)
+            self.counters["lookup_s"] += time.perf_counter() - start
+        return best
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["lookups"]
+            return {
+                **self.counters,
+                "size": len(self._fps),
+                "max_distance": self.max_distance,
+                "avg_lookup_us": self.counters["lookup_s"] / lookups * 1e6 if lookups else 0.0,
+                "avg_candidates": self.counters["candidates"] / lookups if lookups else 0.0,
+            }
+
+    def _add(self, fp: int, doc_id: str):
+        pos = len(self._fps)
+        self._fps.append(fp)
+        self._doc_ids.append(doc_id)
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            bucket = table.get((fp >> shift) & mask)
+            if bucket is None:
+                bucket = table[(fp >> shift) & mask] = array("I")
+            bucket.append(pos)
+
+# --- MATCH CONFIRMATION ---
+# Fields of the matched document's saved extraction that must reappear in the new
+# text before it counts as the same document: two invoices off one template can be
+# a few bits apart and differ only in their total or date. Types without any
+# (audio, unknown) are never confirmed.
+KEY_FIELDS = {
+    "INVOICE": {"vendor": "text", "date": "date", "total_amount": "amount"},
+    "LEGAL": {"parties": "text", "effective_date": "date", "expiration_date": "date"},
+    "RESUME": {"name": "text"},
+    "RESEARCH": {"title": "text"},
+}
+_NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_DATE_RE = re.compile(
+    r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"
+    r"|[A-Za-z]{3,9}\.? \d{1,2}(?:st|nd|rd|th)?,? \d{4}|\d{1,2}(?:st|nd|rd|th)? [A-Za-z]{3,9}\.?,? \d{4}"
+)
+
+def confirm_match(doc_type: str, data: Dict, content: str) -> bool:
+    """
+    True if every key field (parties, dates, amounts) of the matched document's
+    extraction `data` appears in `content`, and there is at least one to check.
+    """
+    fields = next((f for marker, f in KEY_FIELDS.items() if marker in (doc_type or "")), None)
+    if not fields or not content: return False
+    text, numbers, dates = _normalize(content), None, None
+    checked = 0
+    for field, kind in fields.items():
+        values = data.get(field)
+        for value in values if isinstance(values, list) else [values]:
+            if value in (None, "", 0, 0.0): continue
+            if kind == "amount":
+                if numbers is None: numbers = _numbers(content)
+                try: found = any(abs(float(str(value).replace(",", "").replace("$", "")) - n) < 0.005 for n in numbers)
+                except ValueError: found = _normalize(value) in text
+            elif kind == "date":
+                if dates is None: dates = _dates(content)
+                day = _parse_date(str(value))
+                found = day in dates if day else _normalize(value) in text
+            else:
+                found = bool(_normalize(value)) and _normalize(value) in text
+            if not found: return False
+            checked += 1
+    return checked > 0
+
+def _normalize(value) -> str:
+    return " " + " ".join(_WORD_RE.findall(str(value).lower())) + " "
+
+def _numbers(content: str) -> set:
+    return {float(m.replace(",", "")) for m in _NUMBER_RE.findall(content)}
+
+def _parse_date(value: str):
+    try: return date_parser.parse(value).date()
+    except (ValueError, OverflowError): return None
+
+def _dates(content: str) -> set:
+    found = set()
+    for m in _DATE_RE.findall(content):
+        for dayfirst in (False, True):
+            try: found.add(date_parser.parse(m, dayfirst=dayfirst).date())
+            except (ValueError, OverflowError): pass
+    return found
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_near_dup_index() -> Optional[SimHashIndex]:
+    global _index
+    if NEAR_DUP_ACTION == "off": return None
+    with _index_lock:
+        if _index is None:
+            _index = SimHashIndex()
+    return _index
@@ -0,0 +1,122 @@
+# pdf_text.py
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Union
+from pypdf import PdfReader
+from config import PDF_CHAR_BUDGET, PDF_TAIL_PAGES, PDF_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGE_CACHE_ITEMS
+
+# (pdf sha256, page index) -> extracted text, LRU-bounded
+_page_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def extract_pdf_text(data: Union[bytes, BinaryIO], char_budget: Optional[int] = PDF_CHAR_BUDGET,
+                     digest: Optional[str] = None) -> str:
+    """
+    Returns the PDF's text, pages joined by newlines. `data` is the file's bytes
+    or a seekable binary file (pass its sha256 as `digest` to skip re-hashing).
+    With a char_budget, pages are extracted in order only until the budget is met,
+    plus the last PDF_TAIL_PAGES pages (totals and termination clauses sit at the
+    end, and the chunked extractors keep the final chunk). With char_budget=0/None
+    every page is extracted, in parallel on a process pool for large files.
+    Per-page text is cached, so a retry of the same upload costs nothing.
+    Bounded text doesn't cover the whole file, so don't key documents by it
+    (uploads are keyed by their bytes; see SpooledUpload.legacy_hashes).
+    """
+    is_file = hasattr(data, "read")
+    if digest is None:
+        digest = _file_digest(data) if is_file else hashlib.sha256(data).hexdigest()
+    reader = PdfReader(data if is_file else io.BytesIO(data))
+    n_pages = len(reader.pages)
+
+    if char_budget:
+        texts, total, last = [], 0, -1
+        for i in range(n_pages):
+            text = _page(reader, digest, i)
+            last = i
+            if text:
+                texts.append(text)
+                total += len(text) + 1
+            if total >= char_budget: break
+        for i in range(max(last + 1, n_pages - PDF_TAIL_PAGES), n_pages):
+            text = _page(reader, digest, i)
+            if text: texts.append(text)
+        return "\n".join(texts)
+
+    missing = [i for i in range(n_pages) if _cached(digest, i) is None]
+    if missing:
+        if len(missing) >= PDF_PARALLEL_MIN_PAGES and PDF_WORKERS > 1:
+            # Worker processes need the bytes themselves
+            if is_file:
+                data.seek(0)
+                data = data.read()
+            extracted = _extract_parallel(data, missing)
+        else:
+            extracted = {i: reader.pages[i].extract_text() or "" for i in missing}
+        for i, text in extracted.items():
+            _remember(digest, i, text)
+
+    # Cache may have evicted entries for a huge file; fall back to a direct read
+    texts = []
+    for i in range(n_pages):
+        text = _cached(digest, i)
+        if text is None: text = reader.pages[i].extract_text() or ""
+        if text: texts.append(text)
+    return "\n".join(texts)
+
+# --- HELPERS ---
+def _file_digest(f) -> str:
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+def _page(reader, digest: str, i: int) -> str:
+    text = _cached(digest, i)
+    if text is None:
+        text = reader.pages[i].extract_text() or ""
+        _remember(digest, i, text)
+    return text
+
+def _extract_pages(data: bytes, pages: List[int]) -> Dict[int, str]:
+    # Runs in a worker process: parse once, extract a contiguous slice of pages
+    reader = PdfReader(io.BytesIO(data))
+    return {i: reader.pages[i].extract_text() or "" for i in pages}
+
+def _extract_parallel(data: bytes, pages: List[int]) -> Dict[int, str]:
+    pool = _get_pool()
+    # One slice per worker, so each process parses the file once
+    n = min(PDF_WORKERS, len(pages))
+    size = -(-len(pages) // n)
+    slices = [pages[i:i + size] for i in range(0, len(pages), size)]
+    result = {}
+    for part in pool.map(_extract_pages, [data] * len(slices), slices):
+        result.update(part)
+    return result
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pool
+
+def _cached(digest: str, page: int) -> Optional[str]:
+    with _cache_lock:
+        text = _page_cache.get((digest, page))
+        if text is not None: _page_cache.move_to_end((digest, page))
+        return text
+
+def _remember(digest: str, page: int, text: str):
+    with _cache_lock:
+        _page_cache[(digest, page)] = text
+        _page_cache.move_to_end((digest, page))
+        while len(_page_cache) > PDF_PAGE_CACHE_ITEMS:
+            _page_cache.popitem(last=False)
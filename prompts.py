@@ -0,0 +1,187 @@
+# prompts.py
+import asyncio
+import contextvars
+import math
+import re
+import threading
+from typing import Dict, Optional, Tuple
+from tracing import tracer
+from config import TOOL_TOKEN_BUDGETS
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """
+    Cheap tokenizer-free estimate: one token per punctuation mark, and one per
+    ~4 characters of each word (close to Llama's BPE on English prose and numbers).
+    """
+    return sum(max(1, math.ceil(len(t) / 4)) for t in _TOKEN_RE.findall(text or ""))
+
+# Regions worth keeping when a document doesn't fit: the field each tool needs is
+# often far from the top (invoice totals at the bottom, parties/term mid-contract).
+# Patterns are in priority order: windows around the first one's hits are kept first.
+SPAN_PATTERNS = {
+    "extract_invoice": [r"total|amount due|balance due", r"subtotal|tax|vat|invoice\s*(no|number|#)|date|due|bill to|vendor"],
+    "extract_legal_doc": [r"between|part(y|ies)|effective|term\b|terminat|expir", r"governing law|confidential|hereby|witness"],
+    "score_resume": [r"experience|skills|education", r"summary|projects|certifications|@"],
+    "summarize_research_paper": [r"abstract|conclusion|in this paper|we propose", r"introduction|results"],
+    "summarize_audio_note": [r"decid|action item|next step|agree|follow up|deadline"],
+    "summarize_unknown": [r"summary|conclusion|purpose|subject"],
+    "classify_document": [r"invoice|total|resume|curriculum|experience|abstract|agreement|party|hereby|transcript"],
+    "classify_and_extract": [r"total|amount due", r"invoice|resume|experience|skills|abstract|agreement|part(y|ies)|effective|term\b"],
+}
+
+_WINDOW_RADIUS = 200
+_SEPARATOR = "\n...\n"
+
+def fit_to_budget(text: str, tool: str, budget: Optional[int] = None) -> str:
+    """
+    Returns text unchanged if it fits the tool's token budget. Otherwise keeps the
+    header, a tail window (totals, signatures) and windows around regex hits for
+    that tool, best patterns first, joined in document order by "..." markers.
+    The result never exceeds the budget: low-priority windows are dropped first,
+    then the header is cut, then the tail.
+    """
+    budget = budget or TOOL_TOKEN_BUDGETS.get(tool, TOOL_TOKEN_BUDGETS["default"])
+    text = text or ""
+    if count_tokens(text) <= budget: return text
+
+    # ~4 chars per token: header gets 40% of the budget, the tail 20%, windows the rest
+    chars_per_token = max(1.0, len(text) / max(1, count_tokens(text)))
+    budget_chars = int(budget * chars_per_token)
+    patterns = SPAN_PATTERNS.get(tool, [])
+    header = (0, _cut_at_boundary(text, int(budget_chars * (0.4 if patterns else 0.75))))
+    tail = (max(header[1], _start_at_boundary(text, len(text) - int(budget_chars * 0.2))), len(text))
+
+    windows = []
+    for pattern in patterns:
+        for m in re.finditer(pattern, text[header[1]:tail[0]], flags=re.IGNORECASE):
+            if _covered([header, tail, *windows]) >= budget_chars: break
+            hit = header[1] + m.start()
+            if any(s <= hit < e for s, e in windows): continue
+            windows.append((max(header[1], hit - _WINDOW_RADIUS), min(tail[0], header[1] + m.end() + _WINDOW_RADIUS)))
+
+    # The char estimate is approximate: drop the lowest-priority windows until it
+    # fits, then spend whatever is left on more of the header
+    while True:
+        out = _join(text, [header, tail, *windows])
+        if count_tokens(out) <= budget or not windows: break
+        windows.pop()
+    if count_tokens(out) <= budget:
+        lo, hi = header[1], min([tail[0], *(s for s, _ in windows)])
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if count_tokens(_join(text, [(0, mid), tail, *windows])) <= budget: lo = mid
+            else: hi = mid - 1
+        return _join(text, [(0, lo), tail, *windows])
+
+    tail_text = text[tail[0]:].strip()
+    room = budget - count_tokens(tail_text) - count_tokens(_SEPARATOR)
+    if room > 0:
+        return _truncate_tokens(text[:header[1]].strip(), room) + _SEPARATOR + tail_text
+    return _truncate_tokens(tail_text, budget, keep_end=True)
+
+async def afit_to_budget(text: str, tool: str, budget: Optional[int] = None) -> str:
+    """
+    fit_to_budget for coroutines. Trimming a long document (regex scans, repeated
+    token counts) is CPU-bound, so it runs in a worker thread instead of on the
+    shared event loop; text that can't exceed the budget (one char per token at
+    most) is returned as-is without the thread hop.
+    """
+    text = text or ""
+    if len(text) <= (budget or TOOL_TOKEN_BUDGETS.get(tool, TOOL_TOKEN_BUDGETS["default"])): return text
+    return await asyncio.to_thread(fit_to_budget, text, tool, budget)
+
+def _cut_at_boundary(text: str, limit: int) -> int:
+    if limit >= len(text): return len(text)
+    cut = max(text.rfind("\n", 0, limit), text.rfind(". ", 0, limit))
+    return cut + 1 if cut > limit // 2 else limit
+
+def _start_at_boundary(text: str, limit: int) -> int:
+    if limit <= 0: return 0
+    cut = text.find("\n", limit)
+    return cut + 1 if 0 <= cut < limit + (len(text) - limit) // 2 else limit
+
+def _merge(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _covered(spans) -> int:
+    return sum(e - s for s, e in _merge(spans))
+
+def _join(text: str, spans) -> str:
+    return _SEPARATOR.join(p for p in (text[s:e].strip() for s, e in _merge(spans)) if p)
+
+def _truncate_tokens(text: str, budget: int, keep_end: bool = False) -> str:
+    """Longest prefix (or suffix, with keep_end) of text within budget tokens."""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[-mid:] if keep_end else text[:mid]) <= budget: lo = mid
+        else: hi = mid - 1
+    if not lo: return ""
+    return text[-lo:] if keep_end else text[:lo]
+
+# --- USAGE LOGGING ---
+# Per-document usage list for the running ingest (set by the agent)
+_doc_usage = contextvars.ContextVar("doc_usage", default=None)
+
+class UsageLog:
+    """Prompt/completion tokens and latency per tool, per route (tool -> model) and per document type."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_tool: Dict[str, Dict] = {}
+        self.by_route: Dict[str, Dict[str, Dict]] = {}
+        self.by_doc_type: Dict[str, Dict] = {}
+
+    def record(self, tool: str, prompt_tokens: int, completion_tokens: int, latency_s: float,
+               cached: bool = False, model: Optional[str] = None):
+        entry = {"tool": tool, "model": model, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "latency_s": latency_s, "cached": cached}
+        with self._lock:
+            _add(self.by_tool.setdefault(tool, _empty()), entry)
+            if model: _add(self.by_route.setdefault(tool, {}).setdefault(model, _empty()), entry)
+        doc = _doc_usage.get()
+        if doc is not None: doc.append(entry)
+        tracer.add(llm_calls=int(not cached), cache_hits=int(cached),
+                   prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if not cached:
+            via = f" ({model})" if model else ""
+            print(f"   [LLM] {tool}{via}: {prompt_tokens} prompt + {completion_tokens} completion tokens, {latency_s:.2f}s")
+
+    def start_document(self):
+        return _doc_usage.set([])
+
+    def finish_document(self, token, doc_type: Optional[str]) -> Dict:
+        """Closes the per-document log, folds it into by_doc_type and returns its totals."""
+        entries = _doc_usage.get() or []
+        _doc_usage.reset(token)
+        totals = _empty()
+        for e in entries: _add(totals, e)
+        with self._lock:
+            agg = self.by_doc_type.setdefault(doc_type or "UNKNOWN", {**_empty(), "docs": 0})
+            for e in entries: _add(agg, e)
+            agg["docs"] += 1
+        return totals
+
+def _empty() -> Dict:
+    return {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0}
+
+def _add(agg: Dict, entry: Dict):
+    agg["calls"] += 1
+    agg["cache_hits"] += int(entry["cached"])
+    agg["prompt_tokens"] += entry["prompt_tokens"]
+    agg["completion_tokens"] += entry["completion_tokens"]
+    agg["latency_s"] += entry["latency_s"]
+
+usage_log = UsageLog()
+
+def usage_of(completion) -> Tuple[int, int]:
+    usage = getattr(completion, "usage", None)
+    if usage is None: return 0, 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
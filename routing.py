@@ -0,0 +1,54 @@
+# routing.py
+import threading
+from typing import Dict, Optional
+from prompts import usage_log
+from config import MODEL_ROUTES, SMALL_MODEL, LARGE_MODEL, MODEL_ESCALATION
+
+class ModelRouter:
+    """
+    Picks the model for each tool from MODEL_ROUTES ("small", "large" or a model
+    id). When a reply fails the caller's validation, escalation_for() names
+    LARGE_MODEL to retry on (once; the large model's reply is final).
+    Tokens and latency per route are in prompts.usage_log.by_route; stats() joins
+    them with the escalation counts.
+    """
+    def __init__(self, routes: Dict[str, str] = MODEL_ROUTES, escalate: bool = MODEL_ESCALATION):
+        self.routes = routes
+        self.escalate = escalate
+        self._lock = threading.Lock()
+        self.escalations: Dict[str, int] = {}
+
+    def model_for(self, tool: str) -> str:
+        route = self.routes.get(tool, self.routes["default"])
+        return {"small": SMALL_MODEL, "large": LARGE_MODEL}.get(route, route)
+
+    def escalation_for(self, tool: str, model: str) -> Optional[str]:
+        """The model to retry an invalid reply on, or None to keep the reply as is."""
+        if not self.escalate or model == LARGE_MODEL: return None
+        with self._lock: self.escalations[tool] = self.escalations.get(tool, 0) + 1
+        print(f"   [ROUTE] ⬆️  {tool}: {model} reply failed validation, retrying on {LARGE_MODEL}")
+        return LARGE_MODEL
+
+    def stats(self) -> Dict:
+        """Per tool: the routed model, escalations, and calls/tokens/avg latency per model used."""
+        with usage_log._lock:
+            by_route = {tool: {m: dict(agg) for m, agg in models.items()} for tool, models in usage_log.by_route.items()}
+        with self._lock:
+            escalations = dict(self.escalations)
+        out = {}
+        for tool in sorted(set(by_route) | set(escalations)):
+            models = by_route.get(tool, {})
+            for agg in models.values():
+                served = agg["calls"] - agg["cache_hits"]
+                agg["avg_latency_s"] = agg["latency_s"] / served if served else 0.0
+            routed = self.model_for(tool)
+            routed_calls = models.get(routed, {}).get("calls", 0) - models.get(routed, {}).get("cache_hits", 0)
+            out[tool] = {
+                "model": routed,
+                "escalations": escalations.get(tool, 0),
+                "escalation_rate": escalations.get(tool, 0) / routed_calls if routed != LARGE_MODEL and routed_calls else 0.0,
+                "models": models,
+            }
+        return out
+
+router = ModelRouter()
@@ -0,0 +1,235 @@
+# scheduler.py
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+from groq import APIConnectionError, APIError, APIStatusError, InternalServerError, RateLimitError
+from prompts import usage_of
+from tracing import tracer
+from config import (
+    RATE_LIMITS, RATE_LIMIT_ENABLED, LLM_MAX_RETRIES, LLM_BACKOFF_BASE_S, LLM_BACKOFF_MAX_S,
+)
+
+# Lower value is served first. Requests default to "interactive" (UI, queries);
+# ingest_many marks its documents "bulk".
+PRIORITIES = {"interactive": 0, "bulk": 1}
+request_priority = contextvars.ContextVar("request_priority", default="interactive")
+
+# Rough per-image token reservation for vision calls (corrected by the reported usage)
+IMAGE_TOKENS = 1000
+
+class LLMUnavailable(Exception):
+    """A Groq call still failed after every retry (rate limited or transient errors)."""
+    def __init__(self, model: str, attempts: int, error: Exception):
+        super().__init__(f"{model} unavailable after {attempts} attempt(s): {error}")
+        self.model = model
+        self.attempts = attempts
+        self.error = error
+
+# What callers must let propagate instead of turning into an empty result
+API_ERRORS = (APIError, LLMUnavailable)
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, (RateLimitError, APIConnectionError, InternalServerError)): return True
+    # 498: Groq flex tier over capacity
+    return isinstance(e, APIStatusError) and e.status_code in (408, 409, 498)
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class _Bucket:
+    """Token bucket refilled continuously at per_minute / 60 per second. per_minute 0 = unlimited."""
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_s(self, amount: float, now: float) -> float:
+        if not self.capacity: return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request larger than the whole bucket waits for a full one, not forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if self.capacity: self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        if self.capacity: self.level = min(self.capacity, self.level - delta)
+
+class _Lane:
+    """One model's budgets and its queue of waiting requests."""
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.queue = []  # heap of (priority, seq)
+        self.cond = asyncio.Condition()
+        self.paused_until = 0.0  # set by a 429, holds every waiter for this model
+
+    def wait_s(self, tokens: int) -> float:
+        now = time.monotonic()
+        return max(self.paused_until - now, self.requests.wait_s(1, now), self.tokens.wait_s(tokens, now))
+
+class RequestScheduler:
+    """
+    Every Groq call goes through run(): it waits for the model's requests/min
+    and tokens/min buckets (RATE_LIMITS), interactive requests ahead of bulk
+    ones, then retries 429s and transient errors with jittered exponential
+    backoff (Retry-After when the API sends one). Token reservations are
+    estimates and are corrected with the usage each reply reports.
+    Runs on the shared event loop (async_runner.py); stats() is thread-safe.
+    """
+    def __init__(self, limits: Dict = RATE_LIMITS, enabled: bool = RATE_LIMIT_ENABLED,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base_s: float = LLM_BACKOFF_BASE_S,
+                 backoff_max_s: float = LLM_BACKOFF_MAX_S):
+        self.limits = limits
+        self.enabled = enabled
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._lanes: Dict[str, _Lane] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._depth = {p: 0 for p in PRIORITIES}
+        self._in_flight = 0
+        self._waits = {p: deque(maxlen=1000) for p in PRIORITIES}
+        self.counters = {p: {"requests": 0, "wait_s": 0.0, "max_wait_s": 0.0} for p in PRIORITIES}
+        self.counters.update({"retries": 0, "rate_limited": 0, "failures": 0})
+
+    async def run(self, model: str, call: Callable[[], Awaitable], tokens: int = 0):
+        """Awaits call() within model's budgets; raises LLMUnavailable once retries run out."""
+        priority = request_priority.get()
+        if priority not in PRIORITIES: priority = "interactive"
+        lane = self._lane(model)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane, tokens, priority)
+            with self._lock: self._in_flight += 1
+            try:
+                result = await call()
+            except Exception as e:
+                if not _retryable(e): raise
+                limited = isinstance(e, RateLimitError)
+                with self._lock:
+                    self.counters["rate_limited"] += int(limited)
+                    if attempt == self.max_retries:
+                        self.counters["failures"] += 1
+                    else:
+                        self.counters["retries"] += 1
+                if attempt == self.max_retries:
+                    raise LLMUnavailable(model, attempt + 1, e) from e
+                tracer.add(retries=1)
+                delay = self._backoff(attempt, e)
+                if limited:
+                    # The server disagrees with our budget: hold the whole model
+                    lane.paused_until = max(lane.paused_until, time.monotonic() + delay)
+                print(f"   [RATE] ⏳ {model}: {type(e).__name__}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                with self._lock: self._in_flight -= 1
+            if tokens:
+                used = sum(usage_of(result))
+                if used: lane.tokens.adjust(used - tokens)
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                "queue_depth": dict(self._depth),
+                "in_flight": self._in_flight,
+                "retries": self.counters["retries"],
+                "rate_limited": self.counters["rate_limited"],
+                "failures": self.counters["failures"],
+            }
+            for p in PRIORITIES:
+                c, waits = self.counters[p], sorted(self._waits[p])
+                out[p] = {
+                    "requests": c["requests"],
+                    "avg_wait_s": c["wait_s"] / c["requests"] if c["requests"] else 0.0,
+                    "p95_wait_s": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    "max_wait_s": c["max_wait_s"],
+                }
+            out["models"] = {
+                model: {"queued": len(lane.queue), "requests_left": lane.requests.level, "tokens_left": lane.tokens.level}
+                for model, lane in self._lanes.items()
+            }
+            return out
+
+    async def _acquire(self, lane: _Lane, tokens: int, priority: str):
+        entry = (PRIORITIES[priority], next(self._seq))
+        start = time.monotonic()
+        async with lane.cond:
+            heapq.heappush(lane.queue, entry)
+            with self._lock: self._depth[priority] += 1
+            try:
+                while True:
+                    timeout = None
+                    if lane.queue[0] == entry:
+                        timeout = lane.wait_s(tokens)
+                        if timeout <= 0:
+                            heapq.heappop(lane.queue)
+                            lane.requests.take(1)
+                            lane.tokens.take(tokens)
+                            break
+                    # The head sleeps until its budget refills; the rest until the head leaves
+                    try:
+                        await asyncio.wait_for(lane.cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                # Cancelled while queued
+                if entry in lane.queue:
+                    lane.queue.remove(entry)
+                    heapq.heapify(lane.queue)
+                raise
+            finally:
+                with self._lock: self._depth[priority] -= 1
+                lane.cond.notify_all()
+
+        waited = time.monotonic() - start
+        tracer.add(queue_wait_s=waited)
+        with self._lock:
+            c = self.counters[priority]
+            c["requests"] += 1
+            c["wait_s"] += waited
+            c["max_wait_s"] = max(c["max_wait_s"], waited)
+            self._waits[priority].append(waited)
+        if waited >= 1.0:
+            print(f"   [RATE] 🚦 Waited {waited:.1f}s for budget ({priority})")
+
+    def _lane(self, model: str) -> _Lane:
+        with self._lock:
+            lane = self._lanes.get(model)
+            if lane is None:
+                rpm, tpm = self.limits.get(model, self.limits["default"]) if self.enabled else (0, 0)
+                lane = self._lanes[model] = _Lane(rpm, tpm)
+            return lane
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        hinted = _retry_after(e)
+        if hinted is not None: return min(self.backoff_max_s, hinted) + random.uniform(0, self.backoff_base_s)
+        # Equal jitter: at least half the exponential step, so retries spread out
+        step = min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt)
+        return step / 2 + random.uniform(0, step / 2)
+
+# --- PROCESS-WIDE INSTANCE ---
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> RequestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+    return _scheduler
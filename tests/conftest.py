@@ -0,0 +1,53 @@
+# tests/conftest.py
+import os
+import sys
+import pytest
+
+# config.py refuses to import without a key; nothing here talks to Groq
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def build_pdf(pages):
+    """A minimal PDF with one page of Helvetica text per string in pages (lines split on newlines)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [l.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for l in text.splitlines()]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({l}) '" for l in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+@pytest.fixture
+def make_pdf():
+    return build_pdf
+
+@pytest.fixture
+def offline_agent():
+    """Factory for an AutonomousAgent on benchmark.FakeGroq and MemoryDatabase (no network, no Postgres)."""
+    from agent import AutonomousAgent
+    from benchmark import FakeGroq, MemoryDatabase
+    from scheduler import RequestScheduler
+
+    def build(db=None, **kwargs):
+        agent = AutonomousAgent(pacing="batch", client=FakeGroq(latency_ms=1), db=db or MemoryDatabase(), **kwargs)
+        agent.checkpoints = agent.artifacts = None
+        agent.tools.cache = None
+        agent.tools.classifier = None
+        agent.brain.scheduler = agent.tools.scheduler = RequestScheduler(
+            enabled=False, backoff_base_s=0.01, backoff_max_s=0.05
+        )
+        return agent
+    return build
@@ -0,0 +1,50 @@
+# tests/test_audio.py
+import io
+import random
+import pytest
+from benchmark import _synthetic_speech
+from uploads import SpooledUpload
+
+class _Store:
+    """In-memory stand-in for the artifact store and the checkpointer."""
+    def __init__(self):
+        self.artifacts, self.checkpoints = {}, {}
+
+    def put(self, file_hash, kind, text):
+        self.artifacts[(file_hash, kind)] = text
+        return len(text)
+
+    def get(self, file_hash, kind):
+        return self.artifacts.get((file_hash, kind))
+
+    def save(self, state):
+        self.checkpoints[state["file_hash"]] = dict(state)
+        return 1
+
+    def load(self, file_hash):
+        return None
+
+    def delete(self, file_hash):
+        self.checkpoints.pop(file_hash, None)
+
+def _recording():
+    return SpooledUpload.from_file(io.BytesIO(_synthetic_speech(random.Random(1))), "note.wav", "audio/wav")
+
+def test_transcript_kept_when_summary_fails(offline_agent, monkeypatch):
+    agent = offline_agent()
+    store = _Store()
+    agent.artifacts = agent.checkpoints = store
+
+    async def broken_summary(*args, **kwargs):
+        raise RuntimeError("summary call failed")
+    monkeypatch.setattr(agent.tools, "asummarize_audio_note", broken_summary)
+    monkeypatch.setattr(agent.tools, "_aaudio_part", broken_summary)
+
+    upload = _recording()
+    with pytest.raises(RuntimeError):
+        agent.ingest("note.wav", upload)
+
+    transcript = store.artifacts[(upload.sha256, "transcript")]
+    assert transcript.startswith("[METADATA: AUDIO_NOTE]\n")
+    checkpoint = store.checkpoints[upload.sha256]
+    assert checkpoint["content"] == transcript and checkpoint["type"] == "AUDIO_NOTE"
@@ -0,0 +1,29 @@
+# tests/test_brain.py
+import brain
+from async_runner import run_sync
+from benchmark import FakeGroq
+
+def test_rule_fast_path_skips_content_preview(monkeypatch):
+    async def no_preview(*args, **kwargs):
+        raise AssertionError("preview built on the rule path")
+    monkeypatch.setattr(brain, "afit_to_budget", no_preview)
+    planner = brain.GroqBrain(client=FakeGroq(latency_ms=1))
+    planner.fast_path = True
+
+    decision = run_sync(planner.adecide({"filename": "a.txt", "content": "x" * 100_000, "history": []}, []))
+
+    assert decision["action"] == "classify_document" and decision["decided_by"] == "rules"
+
+def test_llm_path_sends_content_preview(monkeypatch):
+    previews = []
+
+    async def preview(text, tool):
+        previews.append(tool)
+        return text[:50]
+    monkeypatch.setattr(brain, "afit_to_budget", preview)
+    planner = brain.GroqBrain(client=FakeGroq(latency_ms=1))
+    planner.fast_path = False
+
+    decision = run_sync(planner.adecide({"filename": "a.txt", "content": "hello", "history": []}, []))
+
+    assert decision["decided_by"] == "llm" and previews == ["brain"]
@@ -0,0 +1,81 @@
+# tests/test_checkpoints.py
+import database
+from async_runner import run_sync
+from checkpoints import Checkpointer, LocalCheckpointStore, loads
+from database import table_ready
+
+class _Artifacts:
+    def __init__(self):
+        self.rows = {}
+
+    def put(self, file_hash, kind, text):
+        self.rows[(file_hash, kind)] = text
+        return len(text)
+
+    def get(self, file_hash, kind):
+        return self.rows.get((file_hash, kind))
+
+class _Recording(LocalCheckpointStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.blobs = []
+
+    def save_checkpoint(self, file_hash, step, blob):
+        self.blobs.append(loads(blob))
+        super().save_checkpoint(file_hash, step, blob)
+
+INVOICE = "INVOICE #77 from ACME Corp. Bill to: Foo Ltd. Date: 2024-01-15. " + "Widget line. " * 400 + "Total amount due: $770.00"
+
+def test_checkpoint_stores_artifact_reference_not_text(tmp_path):
+    store = Checkpointer(LocalCheckpointStore(str(tmp_path / "ckpt.sqlite3")))
+    state = {"file_hash": "h1", "content": INVOICE, "content_artifact": "text", "type": "INVOICE", "history": []}
+    store.save(state)
+
+    saved = store.load("h1")
+    assert "content" not in saved and saved["content_artifact"] == "text"
+    assert store.stats()["raw_bytes"] < 200
+
+def test_resume_loads_content_from_artifact(offline_agent, tmp_path):
+    agent = offline_agent()
+    ckpt = _Recording(str(tmp_path / "ckpt.sqlite3"))
+    agent.checkpoints, agent.artifacts = Checkpointer(ckpt), _Artifacts()
+
+    first = agent.ingest("inv.txt", INVOICE)
+    assert first["status"] == "saved"
+    assert ckpt.blobs and all("content" not in b and b["content_artifact"] == "text" for b in ckpt.blobs)
+
+    # A crash after classification: the resume gets its text back from the artifact
+    file_hash = ckpt.blobs[0]["file_hash"]
+    state = dict(ckpt.blobs[0], history=[{"action": "classify_document", "decided_by": "rules"}], type="INVOICE")
+    agent.checkpoints.save(state)
+    agent.db = agent.tools.db = type(agent.db)()
+    resumed = agent.ingest("inv.txt", INVOICE)
+    assert resumed["status"] == "saved" and resumed["content"] == INVOICE
+    assert resumed["history"][0]["action"] == "classify_document" and resumed["file_hash"] == file_hash
+
+def test_resume_restarts_when_artifact_is_gone(offline_agent, tmp_path):
+    agent = offline_agent()
+    agent.checkpoints = Checkpointer(LocalCheckpointStore(str(tmp_path / "ckpt.sqlite3")))
+    agent.artifacts = _Artifacts()
+    agent.checkpoints.save({"file_hash": "h2", "content": "x", "content_artifact": "text", "history": []})
+
+    assert run_sync(agent._aresume("x", "h2")) is None
+
+class _Db:
+    def __init__(self, tables):
+        self.tables, self.checks = tables, 0
+
+    def has_table(self, table):
+        self.checks += 1
+        return table in self.tables
+
+def test_missing_table_checked_once(monkeypatch, capsys):
+    monkeypatch.setattr(database, "_tables_ready", {})
+    db = _Db({"artifacts"})
+
+    assert table_ready(db, "artifacts", "ARTIFACTS_ENABLED")
+    assert not table_ready(db, "agent_checkpoints", "CHECKPOINT_STORE=postgres")
+    assert not table_ready(db, "agent_checkpoints", "CHECKPOINT_STORE=postgres")
+
+    assert db.checks == 2
+    assert capsys.readouterr().out.count("agent_checkpoints is missing") == 1
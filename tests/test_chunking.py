@@ -0,0 +1,56 @@
+# tests/test_chunking.py
+from chunking import merge_audio_note, merge_invoice, merge_legal_doc, merge_unknown, split_text, summaries
+
+def test_short_text_is_one_chunk():
+    assert split_text("short", chunk_chars=100) == ["short"]
+
+def test_chunks_respect_size_and_overlap():
+    text = "".join(f"Sentence number {i} is here. " for i in range(400))
+    chunks = split_text(text, chunk_chars=500, overlap=50, max_chunks=100)
+    assert all(len(c) <= 500 for c in chunks)
+    assert chunks[0].startswith("Sentence number 0") and chunks[-1].endswith("is here. ")
+    for a, b in zip(chunks, chunks[1:]):
+        assert a[-50:] == b[:50]  # neighbours share the overlap
+
+def test_cuts_prefer_paragraph_boundaries():
+    paragraphs = [f"Paragraph {i}. " + "word " * 60 for i in range(10)]
+    chunks = split_text("\n\n".join(paragraphs), chunk_chars=800, overlap=0, max_chunks=100)
+    assert all(c.endswith("\n\n") for c in chunks[:-1])
+
+def test_past_max_chunks_keeps_head_and_tail():
+    text = "".join(f"Line {i:04d}\n" for i in range(2000)) + "Total amount due: 99.00"
+    chunks = split_text(text, chunk_chars=1000, overlap=0, max_chunks=4)
+    assert len(chunks) == 4
+    assert chunks[0].startswith("Line 0000") and chunks[-1].endswith("Total amount due: 99.00")
+
+def test_merge_invoice_drops_only_the_overlap_items():
+    item = lambda d, t: {"description": d, "total": t}
+    parts = [
+        {"vendor": "ACME", "date": "2024-01-01", "line_items": [item("A", 1), item("B", 2)]},
+        {"vendor": None, "line_items": [item("B", 2), item("C", 3), item("A", 1)], "subtotal": 6, "tax": 1, "total_amount": 7},
+    ]
+    merged = merge_invoice(parts)
+    assert merged["vendor"] == "ACME" and merged["date"] == "2024-01-01"
+    assert [i["description"] for i in merged["line_items"]] == ["A", "B", "C", "A"]
+    assert (merged["subtotal"], merged["tax"], merged["total_amount"]) == (6, 1, 7)
+
+def test_merge_legal_doc_unions_parties_and_clauses():
+    parts = [
+        {"document_type": "Mutual NDA", "parties": ["Acme Corp", "Globex"], "effective_date": "2024-01-01",
+         "key_clauses": ["Confidential for 5 years"]},
+        {"parties": "acme  corp, Initech", "expiration_date": "2026-01-01", "key_clauses": ["Governed by Delaware law"]},
+    ]
+    merged = merge_legal_doc(parts, "Summary.")
+    assert merged["parties"] == ["Acme Corp", "Globex", "Initech"]
+    assert merged["key_clauses"] == ["Confidential for 5 years", "Governed by Delaware law"]
+    assert (merged["effective_date"], merged["expiration_date"], merged["summary"]) == ("2024-01-01", "2026-01-01", "Summary.")
+
+def test_merge_audio_note_votes_on_sentiment():
+    parts = [{"sentiment": "positive"}, {"sentiment": "Negative"}, {"sentiment": "Positive "}]
+    assert merge_audio_note(parts, "s") == {"summary": "s", "sentiment": "Positive"}
+    assert merge_audio_note([{}], "s")["sentiment"] == "Neutral"
+
+def test_merge_unknown_and_summaries():
+    parts = [{"summary": "One.", "keywords": ["a", "b"]}, {"summary": " ", "keywords": ["B", "c"]}]
+    assert merge_unknown(parts, "Both.") == {"summary": "Both.", "keywords": ["a", "b", "c"]}
+    assert summaries(parts) == ["One."]
@@ -0,0 +1,48 @@
+# tests/test_claims.py
+import time
+import pytest
+import agent as agent_module
+
+INVOICE = "INVOICE #{n} from ACME Corp. Bill to: Foo Ltd. Date: 2024-01-15. Widgets x3. Total amount due: ${n}.00"
+
+class _SlowWriter:
+    """BatchWriter stand-in whose flush takes a while, then succeeds or raises."""
+    def __init__(self, db, batch_size, use_copy, delay_s=0.0, fail=False):
+        self.db, self.delay_s, self.fail = db, delay_s, fail
+        self.pending, self.outcomes, self.stats = [], {}, {}
+
+    def add(self, doc_id, filename, doc_type, file_hash, data, simhash=None):
+        self.pending.append((doc_id, filename, doc_type, file_hash, data, simhash))
+
+    def flush(self):
+        time.sleep(self.delay_s)
+        if self.fail: raise RuntimeError("database went away")
+        for doc in self.pending:
+            self.outcomes[doc[0]] = "saved" if self.db.save_document(*doc) else "duplicate"
+
+def _files(n):
+    return [(f"inv{i}.txt", INVOICE.format(n=100 + i)) for i in range(n)]
+
+def test_queued_claims_are_heartbeated_until_flush(offline_agent, monkeypatch):
+    agent = offline_agent(claims=True)
+    calls = []
+    claim = agent.db.claim_ingest
+    monkeypatch.setattr(agent.db, "claim_ingest", lambda h, owner, stale: calls.append(h) or claim(h, owner, stale))
+    monkeypatch.setattr(agent_module, "INGEST_CLAIM_STALE_S", 3.0)  # heartbeat every 1s
+    monkeypatch.setattr(agent_module, "BatchWriter", lambda db, n, copy: _SlowWriter(db, n, copy, delay_s=1.5))
+
+    report = agent.ingest_many(_files(2), batch_size=10)
+
+    assert report["counts"] == {"saved": 2}
+    # One claim each, plus heartbeats while the batch waited for its flush
+    assert len(calls) > 2
+    assert agent.db.claims == {} and agent._keepalives == {}
+
+def test_claims_released_when_flush_raises(offline_agent, monkeypatch):
+    agent = offline_agent(claims=True)
+    monkeypatch.setattr(agent_module, "BatchWriter", lambda db, n, copy: _SlowWriter(db, n, copy, fail=True))
+
+    with pytest.raises(RuntimeError):
+        agent.ingest_many(_files(3), batch_size=10)
+
+    assert agent.db.claims == {} and agent._keepalives == {}
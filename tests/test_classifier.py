@@ -0,0 +1,59 @@
+# tests/test_classifier.py
+import threading
+import pytest
+from async_runner import run_sync
+from classifier import LocalClassifier, featurize, save_model, train
+from tools import ToolRegistry
+
+INVOICES = [f"Invoice #{i} from Vendor {i}. Bill to ACME. Subtotal ${i}0.00 tax ${i}.00 total amount due ${i}1.00" for i in range(30)]
+RESUMES = [f"Candidate {i}. Experience: {i} years as engineer. Skills: python, sql. Education: BSc. Email cand{i}@mail.com" for i in range(30)]
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = str(tmp_path / "model.npz")
+    save_model(train(INVOICES + RESUMES, ["INVOICE"] * 30 + ["RESUME"] * 30, n_features=2 ** 12), path)
+    return path
+
+def test_featurize_is_stable_and_sparse():
+    idx, tf = featurize("total amount due total", n_features=1024)
+    again, _ = featurize("total amount due total", n_features=1024)
+    assert list(idx) == list(again)
+    assert len(idx) == len(tf) and all(0 <= i < 1024 for i in idx)
+    assert max(tf) > 1.0  # "total" appears twice
+
+def test_train_reports_holdout_accuracy():
+    model = train(INVOICES + RESUMES, ["INVOICE"] * 30 + ["RESUME"] * 30, n_features=2 ** 12)
+    assert list(model["labels"]) == ["INVOICE", "RESUME"]
+    assert float(model["accuracy"]) >= 0.9 and int(model["n_train"]) == 60
+
+def test_classify_confident_and_fallback(model_path):
+    clf = LocalClassifier(path=model_path, threshold=0.5)
+    assert clf.classify("Invoice #99 from Vendor 99. Total amount due $991.00") == ("INVOICE", None)
+
+    clf.threshold = 1.01  # nothing is that confident
+    label, guess = clf.classify("Candidate 7. Experience: 3 years. Skills: python")
+    assert label is None and guess == "RESUME"
+    clf.record_fallback(guess, "RESUME")
+    stats = clf.stats()
+    assert stats["local"] == 1 and stats["fallback"] == 1 and stats["fallback_agreement"] == 1.0
+
+def test_missing_model_defers_to_llm(tmp_path):
+    clf = LocalClassifier(path=str(tmp_path / "absent.npz"))
+    assert clf.predict("anything") is None
+    assert clf.classify("anything") == (None, None) and clf.stats()["no_model"] == 1
+
+def test_classification_runs_off_the_event_loop(model_path):
+    clf = LocalClassifier(path=model_path, threshold=0.5)
+    threads = []
+    predict = clf.predict
+    clf.predict = lambda text: threads.append(threading.current_thread()) or predict(text)
+    tools = ToolRegistry(client=object(), db=object())
+    tools.classifier = clf
+
+    label = run_sync(tools.aclassify_document("Invoice #5 from Vendor 5. Total amount due $51.00"))
+    loop_thread = run_sync(_current_thread())
+
+    assert label == "INVOICE" and threads and threads[0] is not loop_thread
+
+async def _current_thread():
+    return threading.current_thread()
@@ -0,0 +1,74 @@
+# tests/test_dup_index.py
+from contextlib import contextmanager
+from types import SimpleNamespace
+from database import Database, DuplicateIndex
+
+H1, H2 = "a" * 64, "b" * 64
+
+class _Listener:
+    """Stands in for the LISTEN connection: poll() moves pending notifications into .notifies."""
+    def __init__(self):
+        self.pending, self.notifies, self.broken = [], [], False
+
+    def poll(self):
+        if self.broken: raise OSError("connection lost")
+        self.notifies.extend(SimpleNamespace(payload=h) for h in self.pending)
+        self.pending = []
+
+class _Db(Database):
+    """Database whose processed_docs is a set; counts the lookups that reach it."""
+    def __init__(self, rows, listener):
+        self.rows, self.listener, self.queries = set(rows), listener, 0
+        self.dup_index = DuplicateIndex()
+        self.near_index = None
+
+    def listen_for_deletes(self):
+        return self.listener
+
+    @contextmanager
+    def _cursor(self, name=None):
+        db, result = self, []
+
+        class Cursor:
+            itersize = 0
+            def execute(self, sql, params=()):
+                if "SELECT file_hash FROM processed_docs" in sql:
+                    result[:] = [(h,) for h in db.rows]
+                else:
+                    db.queries += 1
+                    result[:] = [(1,)] if params[0] in db.rows else []
+            def fetchone(self): return result[0] if result else None
+            def __iter__(self): return iter(result)
+        yield Cursor()
+
+def test_hits_skip_the_database_while_listening():
+    db = _Db({H1}, _Listener())
+    assert db.check_duplicate(H1) and db.queries == 0
+    assert not db.check_duplicate(H2) and db.queries == 1
+
+def test_deleted_rows_are_evicted():
+    listener = _Listener()
+    db = _Db({H1}, listener)
+    assert db.check_duplicate(H1)
+
+    db.rows.discard(H1)
+    listener.pending.append(H1)
+    assert not db.check_duplicate(H1)
+    assert db.dup_index.counters["evicted"] == 1
+
+def test_hits_confirmed_without_the_trigger():
+    db = _Db({H1}, None)
+    assert db.check_duplicate(H1) and db.queries == 1
+
+    db.rows.discard(H1)  # deleted, and nobody told us
+    assert not db.check_duplicate(H1)
+    assert H1 not in db.dup_index
+
+def test_lost_listener_falls_back_to_confirming():
+    listener = _Listener()
+    db = _Db({H1}, listener)
+    listener.broken = True
+    db.rows.discard(H1)
+
+    assert not db.check_duplicate(H1)
+    assert not db.dup_index.listening
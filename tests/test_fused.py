@@ -0,0 +1,23 @@
+# tests/test_fused.py
+import io
+import random
+from benchmark import _synthetic_scan
+from uploads import SpooledUpload
+
+def test_image_skips_fused_step_until_ocr(offline_agent):
+    agent = offline_agent(fused=True)
+    calls = []
+    fused = agent.tools.aclassify_and_extract
+
+    async def spy(content):
+        calls.append(content)
+        return await fused(content)
+    agent.tools.aclassify_and_extract = spy
+
+    scan = SpooledUpload.from_file(io.BytesIO(_synthetic_scan(random.Random(3))), "scan.png", "image/png")
+    state = agent.ingest("scan.png", scan)
+
+    fused_steps = [h for h in state["history"] if h["action"] == "classify_and_extract"]
+    # One fused call, made by analyze_image on the OCR'd text
+    assert len(fused_steps) == 1 and fused_steps[0]["valid"]
+    assert calls and all("[METADATA: IMAGE" not in c for c in calls)
@@ -0,0 +1,29 @@
+# tests/test_imaging.py
+from imaging import join_tile_texts
+
+def test_overlap_between_tiles_kept_once():
+    top = "ACME Corp\nWidget 1  10.00\nWidget 2  20.00"
+    bottom = "Widget 2  20.00\nWidget 3  30.00\nTotal 60.00"
+    assert join_tile_texts([top, bottom]).splitlines() == [
+        "ACME Corp", "Widget 1  10.00", "Widget 2  20.00", "Widget 3  30.00", "Total 60.00",
+    ]
+
+def test_multi_line_overlap_with_blank_lines():
+    top = "Header\nline a\n\nline b"
+    bottom = "line a\n\nline b\nline c"
+    assert join_tile_texts([top, bottom]).splitlines() == ["Header", "line a", "", "line b", "line c"]
+
+def test_repeated_lines_away_from_the_seam_survive():
+    top = "Coffee 4.50\nBagel 3.25\nSubtotal 7.75"
+    bottom = "Coffee 4.50\nTax 0.62\nTotal 8.37"
+    # "Coffee 4.50" starts the next tile but doesn't end this one: a second coffee, not the overlap
+    assert join_tile_texts([top, bottom]).splitlines().count("Coffee 4.50") == 2
+
+def test_only_the_matching_suffix_is_dropped():
+    top = "Item A\nItem B"
+    bottom = "Item B\nItem A\nItem B"
+    assert join_tile_texts([top, bottom]).splitlines() == ["Item A", "Item B", "Item A", "Item B"]
+
+def test_single_tile_and_empty_text():
+    assert join_tile_texts(["one\ntwo"]) == "one\ntwo"
+    assert join_tile_texts(["", "one"]) == "one"
@@ -0,0 +1,54 @@
+# tests/test_neardup.py
+import random
+from neardup import SimHashIndex, confirm_match, from_db, hamming, simhash, to_db
+
+WORDS = "the parties agree to keep all confidential information secret for five years after signing".split()
+
+def _text(seed, n=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 50)) for _ in range(n))
+
+def test_one_word_changed_stays_close():
+    base = _text(1)
+    edited = base.replace(base.split()[100], "changed", 1)
+    assert hamming(simhash(base), simhash(edited)) <= 6
+    assert hamming(simhash(base), simhash(_text(2))) > 12
+
+def test_no_fingerprint_for_images_or_short_text():
+    assert simhash("[METADATA: IMAGE_Base64_START]abcd[METADATA: IMAGE_Base64_END]") is None
+    assert simhash("too short") is None
+    assert simhash("") is None
+
+def test_db_round_trip_of_unsigned_fingerprints():
+    for fp in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+        assert -(2 ** 63) <= to_db(fp) < 2 ** 63
+        assert from_db(to_db(fp)) == fp
+    assert to_db(None) is None
+
+def test_index_finds_the_nearest_within_distance():
+    index = SimHashIndex(max_distance=3)
+    base = 0xDEADBEEF12345678
+    index.add(base ^ 0b111, "three-bits")
+    index.add(base ^ 0b1, "one-bit")
+    index.add(base ^ (0b1111 << 40), "four-bits")
+    index.add(None, "ignored")
+
+    assert index.nearest(base) == ("one-bit", 1)
+    assert index.nearest(base ^ (0b1111 << 40)) == ("four-bits", 0)
+    assert index.nearest(base ^ (0xFF << 20)) is None
+    assert index.stats()["size"] == 3 and index.stats()["matches"] == 2
+
+def test_confirm_match_needs_every_key_field():
+    invoice = {"vendor": "ACME Corp", "date": "2024-01-15", "total_amount": 1250.0}
+    same = "Invoice from ACME Corp dated 15/01/2024. Total: $1,250.00"
+    assert confirm_match("INVOICE", invoice, same)
+    assert not confirm_match("INVOICE", invoice, same.replace("1,250.00", "1,350.00"))
+    assert not confirm_match("INVOICE", invoice, same.replace("15/01/2024", "16/01/2024"))
+
+def test_confirm_match_checks_every_party_and_skips_untyped_docs():
+    nda = {"parties": ["Acme Corp", "Globex LLC"], "effective_date": "2024-03-01"}
+    text = "This agreement between Acme Corp and Globex LLC is effective March 1, 2024."
+    assert confirm_match("LEGAL_DOC", nda, text)
+    assert not confirm_match("LEGAL_DOC", nda, text.replace("Globex", "Initech"))
+    assert not confirm_match("AUDIO_NOTE", {"summary": "x"}, "x")
+    assert not confirm_match("INVOICE", {"vendor": None}, "anything")
@@ -0,0 +1,28 @@
+# tests/test_prompts.py
+import threading
+import prompts
+from async_runner import run_sync
+from prompts import afit_to_budget, count_tokens, fit_to_budget
+
+LONG = "\n".join(f"Line {i}: widgets, gadgets and sprockets delivered as agreed." for i in range(3000)) + "\nTotal amount due: $4,200.00"
+
+def test_fit_to_budget_keeps_the_total_within_budget():
+    out = fit_to_budget(LONG, "extract_invoice", budget=500)
+    assert count_tokens(out) <= 500
+    assert out.startswith("Line 0:") and "Total amount due: $4,200.00" in out
+
+def test_afit_to_budget_trims_off_the_event_loop(monkeypatch):
+    threads = []
+    real = prompts.fit_to_budget
+    monkeypatch.setattr(prompts, "fit_to_budget", lambda *a: threads.append(threading.current_thread()) or real(*a))
+    loop_thread = run_sync(_current_thread())
+
+    assert run_sync(afit_to_budget(LONG, "extract_invoice", 500)) == real(LONG, "extract_invoice", 500)
+    assert threads and threads[0] is not loop_thread
+
+def test_afit_to_budget_returns_short_text_as_is(monkeypatch):
+    monkeypatch.setattr(prompts, "fit_to_budget", None)
+    assert run_sync(afit_to_budget("short invoice", "extract_invoice")) == "short invoice"
+
+async def _current_thread():
+    return threading.current_thread()
@@ -0,0 +1,48 @@
+# tests/test_routing.py
+from types import SimpleNamespace
+import routing
+from async_runner import run_sync
+from cache import LLMCache
+from routing import ModelRouter
+from scheduler import RequestScheduler
+from tools import ToolRegistry
+
+def test_routes_resolve_to_models():
+    router = ModelRouter(routes={"default": "large", "brain": "small", "classify_document": "custom-model"})
+    assert router.model_for("brain") == routing.SMALL_MODEL
+    assert router.model_for("extract_invoice") == routing.LARGE_MODEL
+    assert router.model_for("classify_document") == "custom-model"
+
+def test_escalation_goes_to_large_once():
+    router = ModelRouter(routes={"default": "small"}, escalate=True)
+    assert router.escalation_for("brain", routing.SMALL_MODEL) == routing.LARGE_MODEL
+    assert router.escalation_for("brain", routing.LARGE_MODEL) is None
+    assert router.escalations == {"brain": 1}
+    assert ModelRouter(escalate=False).escalation_for("brain", routing.SMALL_MODEL) is None
+
+class _Client:
+    """Small model replies garbage, the large one a valid label."""
+    def __init__(self):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, messages, model, temperature=0, **kwargs):
+        self.calls.append(model)
+        content = "INVOICE" if model == routing.LARGE_MODEL else "¯\\_(ツ)_/¯"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+def test_escalated_reply_cached_under_both_models(tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, "router", ModelRouter(routes={"default": "small"}, escalate=True))
+    monkeypatch.setattr("tools.router", routing.router)
+    client = _Client()
+    tools = ToolRegistry(client=client, db=object())
+    tools.cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+    tools.scheduler = RequestScheduler(enabled=False)
+    messages = [{"role": "user", "content": "Classify: INVOICE #1"}]
+    is_label = lambda raw: raw.strip() in ("INVOICE", "OTHER")
+
+    assert run_sync(tools._acomplete(messages, tool="classify_document", validate=is_label)) == "INVOICE"
+    assert client.calls == [routing.SMALL_MODEL, routing.LARGE_MODEL]
+
+    assert run_sync(tools._acomplete(messages, tool="classify_document", validate=is_label)) == "INVOICE"
+    assert client.calls == [routing.SMALL_MODEL, routing.LARGE_MODEL]  # served from the small model's key
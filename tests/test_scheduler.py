@@ -0,0 +1,80 @@
+# tests/test_scheduler.py
+from types import SimpleNamespace
+import httpx
+import pytest
+from groq import APIConnectionError, BadRequestError, RateLimitError
+from async_runner import run_sync
+from scheduler import LLMUnavailable, RequestScheduler, _Bucket, _retryable
+
+_REQUEST = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+
+def _rate_limited(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=_REQUEST)
+    return RateLimitError("rate limited", response=response, body=None)
+
+def _flaky(failures, error):
+    calls = []
+    async def call():
+        calls.append(1)
+        if len(calls) <= failures: raise error()
+        return "ok"
+    return call, calls
+
+def test_bucket_waits_for_refill():
+    bucket = _Bucket(60)  # one per second
+    bucket.updated = 0.0
+    assert bucket.wait_s(1, now=0.0) == 0.0
+    bucket.take(60)
+    assert bucket.wait_s(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.wait_s(1, now=1.0) == 0.0
+    # Larger than the whole bucket: waits for a full one, not forever
+    assert bucket.wait_s(500, now=120.0) == 0.0
+    bucket.take(500)
+    assert bucket.wait_s(500, now=120.0) == pytest.approx(60.0)
+    assert _Bucket(0).wait_s(10 ** 9, now=0.0) == 0.0
+
+def test_retries_transient_errors():
+    scheduler = RequestScheduler(enabled=False, max_retries=3, backoff_base_s=0.001, backoff_max_s=0.001)
+    call, calls = _flaky(2, lambda: APIConnectionError(request=_REQUEST))
+    assert run_sync(scheduler.run("m", call)) == "ok"
+    assert len(calls) == 3
+    stats = scheduler.stats()
+    assert stats["retries"] == 2 and stats["failures"] == 0
+    assert stats["interactive"]["requests"] == 3
+
+def test_gives_up_with_llm_unavailable():
+    scheduler = RequestScheduler(enabled=False, max_retries=1, backoff_base_s=0.001, backoff_max_s=0.001)
+    call, calls = _flaky(5, _rate_limited)
+    with pytest.raises(LLMUnavailable) as info:
+        run_sync(scheduler.run("m", call))
+    assert info.value.attempts == 2 and isinstance(info.value.error, RateLimitError)
+    assert len(calls) == 2
+    stats = scheduler.stats()
+    assert stats["retries"] == 1 and stats["failures"] == 1 and stats["rate_limited"] == 2
+
+def test_non_retryable_errors_propagate():
+    response = httpx.Response(400, request=_REQUEST)
+    error = BadRequestError("bad", response=response, body=None)
+    assert not _retryable(error)
+    scheduler = RequestScheduler(enabled=False, backoff_base_s=0.001)
+    call, calls = _flaky(1, lambda: error)
+    with pytest.raises(BadRequestError):
+        run_sync(scheduler.run("m", call))
+    assert len(calls) == 1 and scheduler.stats()["retries"] == 0
+
+def test_backoff_honours_retry_after():
+    scheduler = RequestScheduler(enabled=False, backoff_base_s=0.5, backoff_max_s=4)
+    assert 2.0 <= scheduler._backoff(0, _rate_limited(retry_after=2)) <= 2.5
+    assert 4.0 <= scheduler._backoff(0, _rate_limited(retry_after=60)) <= 4.5
+    for attempt in range(6):
+        step = min(4, 0.5 * 2 ** attempt)
+        assert step / 2 <= scheduler._backoff(attempt, _rate_limited()) <= step
+
+def test_token_budget_corrected_by_usage():
+    scheduler = RequestScheduler(limits={"default": (100, 1000)}, enabled=True)
+    async def call():
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=150, completion_tokens=50))
+    run_sync(scheduler.run("m", call, tokens=500))
+    # Reserved 500, the reply reported 200: 300 go back to the bucket
+    assert scheduler.stats()["models"]["m"]["tokens_left"] == pytest.approx(800, abs=1)
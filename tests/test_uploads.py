@@ -0,0 +1,54 @@
+# tests/test_uploads.py
+import base64
+import hashlib
+import io
+import os
+from pypdf import PdfReader
+from config import PDF_CHAR_BUDGET
+from uploads import SpooledUpload, legacy_hash
+
+def _upload(data: bytes, name: str, mime=None) -> SpooledUpload:
+    return SpooledUpload.from_file(io.BytesIO(data), name, mime)
+
+def _baseline_pdf_hash(data: bytes) -> str:
+    # How app.read_file + AutonomousAgent.ingest keyed PDFs before uploads were spooled
+    reader = PdfReader(io.BytesIO(data))
+    return legacy_hash("\n".join([p.extract_text() for p in reader.pages if p.extract_text()]))
+
+def test_sha256_is_over_raw_bytes():
+    data = os.urandom(700_000)
+    upload = _upload(data, "blob.bin")
+    assert upload.sha256 == hashlib.sha256(data).hexdigest()
+    assert upload.size == len(data)
+    assert upload.read_bytes() == data
+
+def test_text_has_no_legacy_hash():
+    # Same bytes, same hash: nothing extra to look up
+    assert _upload("héllo".encode(), "note.txt").legacy_hashes() == []
+
+def test_image_legacy_hash_matches_inline_base64():
+    data = os.urandom(1_000_001)  # not a multiple of 3 or of the chunk size
+    inline = f"[METADATA: IMAGE_Base64_START]{base64.b64encode(data).decode('utf-8')}[METADATA: IMAGE_Base64_END]"
+    assert _upload(data, "scan.png", "image/png").legacy_hashes() == [legacy_hash(inline)]
+
+def test_short_pdf_legacy_hash_matches_baseline(make_pdf):
+    data = make_pdf([f"Invoice page {i}\nTotal: {i * 10}.00" for i in range(3)])
+    assert _baseline_pdf_hash(data) in _upload(data, "short.pdf").legacy_hashes()
+
+def test_pdf_over_budget_matches_full_text_hash(make_pdf):
+    # Regression: the prompt text is page-bounded, the pre-spooling hash was over every page
+    line = "Line item widget model 1234 quantity 5 unit price 99.00 amount 495.00"
+    data = make_pdf(["\n".join(f"{p}-{i} {line}" for i in range(40)) for p in range(20)])
+    upload = _upload(data, "long.pdf")
+    assert len(upload.prompt_text()) < sum(len(p.extract_text()) for p in PdfReader(io.BytesIO(data)).pages)
+    assert len(upload.prompt_text()) >= PDF_CHAR_BUDGET
+    hashes = upload.legacy_hashes()
+    assert hashes[0] == _baseline_pdf_hash(data)
+    # PDFs saved while extraction was already bounded are keyed by the bounded text
+    assert legacy_hash(upload.prompt_text()) in hashes
+
+def test_prompt_text_keeps_head_and_tail_of_long_text():
+    head, tail = "HEAD " * 10_000, " TAIL-MARKER"
+    text = _upload((head + "x" * 500_000 + tail).encode(), "big.txt").prompt_text(char_budget=1000)
+    assert text.startswith("HEAD") and text.endswith("TAIL-MARKER")
+    assert len(text) < 20_000
@@ -0,0 +1,55 @@
+# tests/test_worker.py
+import pytest
+import worker
+from async_runner import run_sync
+from worker import Worker, backoff_s
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(worker, "JOB_BACKOFF_S", 30.0)
+    monkeypatch.setattr(worker, "JOB_BACKOFF_MAX_S", 200.0)
+    assert [backoff_s(n) for n in (0, 1, 2, 3, 4, 5)] == [30.0, 30.0, 60.0, 120.0, 200.0, 200.0]
+
+class _JobsDb:
+    def __init__(self):
+        self.finished = []
+
+    def finish_job(self, job_id, worker_id, **outcome):
+        self.finished.append(outcome)
+
+class _Agent:
+    def __init__(self, result=None, error=None):
+        self.db, self.result, self.error, self.uploads = _JobsDb(), result, error, []
+
+    async def aingest(self, filename, upload):
+        self.uploads.append(upload)
+        if self.error: raise self.error
+        return self.result
+
+def _run(agent, tmp_path, attempts=1):
+    path = tmp_path / "doc.txt"
+    path.write_text("INVOICE #1 total amount due $10.00")
+    run_sync(Worker(agent=agent)._process_job(1, str(path), attempts))
+    return agent.db.finished[-1]
+
+@pytest.mark.parametrize("result,expected", [
+    ({"status": "saved", "id": "d1", "type": "INVOICE"}, "done"),
+    ({"status": "skipped", "reason": "duplicate"}, "done"),
+    ({"status": "failed", "error": "Failed to save"}, "pending"),
+    ({"id": "d1", "type": "INVOICE", "history": []}, "pending"),  # loop stopped before saving
+])
+def test_job_outcomes(tmp_path, monkeypatch, result, expected):
+    monkeypatch.setattr(worker, "JOB_MAX_ATTEMPTS", 3)
+    outcome = _run(_Agent(result), tmp_path)
+    assert outcome["status"] == expected
+    assert outcome["retry_after_s"] == (backoff_s(1) if expected == "pending" else 0)
+
+def test_incomplete_fails_once_out_of_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, "JOB_MAX_ATTEMPTS", 3)
+    outcome = _run(_Agent({"history": []}), tmp_path, attempts=3)
+    assert outcome["status"] == "failed" and outcome["result_status"] == "incomplete"
+
+@pytest.mark.parametrize("error", [None, RuntimeError("API down")])
+def test_upload_closed_after_job(tmp_path, error):
+    agent = _Agent({"status": "saved"}, error)
+    _run(agent, tmp_path)
+    assert agent.uploads[0]._file.closed
@@ -1,67 +1,254 @@
 import json
 import re
-from groq import Groq
-from typing import Dict
-from database import Database
-from config import GROQ_API_KEY, MODEL_NAME
+import asyncio
+import base64
+from groq import AsyncGroq
+from typing import Dict, List, Optional, Tuple, Union
+from database import Database, get_engine
+from async_runner import run_sync
+from cache import get_cache
+from classifier import get_classifier
+from uploads import IMAGE_UPLOAD_MARKER, SpooledUpload
+from audio import SAMPLE_RATE, decode_pcm, split_on_silence, stitch, to_wav
+from imaging import prepare_image, join_tile_texts, image_stats
+import chunking
+import time
+from prompts import afit_to_budget, usage_log, usage_of, count_tokens
+from scheduler import get_scheduler, API_ERRORS, IMAGE_TOKENS
+from routing import router
+from config import (
+    GROQ_API_KEY, CHUNK_CHARS, AUDIO_SPLIT_MIN_BYTES, AUDIO_CONCURRENCY, LLM_COMPLETION_TOKENS_ESTIMATE,
+)
+
+# doc type (substring match, like save_data always did) -> state key holding its payload
+DOC_TYPE_STATE_KEYS = [
+    ("INVOICE", "extracted_data"),
+    ("RESUME", "score"),
+    ("RESEARCH", "research_summary"),
+    ("AUDIO", "audio_summary"),
+    ("LEGAL", "legal_data"),
+    ("OTHER", "summary_data"),
+]
+
+def state_key_for(doc_type) -> Optional[str]:
+    doc_type = doc_type or ""
+    for marker, key in DOC_TYPE_STATE_KEYS:
+        if marker in doc_type: return key
+    return None
+
+def is_image_content(content: str) -> bool:
+    """True for an inline base64 image or a spooled image upload's marker, i.e. text that still needs OCR."""
+    return "[METADATA: IMAGE_Base64_START]" in content or IMAGE_UPLOAD_MARKER in content
+
+def state_payload(state: Dict) -> Dict:
+    key = state_key_for(state.get('type'))
+    return (state.get(key) or {}) if key else {}
+
+# Per-type payload schema: field -> kind. Used by the fused prompt and to validate
+# its output. "number" accepts strings too ("$1,200"); save routines clean them.
+EXTRACTION_SCHEMAS = {
+    "INVOICE": {"vendor": "text", "date": "text", "line_items": "list", "subtotal": "number", "tax": "number", "total_amount": "number"},
+    "RESUME": {"score": "number", "skills": "list", "name": "text"},
+    "RESEARCH_PAPER": {"title": "text", "summary": "text"},
+    "LEGAL_DOC": {"document_type": "text", "parties": "list", "effective_date": "text", "expiration_date": "text", "key_clauses": "list", "summary": "text"},
+    "AUDIO_NOTE": {"summary": "text", "sentiment": "text"},
+    "OTHER": {"summary": "text", "keywords": "list"},
+}
+
+_KIND_TYPES = {
+    "text": (str, type(None)),
+    "number": (int, float, str, type(None)),
+    "list": (list,),
+}
+
+def validate_payload(doc_type: str, data) -> bool:
+    schema = EXTRACTION_SCHEMAS.get(doc_type)
+    if not schema or not isinstance(data, dict): return False
+    return all(field in data and isinstance(data[field], _KIND_TYPES[kind]) for field, kind in schema.items())
+
+def has_fields(doc_type: str):
+    """
+    Validator for one extractor's reply: every schema field present. Values may be
+    null (chunk extractions leave out what isn't in their part).
+    """
+    fields = EXTRACTION_SCHEMAS[doc_type]
+    return lambda data: isinstance(data, dict) and all(f in data for f in fields)
 
 class ToolRegistry:
-    def __init__(self):
-        self.client = Groq(api_key=GROQ_API_KEY)
-        self.db = Database()
+    """
+    Every tool is a coroutine (`a<name>`) on an async Groq client. The plain-named
+    methods are sync wrappers that run it on the shared event loop (async_runner.py).
+    """
+    def __init__(self, client=None, db=None):
+        # Retries are the scheduler's job (scheduler.py), not the SDK's
+        self.client = client or AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)
+        self.scheduler = get_scheduler()
+        self.db = db or Database()
+        self.cache = get_cache()
+        self.classifier = get_classifier()
+
+    # --- SYNC WRAPPERS ---
+    def transcribe_audio(self, audio_file) -> str: return run_sync(self.atranscribe_audio(audio_file))
+    def transcribe_and_summarize(self, audio_file) -> Tuple[str, Dict]: return run_sync(self.atranscribe_and_summarize(audio_file))
+    def analyze_image(self, image: Union[str, bytes]) -> str: return run_sync(self.aanalyze_image(image))
+    def classify_document(self, content: str) -> str: return run_sync(self.aclassify_document(content))
+    def extract_invoice(self, content: str) -> Dict: return run_sync(self.aextract_invoice(content))
+    def extract_legal_doc(self, content: str) -> Dict: return run_sync(self.aextract_legal_doc(content))
+    def score_resume(self, content: str) -> Dict: return run_sync(self.ascore_resume(content))
+    def summarize_unknown(self, content: str) -> Dict: return run_sync(self.asummarize_unknown(content))
+    def summarize_research_paper(self, content: str) -> Dict: return run_sync(self.asummarize_research_paper(content))
+    def summarize_audio_note(self, content: str) -> Dict: return run_sync(self.asummarize_audio_note(content))
+    def query_database(self, query: str) -> Dict: return run_sync(self.aquery_database(query))
+    def classify_and_extract(self, content: str): return run_sync(self.aclassify_and_extract(content))
 
     # --- 1. TRANSCRIPTION ---
-    def transcribe_audio(self, audio_file) -> str:
+    async def atranscribe_audio(self, audio_file, on_segment=None) -> str:
         print("   [Tool] 🎙️ Transcribing audio via Groq Whisper...")
         try:
-            transcription = self.client.audio.transcriptions.create(
-                file=(audio_file.name, audio_file.read()), 
-                model="whisper-large-v3", 
-                response_format="text"
-            )
-            return transcription
+            return await self._atranscribe(audio_file, on_segment)
         except Exception as e:
             return f"Error transcribing audio: {str(e)}"
 
+    async def atranscribe_and_summarize(self, audio_file, on_transcript=None) -> Tuple[str, Dict]:
+        """
+        Transcription and summarization overlapped: each segment's summary starts
+        as soon as that segment's transcript is back, and the per-segment results
+        are reduced in order at the end. Returns (transcript, audio_summary).
+        on_transcript(transcript), if given, is awaited as soon as the whole
+        transcript is in, before any summary is awaited (so a failed summary
+        doesn't lose it). Raises if transcription fails.
+        """
+        print("   [Tool] 🎙️ Transcribing + summarizing audio via Groq Whisper...")
+        parts = {}
+
+        async def on_segment(i, total, text):
+            if total > 1:
+                note = f"(This is part {i + 1} of {total} of a longer recording. Only report what appears in this part.)"
+                parts[i] = asyncio.create_task(self._aaudio_part(text, note))
+
+        try:
+            transcript = await self._atranscribe(audio_file, on_segment)
+            if on_transcript: await on_transcript(transcript)
+        except BaseException:
+            for task in parts.values(): task.cancel()
+            raise
+        if not parts:
+            return transcript, await self.asummarize_audio_note(transcript)
+
+        results = [p for p in await asyncio.gather(*(parts[i] for i in sorted(parts))) if isinstance(p, dict)]
+        summary = await self._areduce_summaries(chunking.summaries(results), "a concise paragraph summarizing the whole transcript")
+        return transcript, _attach_transcript(chunking.merge_audio_note(results, summary), transcript)
+
+    async def _atranscribe(self, audio_file, on_segment=None) -> str:
+        """
+        Files up to AUDIO_SPLIT_MIN_BYTES go to Whisper in one request. Larger ones
+        are decoded, split on silence into overlapping segments (audio.py),
+        transcribed AUDIO_CONCURRENCY at a time and stitched back together.
+        on_segment(index, total, text), if given, is awaited as each segment finishes.
+        """
+        name = getattr(audio_file, "name", None) or "audio.wav"
+        # Reading a disk-spooled recording (and splitting it) blocks: keep it off the event loop
+        read = audio_file.read_bytes if isinstance(audio_file, SpooledUpload) else audio_file.read
+        data = await asyncio.to_thread(read)
+        pcm = await asyncio.to_thread(decode_pcm, data) if len(data) > AUDIO_SPLIT_MIN_BYTES else None
+        if pcm is None:
+            text = await self._awhisper(name, data)
+            if on_segment: await on_segment(0, 1, text)
+            return text
+        del data
+
+        ranges = await asyncio.to_thread(split_on_silence, pcm)
+        print(f"   [Tool] ✂️  Long recording: {len(pcm) / SAMPLE_RATE / 60:.1f} min -> {len(ranges)} segments")
+        limit = asyncio.Semaphore(AUDIO_CONCURRENCY)
+
+        async def one(i, start, end):
+            async with limit:
+                wav = await asyncio.to_thread(to_wav, pcm[start:end])
+                text = await self._awhisper(f"segment_{i}.wav", wav)
+            if on_segment: await on_segment(i, len(ranges), text)
+            return text
+
+        tasks = [asyncio.ensure_future(one(i, a, b)) for i, (a, b) in enumerate(ranges)]
+        try:
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks: task.cancel()
+            raise
+        return stitch(texts)
+
+    async def _awhisper(self, name: str, data: bytes) -> str:
+        return await self.scheduler.run("whisper-large-v3", lambda: self.client.audio.transcriptions.create(
+            file=(name, data), 
+            model="whisper-large-v3", 
+            response_format="text"
+        ))
+
     # --- 2. VISION (NEW) ---
     # ... inside ToolRegistry class in tools.py ...
 
-    def analyze_image(self, base64_string: str) -> str:
+    async def aanalyze_image(self, image: Union[str, bytes]) -> str:
         """
         Uses Llama 4 Scout (Vision) to transcribe text/objects from an image.
+        `image` is the raw file bytes or a base64 string. It is preprocessed first
+        (imaging.prepare_image); tiles of a tall scan are read concurrently and
+        their text concatenated.
         """
         print("   [Tool] 👁️  Analyzing Image with Llama 4 Scout...")
         
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Describe this image in detail. If there is text, extract it all. If it is a scene or object, describe what it is."},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_string}",
-                                },
-                            },
-                        ],
-                    }
-                ],
-                model="meta-llama/llama-4-scout-17b-16e-instruct", 
-                temperature=0,
-            )
-            return chat_completion.choices[0].message.content
+            data = base64.b64decode(image) if isinstance(image, str) else image
+            tiles, stats = await asyncio.to_thread(prepare_image, data)
+            del data
+            start = time.perf_counter()
+            texts = await asyncio.gather(*(self._avision(b64, mime) for b64, mime in tiles))
+            elapsed = time.perf_counter() - start
+            image_stats.record_vision(elapsed)
+            print(f"   [IMG] 👁️  Vision: {stats['tiles']} tile(s) in {elapsed:.2f}s, {stats['bytes_saved'] / 1024:.0f} KB saved")
+            return join_tile_texts(texts)
+        except API_ERRORS:
+            raise
         except Exception as e:
             return f"Vision Error: {e}"
 
+    async def _avision(self, base64_string: str, mime: str) -> str:
+        model = "meta-llama/llama-4-scout-17b-16e-instruct"
+        start = time.perf_counter()
+        chat_completion = await self.scheduler.run(model, lambda: self.client.chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Describe this image in detail. If there is text, extract it all. If it is a scene or object, describe what it is."},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime};base64,{base64_string}",
+                            },
+                        },
+                    ],
+                }
+            ],
+            model=model, 
+            temperature=0,
+        ), tokens=IMAGE_TOKENS + LLM_COMPLETION_TOKENS_ESTIMATE)
+        usage_log.record("analyze_image", *usage_of(chat_completion), time.perf_counter() - start, model=model)
+        return chat_completion.choices[0].message.content
+
     # --- 3. CLASSIFICATION ---
-    def classify_document(self, content: str) -> str:
+    async def aclassify_document(self, content: str) -> str:
         if "[METADATA: AUDIO_NOTE]" in content: return "AUDIO_NOTE"
         
         # NEW: Check for Image Tag
-        if "[METADATA: IMAGE_Base64_START]" in content: return "IMAGE_NEEDS_OCR"
+        if is_image_content(content): return "IMAGE_NEEDS_OCR"
+
+        # Local model first; only unconfident (or untrained) cases reach the LLM.
+        # Featurizing and scoring (and a model reload) are CPU/disk work: off the event loop
+        guess = None
+        if self.classifier is not None:
+            label, guess = await asyncio.to_thread(self.classifier.classify, content)
+            if label: return label
 
+        text = await afit_to_budget(content, "classify_document")
         prompt = f"""
         Classify into EXACTLY one category:
         1. INVOICE
@@ -71,42 +258,45 @@ class ToolRegistry:
         5. LEGAL_DOC (Contracts, NDAs, Wills, Deeds, Agreements)
         6. OTHER
         
-        Text: {content[:1000]}
+        Text: {text}
         
         Respond ONLY with the category name.
         """
-        raw = self._call_groq(prompt).strip().upper()
-        
-        if "INVOICE" in raw: return "INVOICE"
-        if "RESUME" in raw: return "RESUME"
-        if "RESEARCH" in raw: return "RESEARCH_PAPER"
-        if "AUDIO" in raw: return "AUDIO_NOTE"
-        
-        if "LEGAL" in raw or "NDA" in raw or "AGREEMENT" in raw or "CONTRACT" in raw:
-            return "LEGAL_DOC"
-        
-        return "OTHER"
+        raw = (await self._acall_groq(prompt, tool="classify_document", validate=_is_label)).strip().upper()
+        label = _label_from(raw)
+        if guess is not None: self.classifier.record_fallback(guess, label)
+        return label
 
     # --- 4. EXTRACTION TOOLS ---
-    def extract_invoice(self, content: str) -> Dict:
+    # Content longer than one window is split (chunking.split_text), every chunk is
+    # extracted concurrently, and the partial results are merged per document type.
+    async def aextract_invoice(self, content: str) -> Dict:
+        if len(content) <= CHUNK_CHARS:
+            return _fill_subtotal(await self._ainvoice_part(content))
+        parts = await self._amap_chunks(content, self._ainvoice_part)
+        return _fill_subtotal(chunking.merge_invoice(parts))
+
+    async def _ainvoice_part(self, content: str, part_note: str = "") -> Dict:
+        text = await afit_to_budget(content, "extract_invoice")
         prompt = f"""
-        Extract invoice data as JSON. 
+        Extract invoice data as JSON. {part_note}
         Fields: 'vendor', 'date', 'line_items' (list), 'subtotal', 'tax', 'total_amount'.
         If subtotal is missing, calculate it from line items.
-        Text: {content[:3000]}
+        Text: {text}
         """
-        data = self._call_groq_json(prompt)
-        try:
-            items = data.get('line_items', [])
-            calc_sub = sum([float(str(i.get('total',0)).replace(',','').replace('$','')) for i in items if i.get('total')])
-            if calc_sub > 0 and (data.get('subtotal') == 0 or data.get('subtotal') is None):
-                data['subtotal'] = calc_sub
-        except: pass
-        return data
+        return await self._acall_groq_json(prompt, tool="extract_invoice", validate=has_fields("INVOICE"))
     
-    def extract_legal_doc(self, content: str) -> Dict:
+    async def aextract_legal_doc(self, content: str) -> Dict:
+        if len(content) <= CHUNK_CHARS:
+            return await self._alegal_part(content)
+        parts = await self._amap_chunks(content, self._alegal_part)
+        summary = await self._areduce_summaries(chunking.summaries(parts), "a 2-sentence summary of the whole legal document")
+        return chunking.merge_legal_doc(parts, summary)
+
+    async def _alegal_part(self, content: str, part_note: str = "") -> Dict:
+        text = await afit_to_budget(content, "extract_legal_doc")
         prompt = f"""
-        Analyze this legal document.
+        Analyze this legal document. {part_note}
         Return JSON with:
         - 'document_type': Specific type (e.g., "Mutual NDA", "Employment Contract").
         - 'parties': List of names/companies (e.g., ["TechFlow Solutions", "Global Data Systems"]).
@@ -115,35 +305,133 @@ class ToolRegistry:
         - 'key_clauses': List of 3-5 distinct terms (e.g., "Confidentiality lasts 5 years").
         - 'summary': A 2-sentence summary.
         
-        Text: {content[:3000]}
+        Text: {text}
         """
-        return self._call_groq_json(prompt)
+        return await self._acall_groq_json(prompt, tool="extract_legal_doc", validate=has_fields("LEGAL_DOC"))
     
-    def score_resume(self, content: str) -> Dict:
-        return self._call_groq_json(f"Score resume 0-100. Return JSON with 'score', 'skills', 'name'.\n{content[:2000]}")
+    async def ascore_resume(self, content: str) -> Dict:
+        # Scoring is a judgement over the whole resume, so it stays one call
+        text = await afit_to_budget(content, "score_resume")
+        return await self._acall_groq_json(
+            f"Score resume 0-100. Return JSON with 'score', 'skills', 'name'.\n{text}",
+            tool="score_resume", validate=has_fields("RESUME")
+        )
+
+    async def asummarize_unknown(self, content: str) -> Dict:
+        if len(content) <= CHUNK_CHARS:
+            return await self._aunknown_part(content)
+        parts = await self._amap_chunks(content, self._aunknown_part)
+        summary = await self._areduce_summaries(chunking.summaries(parts), "a 2-sentence summary of the whole document")
+        return chunking.merge_unknown(parts, summary)
+
+    async def _aunknown_part(self, content: str, part_note: str = "") -> Dict:
+        text = await afit_to_budget(content, "summarize_unknown")
+        return await self._acall_groq_json(
+            f"Return JSON with 'summary' (2 sentences) and 'keywords' (list). {part_note}\n{text}",
+            tool="summarize_unknown", validate=has_fields("OTHER")
+        )
+
+    async def asummarize_research_paper(self, content: str) -> Dict:
+        if len(content) <= CHUNK_CHARS:
+            return await self._aresearch_part(content)
+        parts = await self._amap_chunks(content, self._aresearch_part)
+        summary = await self._areduce_summaries(chunking.summaries(parts), "a 6-7 line summary of the whole paper")
+        return chunking.merge_research_paper(parts, summary)
 
-    def summarize_unknown(self, content: str) -> Dict:
-        return self._call_groq_json(f"Return JSON with 'summary' (2 sentences) and 'keywords' (list).\n{content[:2000]}")
+    async def _aresearch_part(self, content: str, part_note: str = "") -> Dict:
+        text = await afit_to_budget(content, "summarize_research_paper")
+        prompt = f"Analyze this paper. Return JSON with: 'title', 'summary' (6-7 lines). {part_note}\nText: {text}"
+        return await self._acall_groq_json(prompt, tool="summarize_research_paper", validate=has_fields("RESEARCH_PAPER"))
 
-    def summarize_research_paper(self, content: str) -> Dict:
-        prompt = f"Analyze this paper. Return JSON with: 'title', 'summary' (6-7 lines).\nText: {content[:3000]}"
-        return self._call_groq_json(prompt)
+    async def asummarize_audio_note(self, content: str) -> Dict:
+        if len(content) <= CHUNK_CHARS:
+            return _attach_transcript(await self._aaudio_part(content), content)
+        parts = await self._amap_chunks(content, self._aaudio_part)
+        summary = await self._areduce_summaries(chunking.summaries(parts), "a concise paragraph summarizing the whole transcript")
+        return _attach_transcript(chunking.merge_audio_note(parts, summary), content)
 
-    def summarize_audio_note(self, content: str) -> Dict:
+    async def _aaudio_part(self, content: str, part_note: str = "") -> Dict:
+        text = await afit_to_budget(content, "summarize_audio_note")
         prompt = f"""
-        Analyze this audio transcript.
+        Analyze this audio transcript. {part_note}
         Return JSON with:
         - 'summary': A concise paragraph.
         - 'sentiment': (Positive, Neutral, Negative).
         
-        Text: {content[:3000]}
+        Text: {text}
         """
-        data = self._call_groq_json(prompt)
-        clean_content = content.replace("[METADATA: AUDIO_NOTE]", "").strip()
-        data['transcript'] = clean_content 
-        return data
+        return await self._acall_groq_json(prompt, tool="summarize_audio_note", validate=has_fields("AUDIO_NOTE"))
 
-    def query_database(self, query: str) -> Dict:
+    async def _amap_chunks(self, content: str, extract_part) -> List[Dict]:
+        chunks = chunking.split_text(content)
+        print(f"   [Tool] ✂️  Long document: {len(content)} chars -> {len(chunks)} chunks")
+        notes = [
+            f"(This is part {i + 1} of {len(chunks)} of a longer document. Only report what appears in this part; use null for anything missing.)"
+            for i in range(len(chunks))
+        ]
+        parts = await asyncio.gather(*(extract_part(c, n) for c, n in zip(chunks, notes)))
+        return [p for p in parts if isinstance(p, dict)]
+
+    async def _areduce_summaries(self, summaries: List[str], target: str) -> str:
+        if not summaries: return ""
+        if len(summaries) == 1: return summaries[0]
+        joined = "\n".join(f"- {s}" for s in summaries)
+        data = await self._acall_groq_json(
+            f"These are summaries of consecutive parts of one document. Return JSON with 'summary': {target}.\n{joined}",
+            tool="reduce_summaries", validate=lambda d: isinstance(d, dict) and bool(d.get("summary"))
+        )
+        return data.get("summary") or " ".join(summaries)
+
+    # --- 5. FUSED CLASSIFY + EXTRACT ---
+    async def aclassify_and_extract(self, content: str) -> Optional[Tuple[str, Dict]]:
+        """
+        One completion that returns both the category and its type-specific payload.
+        Returns (doc_type, data), or None if the output fails schema validation so
+        the caller can fall back to the step-by-step loop.
+        """
+        if is_image_content(content): return None
+        # Long documents need the chunked extractors
+        if len(content) > CHUNK_CHARS: return None
+
+        text = await afit_to_budget(content, "classify_and_extract")
+        prompt = f"""
+        Classify this document into EXACTLY one category and extract its data in the same step.
+        Categories and the 'data' fields each one needs:
+        - INVOICE: 'vendor', 'date', 'line_items' (list of objects with 'description' and 'total'), 'subtotal', 'tax', 'total_amount'. If subtotal is missing, calculate it from line items.
+        - RESUME: 'score' (0-100), 'skills' (list), 'name'.
+        - RESEARCH_PAPER: 'title', 'summary' (6-7 lines).
+        - LEGAL_DOC (Contracts, NDAs, Wills, Deeds, Agreements): 'document_type' (e.g. "Mutual NDA"), 'parties' (list), 'effective_date' (YYYY-MM-DD), 'expiration_date' (YYYY-MM-DD, calculate if a term is given), 'key_clauses' (list of 3-5 terms), 'summary' (2 sentences).
+        - AUDIO_NOTE: 'summary' (a concise paragraph), 'sentiment' (Positive, Neutral, Negative).
+        - OTHER: 'summary' (2 sentences), 'keywords' (list).
+        Use null for values that are not in the text.
+
+        Return JSON: {{"type": "<CATEGORY>", "data": {{...fields for that category...}}}}
+
+        Text: {text}
+        """
+        result = await self._acall_groq_json(prompt, tool="classify_and_extract", validate=_fused_ok)
+        doc_type = str(result.get("type", "")).strip().upper()
+        data = result.get("data")
+        if "[METADATA: AUDIO_NOTE]" in content: doc_type = "AUDIO_NOTE"
+
+        if not validate_payload(doc_type, data):
+            print(f"   [Tool] ⚠️ Fused output failed validation for type '{doc_type}'")
+            return None
+
+        if doc_type == "INVOICE": data = _fill_subtotal(data)
+        if doc_type == "AUDIO_NOTE": data = _attach_transcript(data, content)
+        return doc_type, data
+
+    async def areuse_extraction(self, doc_id: str, content: str) -> Optional[Tuple[str, Dict]]:
+        """(doc_type, payload) of an already-saved near-duplicate, or None if it can't be loaded."""
+        prior = await asyncio.to_thread(self.db.load_extraction, doc_id)
+        if prior is None: return None
+        doc_type, data = prior
+        # Keep this document's own transcript, not the matched one's
+        if doc_type == "AUDIO_NOTE": data = _attach_transcript(data, content)
+        return doc_type, data
+
+    async def aquery_database(self, query: str) -> Dict:
         print(f"   [Tool] ❓ Processing Query: '{query}'")
         schema_context = """
         Tables:
@@ -161,19 +449,19 @@ class ToolRegistry:
             - Use ILIKE for text searches.
             - LIMIT to 10 rows unless specified otherwise.
             """
-            sql_response = self._call_groq(sql_prompt)
+            sql_response = await self._acall_groq(sql_prompt, tool="generate_sql", validate=_is_select)
             sql_query = sql_response.replace("```sql", "").replace("```", "").strip()
             print(f"   [Tool] 🔍 Executing SQL: {sql_query}")
 
             import pandas as pd
-            from sqlalchemy import create_engine, text
-            from config import DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME
+            from sqlalchemy import text
             
-            db_url = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-            engine = create_engine(db_url)
-            
-            with engine.connect() as conn:
-                df = pd.read_sql(text(sql_query), conn)
+            def run_sql():
+                with get_engine().connect() as conn:
+                    return pd.read_sql(text(sql_query), conn)
+
+            # SQLAlchemy/psycopg2 are blocking, keep them off the event loop
+            df = await asyncio.to_thread(run_sql)
             
             if df.empty:
                 nl_answer = "I searched the database, but found no records matching your request."
@@ -187,7 +475,7 @@ class ToolRegistry:
                 Task: Answer the user's question in natural language based on this data. 
                 - Be concise.
                 """
-                nl_answer = self._call_groq(summary_prompt)
+                nl_answer = await self._acall_groq(summary_prompt, tool="answer_query", validate=lambda c: bool(c.strip()))
 
             return {"status": "success", "data": df, "sql": sql_query, "answer": nl_answer}
         except Exception as e:
@@ -198,39 +486,133 @@ class ToolRegistry:
     def save_data(self, doc_id: str, state: Dict):
         doc_type = state.get('type')
         try:
-            self.db.log_process(doc_id, state.get('filename'), doc_type, state.get('file_hash'))
-
-            if "INVOICE" in doc_type: self.db.save_invoice(doc_id, state.get('extracted_data', {}))
-            elif "RESUME" in doc_type: self.db.save_resume(doc_id, state.get('score', {}))
-            elif "RESEARCH" in doc_type: self.db.save_research_paper(doc_id, state.get('research_summary', {}))
-            elif "AUDIO" in doc_type: self.db.save_audio_note(doc_id, state.get('audio_summary', {}))
-            elif "LEGAL" in doc_type: self.db.save_legal_doc(doc_id, state.get('legal_data', {}))
-            elif "OTHER" in doc_type: self.db.save_unknown(doc_id, state.get('summary_data', {}))
-            
-            return "Saved Successfully"
+            # processed_docs row + child row in a single transaction
+            saved = self.db.save_document(
+                doc_id, state.get('filename'), doc_type, state.get('file_hash'), state_payload(state),
+                simhash=state.get('simhash')
+            )
+            return "Saved Successfully" if saved else "Skipped: file already saved"
         except Exception as e:
             return f"DB Error: {e}"
 
+    async def asave_data(self, doc_id: str, state: Dict):
+        # psycopg2 is blocking, so writes run on a worker thread
+        return await asyncio.to_thread(self.save_data, doc_id, state)
+
     # --- HELPERS ---
-    def _call_groq(self, prompt):
-        return self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=MODEL_NAME, temperature=0
-        ).choices[0].message.content
+    def _call_groq(self, prompt): return run_sync(self._acall_groq(prompt))
+    def _call_groq_json(self, prompt): return run_sync(self._acall_groq_json(prompt))
+
+    async def _acall_groq(self, prompt, tool="misc", validate=None):
+        return await self._acomplete([{"role": "user", "content": prompt}], tool=tool, validate=validate)
 
-    def _call_groq_json(self, prompt):
+    async def _acall_groq_json(self, prompt, tool="misc", validate=None):
+        """
+        Parsed JSON reply, or {} if the model's output isn't valid JSON. `validate`,
+        if given, is checked against the parsed reply (see _acomplete for what a
+        failure does). API failures (after the scheduler's retries) raise, so the
+        document is marked failed instead of being saved empty.
+        """
         system_prompt = "You are an API that outputs strictly valid JSON. Do not output markdown blocks or comments."
+        content = await self._acomplete(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            tool=tool,
+            validate=lambda c: (data := _parse_json(c)) is not None and (validate is None or validate(data))
+        )
         try:
-            completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                model=MODEL_NAME, temperature=0 
-            )
-            content = completion.choices[0].message.content
-            content = content.replace("```json", "").replace("```", "").strip()
-            return json.loads(content)
-        except Exception as e:
+            return json.loads(_strip_fences(content))
+        except (AttributeError, ValueError) as e:
             print(f"JSON Parsing Error: {e}")
-            return {}
\ No newline at end of file
+            return {}
+
+    async def _acomplete(self, messages, tool="misc", model=None, temperature=0, validate=None) -> str:
+        """
+        Single choke point for text completions. The model comes from the routing
+        table (routing.py) unless given. Deterministic (temperature 0) calls are
+        served from the LLM cache when possible; only outputs that pass `validate`
+        are stored, so a malformed reply isn't replayed forever. A reply that fails
+        `validate` is asked again of the large model when the router escalates; a
+        valid escalated reply is cached under both models' keys.
+        Token counts and latency are logged per tool (prompts.usage_log). Calls wait
+        for the model's rate budget and are retried by the scheduler (scheduler.py).
+        """
+        model = model or router.model_for(tool)
+        key = None
+        if self.cache is not None and temperature == 0:
+            key = self.cache.make_key(model, temperature, messages)
+            # SQLite I/O stays off the event loop (every ingest shares it)
+            hit = await asyncio.to_thread(self.cache.get, key, sum(len(m["content"].encode()) for m in messages))
+            if hit is not None:
+                usage_log.record(tool, 0, 0, 0.0, cached=True, model=model)
+                return hit
+
+        start = time.perf_counter()
+        completion = await self.scheduler.run(
+            model,
+            lambda: self.client.chat.completions.create(messages=messages, model=model, temperature=temperature),
+            tokens=sum(count_tokens(m["content"]) for m in messages) + LLM_COMPLETION_TOKENS_ESTIMATE
+        )
+        content = completion.choices[0].message.content
+        prompt_tokens, completion_tokens = usage_of(completion)
+        if not prompt_tokens:
+            prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+            completion_tokens = count_tokens(content)
+        usage_log.record(tool, prompt_tokens, completion_tokens, time.perf_counter() - start, model=model)
+
+        valid = validate is None or validate(content)
+        if not valid:
+            larger = router.escalation_for(tool, model)
+            if larger:
+                # A valid escalated reply is also cached under this model's key, so the
+                # next identical prompt doesn't pay for the failing small call again
+                content = await self._acomplete(messages, tool, larger, temperature, validate)
+                valid = validate(content)
+        if key is not None and valid:
+            await asyncio.to_thread(self.cache.put, key, content)
+        return content
+
+def _fill_subtotal(data: Dict) -> Dict:
+    try:
+        items = data.get('line_items', [])
+        calc_sub = sum([float(str(i.get('total',0)).replace(',','').replace('$','')) for i in items if i.get('total')])
+        if calc_sub > 0 and (data.get('subtotal') == 0 or data.get('subtotal') is None):
+            data['subtotal'] = calc_sub
+    except: pass
+    return data
+
+def _attach_transcript(data: Dict, content: str) -> Dict:
+    clean_content = content.replace("[METADATA: AUDIO_NOTE]", "").strip()
+    data['transcript'] = clean_content 
+    return data
+
+def _label_from(raw: str) -> str:
+    if "INVOICE" in raw: return "INVOICE"
+    if "RESUME" in raw: return "RESUME"
+    if "RESEARCH" in raw: return "RESEARCH_PAPER"
+    if "AUDIO" in raw: return "AUDIO_NOTE"
+    
+    if "LEGAL" in raw or "NDA" in raw or "AGREEMENT" in raw or "CONTRACT" in raw:
+        return "LEGAL_DOC"
+    
+    return "OTHER"
+
+def _is_label(raw: str) -> bool:
+    raw = (raw or "").upper()
+    return _label_from(raw) != "OTHER" or "OTHER" in raw
+
+def _is_select(raw: str) -> bool:
+    return re.match(r"\s*(SELECT|WITH)\b", (raw or "").replace("```sql", "").replace("```", ""), re.IGNORECASE) is not None
+
+def _fused_ok(result) -> bool:
+    if not isinstance(result, dict): return False
+    return validate_payload(str(result.get("type", "")).strip().upper(), result.get("data"))
+
+def _strip_fences(content: str) -> str:
+    return content.replace("```json", "").replace("```", "").strip()
+
+def _parse_json(content: str):
+    try: return json.loads(_strip_fences(content))
+    except Exception: return None
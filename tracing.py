@@ -0,0 +1,176 @@
+# tracing.py
+import contextvars
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from config import TRACE_JSONL_PATH, METRICS_HOST, METRICS_PORT
+
+# Upper bounds (seconds) of the step latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Span fields summed into counters (set by prompts.usage_log and the scheduler)
+_COUNTERS = ("llm_calls", "prompt_tokens", "completion_tokens", "cache_hits", "retries", "queue_wait_s")
+
+# Spans of the document being ingested, and the innermost open span
+_doc_spans = contextvars.ContextVar("doc_spans", default=None)
+_current = contextvars.ContextVar("current_span", default=None)
+
+class Tracer:
+    """
+    Structured spans for the agent loop: one per document, brain decision, tool
+    call and DB operation, with wall time plus the LLM tokens, cache hits, retries
+    and rate-limit waits that happened inside it. A document's spans are returned
+    in its state (`spans`), appended to TRACE_JSONL_PATH, and folded into
+    per-step latency histograms for render_prometheus().
+    """
+    def __init__(self, jsonl_path: str = TRACE_JSONL_PATH):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.steps: Dict[Tuple[str, str], Dict] = {}
+        self.documents: Dict[str, int] = {}
+
+    @contextmanager
+    def span(self, kind: str, name: str, **attrs):
+        parent = _current.get()
+        with self._lock: span_id = next(self._ids)
+        record = {"id": span_id, "parent": parent["id"] if parent else None, "kind": kind, "name": name,
+                  "start": time.time(), "duration_s": 0.0, **{k: 0 for k in _COUNTERS}, **attrs}
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["duration_s"] = time.perf_counter() - start
+            _current.reset(token)
+            spans = _doc_spans.get()
+            if spans is not None: spans.append(record)
+            self._observe(record)
+
+    def add(self, **counts):
+        """Adds to the counters of the innermost open span (no-op outside one)."""
+        record = _current.get()
+        if record is None: return
+        for k, v in counts.items(): record[k] = record.get(k, 0) + v
+
+    def start_document(self):
+        return _doc_spans.set([])
+
+    def finish_document(self, token, status: Optional[str] = None) -> List[Dict]:
+        """Closes the document's span list and returns it (spans in finish order)."""
+        spans = _doc_spans.get() or []
+        _doc_spans.reset(token)
+        with self._lock:
+            key = status or "unknown"
+            self.documents[key] = self.documents.get(key, 0) + 1
+        return spans
+
+    def export_jsonl(self, spans: List[Dict], path: Optional[str] = None, **fields):
+        """Appends one line per span to path (default TRACE_JSONL_PATH); fields are repeated on each."""
+        path = path or self.jsonl_path
+        if not path or not spans: return
+        lines = "".join(json.dumps({**fields, **s}, default=str) + "\n" for s in spans)
+        with self._lock, open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition: step histograms, LLM counters, documents, scheduler gauges."""
+        out = [
+            "# HELP agent_step_seconds Wall time of agent steps (document, brain, tool, db).",
+            "# TYPE agent_step_seconds histogram",
+        ]
+        with self._lock:
+            steps = {k: {**v, "buckets": list(v["buckets"])} for k, v in self.steps.items()}
+            documents = dict(self.documents)
+        for (kind, name), s in sorted(steps.items()):
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            for bound, n in zip(LATENCY_BUCKETS, s["buckets"]):
+                out.append(f'agent_step_seconds_bucket{{{labels},le="{bound}"}} {n}')
+            out.append(f'agent_step_seconds_bucket{{{labels},le="+Inf"}} {s["count"]}')
+            out.append(f"agent_step_seconds_sum{{{labels}}} {s['sum']:.6f}")
+            out.append(f"agent_step_seconds_count{{{labels}}} {s['count']}")
+        for counter, help_text in (
+            ("errors", "Steps that raised."),
+            ("llm_calls", "Groq calls made (cache misses)."),
+            ("prompt_tokens", "Prompt tokens sent."),
+            ("completion_tokens", "Completion tokens received."),
+            ("cache_hits", "Completions served from the LLM cache."),
+            ("retries", "Groq calls retried after 429/transient errors."),
+            ("queue_wait_s", "Seconds spent waiting for rate-limit budget."),
+        ):
+            metric = f"agent_step_{counter}_total"
+            out += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (kind, name), s in sorted(steps.items()):
+                out.append(f'{metric}{{kind="{kind}",name="{_escape(name)}"}} {s[counter]:g}')
+        out += ["# HELP agent_documents_total Ingested documents by final status.", "# TYPE agent_documents_total counter"]
+        for status, n in sorted(documents.items()):
+            out.append(f'agent_documents_total{{status="{_escape(status)}"}} {n}')
+
+        from scheduler import get_scheduler
+        sched = get_scheduler().stats()
+        out += ["# HELP agent_llm_queue_depth Groq requests waiting for rate-limit budget.", "# TYPE agent_llm_queue_depth gauge"]
+        for priority, n in sched["queue_depth"].items():
+            out.append(f'agent_llm_queue_depth{{priority="{priority}"}} {n}')
+        out += ["# HELP agent_llm_in_flight Groq requests in flight.", "# TYPE agent_llm_in_flight gauge",
+                f"agent_llm_in_flight {sched['in_flight']}"]
+        return "\n".join(out) + "\n"
+
+    def _observe(self, record: Dict):
+        with self._lock:
+            s = self.steps.get((record["kind"], record["name"]))
+            if s is None:
+                s = self.steps[(record["kind"], record["name"])] = {
+                    "buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0, "errors": 0,
+                    **{k: 0 for k in _COUNTERS},
+                }
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if record["duration_s"] <= bound: s["buckets"][i] += 1
+            s["sum"] += record["duration_s"]
+            s["count"] += 1
+            s["errors"] += int("error" in record)
+            for k in _COUNTERS: s[k] += record.get(k, 0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+tracer = Tracer()
+
+# --- METRICS ENDPOINT ---
+_server = None
+_server_lock = threading.Lock()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scrapes every few seconds would flood stdout
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Serves /metrics on a daemon thread (once per process). port 0 = disabled."""
+    global _server
+    if not port: return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"⚠️ Metrics endpoint not started on {host}:{port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"   [METRICS] 📈 Serving http://{host}:{port}/metrics")
+    return _server
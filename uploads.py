@@ -0,0 +1,151 @@
+# uploads.py
+import base64
+import codecs
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO, Iterator, List, Optional
+from config import UPLOAD_SPOOL_MAX_BYTES, UPLOAD_CHUNK_BYTES, UPLOAD_TEXT_CHAR_BUDGET, CHUNK_CHARS
+
+# Content placeholder for images travelling as an upload instead of inline base64
+IMAGE_UPLOAD_MARKER = "[METADATA: IMAGE_UPLOAD]"
+# How images were inlined (and hashed) before uploads were spooled
+IMAGE_BASE64_START = "[METADATA: IMAGE_Base64_START]"
+IMAGE_BASE64_END = "[METADATA: IMAGE_Base64_END]"
+
+def legacy_hash(text: str) -> str:
+    """The file_hash documents got when the agent hashed their content string."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class SpooledUpload:
+    """
+    An uploaded file held in a SpooledTemporaryFile (memory up to
+    UPLOAD_SPOOL_MAX_BYTES, disk beyond), hashed while it is copied in, in
+    UPLOAD_CHUNK_BYTES pieces. Nothing ever holds the whole file as one bytes/str:
+    the agent hashes via .sha256, reads text via prompt_text() and reads images
+    via read_bytes() only when the vision step runs.
+    """
+    def __init__(self, name: str, mime: Optional[str] = None):
+        self.name = name
+        self.mime = mime or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.size = 0
+        self.sha256 = None
+        self._file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
+        self._lock = threading.Lock()  # one reader at a time (shared file position)
+
+    @classmethod
+    def from_file(cls, source: BinaryIO, name: str, mime: Optional[str] = None) -> "SpooledUpload":
+        upload = cls(name, mime)
+        digest = hashlib.sha256()
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_BYTES)
+            if not chunk: break
+            digest.update(chunk)
+            upload._file.write(chunk)
+            upload.size += len(chunk)
+        upload.sha256 = digest.hexdigest()
+        upload._file.seek(0)
+        return upload
+
+    @classmethod
+    def from_path(cls, path: str, mime: Optional[str] = None) -> "SpooledUpload":
+        with open(path, "rb") as f:
+            return cls.from_file(f, os.path.basename(path), mime)
+
+    @property
+    def kind(self) -> str:
+        if self.mime.startswith("image/"): return "image"
+        if self.mime.startswith("audio/"): return "audio"
+        if self.mime == "application/pdf" or self.name.lower().endswith(".pdf"): return "pdf"
+        return "text"
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        with self._lock:
+            self._file.seek(0)
+            while True:
+                chunk = self._file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk: break
+                yield chunk
+
+    def copy_to(self, dest: BinaryIO):
+        with self._lock:
+            self._file.seek(0)
+            shutil.copyfileobj(self._file, dest, UPLOAD_CHUNK_BYTES)
+
+    def prompt_text(self, char_budget: int = UPLOAD_TEXT_CHAR_BUDGET) -> str:
+        """
+        The text the agent works on. Images return IMAGE_UPLOAD_MARKER, PDFs go
+        through pdf_text (page-bounded), plain text is decoded incrementally up to
+        char_budget characters plus the final CHUNK_CHARS (what chunking keeps).
+        """
+        if self.kind == "image": return IMAGE_UPLOAD_MARKER
+        if self.kind == "audio": raise ValueError("Audio uploads are transcribed, not read as text")
+        if self.kind == "pdf":
+            from pdf_text import extract_pdf_text
+            with self._lock:
+                self._file.seek(0)
+                return extract_pdf_text(self._file, digest=self.sha256)
+        return self._read_text(char_budget)
+
+    def legacy_hashes(self) -> List[str]:
+        """
+        The file_hash(es) this upload may have had before spooling, when the agent
+        hashed the content string. For a PDF: its full extracted text (as first
+        stored), then the page-bounded prompt text (PDF_CHAR_BUDGET, stored once
+        extraction was bounded) if that differs. For an image: its tagged base64.
+        Empty for plain text (same bytes, same hash) and audio (hashed over its
+        transcript, see legacy_hash).
+        """
+        if self.kind == "pdf":
+            from pdf_text import extract_pdf_text
+            with self._lock:
+                self._file.seek(0)
+                full = extract_pdf_text(self._file, char_budget=0, digest=self.sha256)
+            # Pages are cached by digest, so the bounded read costs no second extraction
+            return list(dict.fromkeys([legacy_hash(full), legacy_hash(self.prompt_text())]))
+        if self.kind != "image": return []
+        digest = hashlib.sha256(IMAGE_BASE64_START.encode())
+        # Base64 of whole 3-byte groups concatenates to the base64 of the whole file
+        step = max(3, UPLOAD_CHUNK_BYTES // 3 * 3)
+        with self._lock:
+            self._file.seek(0)
+            while True:
+                chunk = self._file.read(step)
+                if not chunk: break
+                digest.update(base64.b64encode(chunk))
+        digest.update(IMAGE_BASE64_END.encode())
+        return [digest.hexdigest()]
+
+    def read_bytes(self) -> bytes:
+        # Only for images and audio, which are decoded whole downstream anyway
+        with self._lock:
+            self._file.seek(0)
+            return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+    def _read_text(self, char_budget: int) -> str:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parts, total, consumed = [], 0, 0
+        with self._lock:
+            self._file.seek(0)
+            while not char_budget or total < char_budget:
+                chunk = self._file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk: break
+                consumed += len(chunk)
+                text = decoder.decode(chunk)
+                parts.append(text)
+                total += len(text)
+            else:
+                # Budget reached: skip the middle, keep the tail
+                tail_bytes = CHUNK_CHARS * 4
+                if self.size - consumed > 0:
+                    self._file.seek(max(consumed, self.size - tail_bytes))
+                    tail = self._file.read().decode("utf-8", errors="ignore")
+                    return "".join(parts)[:char_budget] + "\n" + tail[-CHUNK_CHARS:]
+            parts.append(decoder.decode(b"", final=True))
+        return "".join(parts)
@@ -0,0 +1,208 @@
+# worker.py
+"""
+Headless ingestion workers fed by the Postgres `jobs` table.
+
+    python worker.py submit ./inbox "scans/**/*.pdf" --priority 5
+    python worker.py run --concurrency 16
+    python worker.py status
+
+`submit` queues one job per file (a directory is walked, a glob is expanded).
+`run` claims jobs with FOR UPDATE SKIP LOCKED, ingests them with
+AutonomousAgent and records each outcome, so any number of workers on any
+number of machines can share one database. A failed attempt is retried after
+an exponential backoff (JOB_BACKOFF_S, doubling), and a job whose worker dies
+is picked up again once its heartbeat is JOB_STALE_S old (up to JOB_MAX_ATTEMPTS).
+Paths are stored absolute and must be readable by every worker.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Iterable, List, Optional
+from agent import AutonomousAgent
+from async_runner import get_loop, submit as submit_coro
+from database import Database
+from scheduler import request_priority
+from uploads import SpooledUpload
+from config import (
+    WORKER_ID, WORKER_CONCURRENCY, WORKER_THREADS, WORKER_POLL_S, JOB_STALE_S, JOB_MAX_ATTEMPTS,
+    JOB_BACKOFF_S, JOB_BACKOFF_MAX_S,
+)
+
+# Result statuses that end a job; anything raised, "failed" or "incomplete" (the
+# loop stopped before saving) is retried, up to JOB_MAX_ATTEMPTS
+_FINAL = {"saved", "skipped"}
+
+# --- SUBMIT ---
+def expand_paths(patterns: Iterable[str], recursive: bool = True) -> List[str]:
+    """Absolute file paths for each directory (walked), glob or file in patterns, deduplicated."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                found = [os.path.join(root, f) for root, _, files in os.walk(pattern) for f in files]
+            else:
+                found = [os.path.join(pattern, f) for f in os.listdir(pattern)]
+        else:
+            found = glob.glob(pattern, recursive=True)
+        paths.extend(os.path.abspath(p) for p in sorted(found) if os.path.isfile(p))
+    return list(dict.fromkeys(paths))
+
+def submit(patterns: Iterable[str], priority: int = 0, recursive: bool = True, db: Optional[Database] = None) -> int:
+    """Queues every file matched by patterns. Returns how many jobs were added."""
+    paths = expand_paths(patterns, recursive)
+    db = db or Database()
+    queued = db.submit_jobs(paths, priority)
+    print(f"   [JOBS] 📥 Queued {queued} job(s) ({len(paths) - queued} already pending/running)")
+    return queued
+
+def backoff_s(attempts: int) -> float:
+    """Delay before retrying a job that has failed `attempts` times."""
+    return min(JOB_BACKOFF_MAX_S, JOB_BACKOFF_S * 2 ** max(0, attempts - 1))
+
+# --- WORKER ---
+class Worker:
+    """
+    Keeps up to `concurrency` documents in flight on the shared event loop,
+    claiming more jobs as slots free up. Blocking work (DB round-trips, PDF
+    parsing, spooling files) runs on the loop's default executor, sized by
+    `threads` (0 = asyncio's default).
+    """
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY, threads: int = WORKER_THREADS,
+                 poll_s: float = WORKER_POLL_S, worker_id: str = WORKER_ID, agent: Optional[AutonomousAgent] = None):
+        self.concurrency = max(1, concurrency)
+        self.threads = threads
+        self.poll_s = poll_s
+        self.worker_id = worker_id
+        self.agent = agent or AutonomousAgent(pacing="batch", claims=True)
+        self.db = self.agent.db
+        self.stop = threading.Event()
+        self.counts: Dict[str, int] = {}
+        self._running: Dict[int, asyncio.Task] = {}
+
+    def run(self, drain: bool = False) -> Dict[str, int]:
+        """Processes jobs until stopped (SIGINT/SIGTERM), or until the queue is empty with drain."""
+        if self.threads:
+            get_loop().set_default_executor(ThreadPoolExecutor(self.threads, thread_name_prefix="worker-io"))
+        future = submit_coro(self.arun(drain))
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeout:
+                continue
+            except KeyboardInterrupt:
+                if self.stop.is_set(): raise
+                # Finish what's claimed; a second Ctrl-C abandons it (reclaimed once stale)
+                print(f"\n   [JOBS] 🛑 Stopping: waiting for {len(self._running)} running job(s)...")
+                self.stop.set()
+
+    async def arun(self, drain: bool = False) -> Dict[str, int]:
+        print(f"   [JOBS] 👷 Worker {self.worker_id} started (concurrency {self.concurrency})")
+        # Every Groq call made for a job queues behind interactive requests
+        request_priority.set("bulk")
+        await self.agent.awarm_up()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while not self.stop.is_set():
+                free = self.concurrency - len(self._running)
+                claimed = []
+                if free > 0:
+                    claimed = await asyncio.to_thread(
+                        self.db.claim_jobs, self.worker_id, free, JOB_STALE_S, JOB_MAX_ATTEMPTS
+                    )
+                for job_id, path, attempts in claimed:
+                    self._running[job_id] = asyncio.create_task(self._process(job_id, path, attempts))
+                if not self._running:
+                    # Jobs backing off before a retry still count as queued
+                    if drain and not (await asyncio.to_thread(self.db.job_counts)).get("pending"): break
+                    await asyncio.sleep(self.poll_s)
+                elif not claimed:
+                    # Full, or nothing new: wait for a slot (or the next poll)
+                    await asyncio.wait(list(self._running.values()), timeout=self.poll_s,
+                                       return_when=asyncio.FIRST_COMPLETED)
+            if self._running:
+                await asyncio.wait(list(self._running.values()))
+        finally:
+            heartbeat.cancel()
+        print(f"   [JOBS] ✅ Worker {self.worker_id} stopped: {self.counts}")
+        return dict(self.counts)
+
+    async def _process(self, job_id: int, path: str, attempts: int):
+        try:
+            await self._process_job(job_id, path, attempts)
+        finally:
+            # Only now: drain mode exits once nothing is left in _running
+            self._running.pop(job_id, None)
+
+    async def _process_job(self, job_id: int, path: str, attempts: int):
+        start = time.perf_counter()
+        outcome = {"status": "failed", "result_status": None, "doc_id": None, "doc_type": None, "error": None}
+        upload = None
+        try:
+            upload = await asyncio.to_thread(SpooledUpload.from_path, path)
+            res = await self.agent.aingest(os.path.basename(path), upload)
+            result_status = res.get("status", "incomplete")
+            outcome.update(result_status=result_status, doc_id=res.get("id"), doc_type=res.get("type"),
+                           error=res.get("error") or res.get("reason"))
+            if result_status in _FINAL: outcome["status"] = "done"
+            elif attempts < JOB_MAX_ATTEMPTS: outcome["status"] = "pending"
+        except FileNotFoundError as e:
+            outcome["error"] = str(e)  # retrying won't bring it back
+        except Exception as e:
+            outcome["error"] = f"{type(e).__name__}: {e}"
+            if attempts < JOB_MAX_ATTEMPTS: outcome["status"] = "pending"
+        finally:
+            # Drops the spool (a temp file for large uploads)
+            if upload is not None: upload.close()
+
+        retry_after_s = backoff_s(attempts) if outcome["status"] == "pending" else 0
+        await asyncio.to_thread(self.db.finish_job, job_id, self.worker_id, **outcome, retry_after_s=retry_after_s)
+        key = outcome["result_status"] if outcome["status"] == "done" else outcome["status"]
+        self.counts[key] = self.counts.get(key, 0) + 1
+        icon = {"done": "✅", "pending": "🔁", "failed": "❌"}[outcome["status"]]
+        detail = outcome["result_status"] or outcome["error"]
+        if retry_after_s: detail = f"{detail}; retry in {retry_after_s:.0f}s"
+        print(f"   [JOBS] {icon} #{job_id} {os.path.basename(path)}: {outcome['status']} ({detail}) "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(max(1.0, JOB_STALE_S / 3))
+            try:
+                await asyncio.to_thread(self.db.heartbeat_jobs, self.worker_id, list(self._running))
+            except Exception as e:
+                print(f"⚠️ Job heartbeat failed: {e}")
+
+# --- CLI ---
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Postgres-backed ingestion job queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("submit", help="queue files for ingestion")
+    p.add_argument("patterns", nargs="+", help="files, directories or globs (quote globs)")
+    p.add_argument("--priority", type=int, default=0, help="higher is claimed first")
+    p.add_argument("--no-recursive", action="store_true", help="don't descend into subdirectories")
+    p = commands.add_parser("run", help="claim and process jobs")
+    p.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="documents in flight")
+    p.add_argument("--threads", type=int, default=WORKER_THREADS, help="threads for blocking I/O (0 = asyncio default)")
+    p.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+    commands.add_parser("status", help="job counts by status")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        return submit(args.patterns, args.priority, recursive=not args.no_recursive)
+    if args.command == "status":
+        counts = Database().job_counts()
+        for status in ("pending", "running", "done", "failed"):
+            print(f"{status:>8}: {counts.get(status, 0)}")
+        return counts
+
+    # SIGTERM (docker stop, systemd) stops as gracefully as Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    return Worker(args.concurrency, args.threads).run(drain=args.drain)
+
+if __name__ == "__main__":
+    main()